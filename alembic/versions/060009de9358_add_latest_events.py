@@ -0,0 +1,57 @@
+"""add latest events
+
+Revision ID: 060009de9358
+Revises: c060156b21bc
+Create Date: 2026-10-19 10:02:17.530124
+
+"""
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "060009de9358"
+down_revision = "c060156b21bc"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_events_aoi_id_datetime", "events", ["aoi_id", "datetime"], unique=False
+    )
+    op.create_table(
+        "latest_events",
+        sa.Column("aoi_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "label",
+            postgresql.ENUM(name="EventLabel", create_type=False),
+            nullable=False,
+        ),
+        sa.Column("event_id", sa.Integer(), nullable=True),
+        sa.Column("datetime", sa.Date(), nullable=True),
+        sa.Column("properties", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.ForeignKeyConstraint(["aoi_id"], ["aois.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["event_id"], ["events.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("aoi_id", "label"),
+    )
+
+    # backfill from the existing events
+    op.execute(
+        """
+        INSERT INTO latest_events (aoi_id, label, event_id, datetime, properties)
+        SELECT DISTINCT ON (aoi_id, label) aoi_id, label, id, datetime, properties
+        FROM (
+            SELECT aoi_id, unnest(labels) AS label, id, datetime, properties
+            FROM events
+            WHERE aoi_id IS NOT NULL
+        ) AS labelled
+        ORDER BY aoi_id, label, datetime DESC, id DESC
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("latest_events")
+    op.drop_index("ix_events_aoi_id_datetime", table_name="events")
@@ -0,0 +1,32 @@
+"""add events paging index
+
+Revision ID: 31451b6a28e1
+Revises: 6241c881c4ad
+Create Date: 2026-10-19 14:31:08.275516
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "31451b6a28e1"
+down_revision = "6241c881c4ad"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # get_events pages on (datetime, id) within aoi_id
+    op.create_index(
+        "ix_events_aoi_id_datetime_id",
+        "events",
+        ["aoi_id", "datetime", "id"],
+        unique=False,
+    )
+    op.drop_index("ix_events_aoi_id_datetime", table_name="events")
+
+
+def downgrade() -> None:
+    op.create_index(
+        "ix_events_aoi_id_datetime", "events", ["aoi_id", "datetime"], unique=False
+    )
+    op.drop_index("ix_events_aoi_id_datetime_id", table_name="events")
@@ -0,0 +1,96 @@
+"""add change tracking
+
+Revision ID: 35571d51060c
+Revises: 31451b6a28e1
+Create Date: 2026-10-19 15:47:22.019385
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "35571d51060c"
+down_revision = "31451b6a28e1"
+branch_labels = None
+depends_on = None
+
+TABLES = ["aois", "events", "assets"]
+
+# updated_at is bumped by the database, so raw UPDATEs reach /changes/ too
+SET_UPDATED_AT = """
+    CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+    BEGIN
+        NEW.updated_at = now();
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.add_column(
+            table,
+            sa.Column(
+                "created_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.text("now()"),
+                nullable=True,
+            ),
+        )
+        op.add_column(
+            table,
+            sa.Column(
+                "updated_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.text("now()"),
+                nullable=True,
+            ),
+        )
+        op.create_index(
+            op.f(f"ix_{table}_updated_at"), table, ["updated_at"], unique=False
+        )
+
+    op.execute(SET_UPDATED_AT)
+    for table in TABLES:
+        op.execute(
+            f"CREATE TRIGGER {table}_set_updated_at BEFORE UPDATE ON {table} "
+            "FOR EACH ROW EXECUTE FUNCTION set_updated_at()"
+        )
+
+    op.create_table(
+        "tombstones",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("table_name", sa.String(), nullable=True),
+        sa.Column("object_id", sa.Integer(), nullable=True),
+        sa.Column(
+            "deleted_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_tombstones_id"), "tombstones", ["id"], unique=False)
+    op.create_index(
+        "ix_tombstones_table_name_deleted_at",
+        "tombstones",
+        ["table_name", "deleted_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tombstones_table_name_deleted_at", table_name="tombstones")
+    op.drop_index(op.f("ix_tombstones_id"), table_name="tombstones")
+    op.drop_table("tombstones")
+
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER {table}_set_updated_at ON {table}")
+    op.execute("DROP FUNCTION set_updated_at()")
+
+    for table in TABLES:
+        op.drop_index(op.f(f"ix_{table}_updated_at"), table_name=table)
+        op.drop_column(table, "updated_at")
+        op.drop_column(table, "created_at")
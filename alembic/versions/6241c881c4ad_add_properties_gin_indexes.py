@@ -0,0 +1,33 @@
+"""add properties gin indexes
+
+Revision ID: 6241c881c4ad
+Revises: a21373aaf72e
+Create Date: 2026-10-19 13:05:41.662810
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "6241c881c4ad"
+down_revision = "a21373aaf72e"
+branch_labels = None
+depends_on = None
+
+TABLES = ["aois", "events", "assets", "companies"]
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.create_index(
+            f"ix_{table}_properties",
+            table,
+            ["properties"],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_ops={"properties": "jsonb_path_ops"},
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_index(f"ix_{table}_properties", table_name=table)
@@ -0,0 +1,138 @@
+"""partition events by datetime
+
+Events with a NULL datetime can't be partitioned; they are moved to an
+`events_undated` table (created only if there are any) and moved back on
+downgrade.
+
+Revision ID: a21373aaf72e
+Revises: 060009de9358
+Create Date: 2026-10-19 11:20:53.904117
+
+"""
+from datetime import date
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a21373aaf72e"
+down_revision = "060009de9358"
+branch_labels = None
+depends_on = None
+
+INDEXES = """
+    CREATE INDEX ix_events_id ON events (id);
+    CREATE INDEX ix_events_datetime ON events (datetime);
+    CREATE INDEX ix_events_labels ON events (labels);
+    CREATE INDEX ix_events_aoi_id_datetime ON events (aoi_id, datetime);
+"""
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    # the heap table is kept aside until its rows have been copied over
+    op.execute("ALTER TABLE latest_events DROP CONSTRAINT latest_events_event_id_fkey")
+    op.execute("ALTER TABLE events RENAME TO events_heap")
+    op.execute(
+        "ALTER TABLE events_heap RENAME CONSTRAINT events_pkey TO events_heap_pkey"
+    )
+    op.execute("ALTER SEQUENCE events_id_seq OWNED BY NONE")
+    op.execute("DROP INDEX ix_events_id, ix_events_datetime, ix_events_labels")
+    op.execute("DROP INDEX ix_events_aoi_id_datetime")
+
+    op.execute(
+        """
+        CREATE TABLE events (
+            id integer NOT NULL DEFAULT nextval('events_id_seq'),
+            labels "EventLabel"[],
+            aoi_id integer REFERENCES aois (id),
+            datetime date NOT NULL,
+            properties jsonb,
+            PRIMARY KEY (id, datetime)
+        ) PARTITION BY RANGE (datetime)
+        """
+    )
+    op.execute("ALTER SEQUENCE events_id_seq OWNED BY events.id")
+    op.execute("CREATE TABLE events_default PARTITION OF events DEFAULT")
+
+    # yearly partitions covering the existing data and the coming year, later
+    # ones are created by bin/create_event_partitions.py
+    first, last = bind.execute(
+        sa.text("SELECT min(datetime), max(datetime) FROM events_heap")
+    ).first()
+    first_year = first.year if first is not None else date.today().year
+    last_year = max(last.year if last is not None else 0, date.today().year) + 1
+    for year in range(first_year, last_year + 1):
+        op.execute(
+            f"CREATE TABLE events_y{year} PARTITION OF events "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+        )
+
+    op.execute(INDEXES)
+
+    # datetime is part of the partitioned primary key, so undated events can't
+    # be moved over; they are kept in events_undated rather than dropped
+    n_undated = bind.execute(
+        sa.text("SELECT count(*) FROM events_heap WHERE datetime IS NULL")
+    ).scalar()
+    if n_undated:
+        print(f"moving {n_undated} events with no datetime to events_undated")
+        op.execute(
+            "CREATE TABLE events_undated AS "
+            "SELECT * FROM events_heap WHERE datetime IS NULL"
+        )
+
+    op.execute(
+        "INSERT INTO events (id, labels, aoi_id, datetime, properties) "
+        "SELECT id, labels, aoi_id, datetime, properties FROM events_heap "
+        "WHERE datetime IS NOT NULL"
+    )
+    op.execute("DROP TABLE events_heap")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE events RENAME TO events_partitioned")
+    op.execute(
+        "ALTER TABLE events_partitioned "
+        "RENAME CONSTRAINT events_pkey TO events_partitioned_pkey"
+    )
+    op.execute("ALTER SEQUENCE events_id_seq OWNED BY NONE")
+    op.execute(
+        "DROP INDEX ix_events_id, ix_events_datetime, ix_events_labels, "
+        "ix_events_aoi_id_datetime"
+    )
+
+    op.execute(
+        """
+        CREATE TABLE events (
+            id integer PRIMARY KEY DEFAULT nextval('events_id_seq'),
+            labels "EventLabel"[],
+            aoi_id integer REFERENCES aois (id),
+            datetime date,
+            properties jsonb
+        )
+        """
+    )
+    op.execute("ALTER SEQUENCE events_id_seq OWNED BY events.id")
+    op.execute(
+        "INSERT INTO events (id, labels, aoi_id, datetime, properties) "
+        "SELECT id, labels, aoi_id, datetime, properties FROM events_partitioned"
+    )
+    if (
+        op.get_bind()
+        .execute(sa.text("SELECT to_regclass('events_undated') IS NOT NULL"))
+        .scalar()
+    ):
+        op.execute(
+            "INSERT INTO events (id, labels, aoi_id, datetime, properties) "
+            "SELECT id, labels, aoi_id, datetime, properties FROM events_undated"
+        )
+        op.execute("DROP TABLE events_undated")
+    op.execute(INDEXES)
+    op.execute("DROP TABLE events_partitioned CASCADE")
+    op.execute(
+        "ALTER TABLE latest_events ADD CONSTRAINT latest_events_event_id_fkey "
+        "FOREIGN KEY (event_id) REFERENCES events (id) ON DELETE CASCADE"
+    )
@@ -0,0 +1,60 @@
+"""add export jobs
+
+Revision ID: b7e2c4d19a3f
+Revises: fa10dd9a74d5
+Create Date: 2026-10-19 18:02:41.513209
+
+"""
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b7e2c4d19a3f"
+down_revision = "fa10dd9a74d5"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "export_jobs",
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("resource", sa.String(), nullable=True),
+        sa.Column("format", sa.String(), nullable=True),
+        sa.Column("query", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column(
+            "status",
+            postgresql.ENUM(
+                "pending", "running", "done", "failed", name="export_status"
+            ),
+            nullable=True,
+        ),
+        sa.Column("key", sa.String(), nullable=True),
+        sa.Column("n_rows", sa.Integer(), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_export_jobs_user_id"), "export_jobs", ["user_id"], unique=False
+    )
+    op.create_index(
+        op.f("ix_export_jobs_status"), "export_jobs", ["status"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_export_jobs_status"), table_name="export_jobs")
+    op.drop_index(op.f("ix_export_jobs_user_id"), table_name="export_jobs")
+    op.drop_table("export_jobs")
+    op.execute("DROP TYPE export_status")
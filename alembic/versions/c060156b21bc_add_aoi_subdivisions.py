@@ -0,0 +1,69 @@
+"""add aoi subdivisions
+
+Revision ID: c060156b21bc
+Revises: 1888633ebdd1
+Create Date: 2026-10-19 09:12:40.118342
+
+"""
+import geoalchemy2
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c060156b21bc"
+down_revision = "1888633ebdd1"
+branch_labels = None
+depends_on = None
+
+SUBDIVIDE_MAX_VERTICES = 256
+
+
+def upgrade() -> None:
+    op.create_table(
+        "aoi_subdivisions",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("aoi_id", sa.Integer(), nullable=True),
+        sa.Column(
+            "geometry",
+            geoalchemy2.types.Geometry(
+                srid=4326,
+                from_text="ST_GeomFromEWKT",
+                name="geometry",
+                spatial_index=False,
+            ),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(["aoi_id"], ["aois.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_aoi_subdivisions_id"), "aoi_subdivisions", ["id"], unique=False
+    )
+    op.create_index(
+        op.f("ix_aoi_subdivisions_aoi_id"),
+        "aoi_subdivisions",
+        ["aoi_id"],
+        unique=False,
+    )
+    op.create_index(
+        "idx_aoi_subdivisions_geometry",
+        "aoi_subdivisions",
+        ["geometry"],
+        unique=False,
+        postgresql_using="gist",
+    )
+
+    # backfill from the existing aois
+    op.execute(
+        "INSERT INTO aoi_subdivisions (aoi_id, geometry) "
+        "SELECT id, ST_Subdivide(ST_MakeValid(geometry), "
+        f"{SUBDIVIDE_MAX_VERTICES}) FROM aois WHERE geometry IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_aoi_subdivisions_geometry", table_name="aoi_subdivisions")
+    op.drop_index(op.f("ix_aoi_subdivisions_aoi_id"), table_name="aoi_subdivisions")
+    op.drop_index(op.f("ix_aoi_subdivisions_id"), table_name="aoi_subdivisions")
+    op.drop_table("aoi_subdivisions")
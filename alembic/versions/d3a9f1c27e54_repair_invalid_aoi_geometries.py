@@ -0,0 +1,74 @@
+"""repair invalid aoi geometries
+
+Revision ID: d3a9f1c27e54
+Revises: b7e2c4d19a3f
+Create Date: 2026-10-19 17:48:02.531904
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d3a9f1c27e54"
+down_revision = "b7e2c4d19a3f"
+branch_labels = None
+depends_on = None
+
+REPAIRED = (
+    "ST_ForcePolygonCCW(ST_Multi(ST_CollectionExtract(ST_MakeValid(geometry), 3)))"
+)
+
+# as in oxeo.api.controllers.geom
+SUBDIVIDE_MAX_VERTICES = 256
+
+
+def upgrade() -> None:
+    # geometries are now repaired on write, and reads no longer ST_MakeValid;
+    # bring the rows written before that in line
+    bind = op.get_bind()
+
+    # nothing polygonal is left of these, so they become empty multipolygons:
+    # reads and clips stay valid, and the aois (and their events) are kept for
+    # someone to fix or delete through the API
+    unrepairable = bind.execute(
+        sa.text(
+            "SELECT id FROM aois WHERE geometry IS NOT NULL "
+            f"AND NOT ST_IsValid(geometry) AND ST_IsEmpty({REPAIRED}) ORDER BY id"
+        )
+    ).scalars()
+    unrepairable = list(unrepairable)
+    if unrepairable:
+        print(
+            f"{len(unrepairable)} aois have no area once made valid and were "
+            f"emptied: {unrepairable}"
+        )
+
+    # updated_at is set explicitly, so /changes/ clients receive the repairs
+    repaired = bind.execute(
+        sa.text(
+            f"UPDATE aois SET geometry = {REPAIRED}, updated_at = now() "
+            "WHERE geometry IS NOT NULL AND NOT ST_IsValid(geometry) RETURNING id"
+        )
+    ).scalars()
+    repaired = list(repaired)
+
+    # same as sync_aoi_subdivisions
+    if repaired:
+        bind.execute(
+            sa.text("DELETE FROM aoi_subdivisions WHERE aoi_id = ANY(:ids)"),
+            {"ids": repaired},
+        )
+        bind.execute(
+            sa.text(
+                "INSERT INTO aoi_subdivisions (aoi_id, geometry) "
+                f"SELECT id, ST_Subdivide(geometry, {SUBDIVIDE_MAX_VERTICES}) "
+                "FROM aois WHERE id = ANY(:ids)"
+            ),
+            {"ids": repaired},
+        )
+
+
+def downgrade() -> None:
+    # the original invalid geometries are not kept
+    pass
@@ -0,0 +1,45 @@
+"""cascade deletes
+
+Revision ID: fa10dd9a74d5
+Revises: 35571d51060c
+Create Date: 2026-10-19 16:21:08.431752
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "fa10dd9a74d5"
+down_revision = "35571d51060c"
+branch_labels = None
+depends_on = None
+
+# (constraint, table, column, referred table)
+FOREIGN_KEYS = [
+    ("events_aoi_id_fkey", "events", "aoi_id", "aois"),
+    (
+        "assets_companies_link_asset_id_fkey",
+        "assets_companies_link",
+        "asset_id",
+        "assets",
+    ),
+    (
+        "assets_companies_link_company_id_fkey",
+        "assets_companies_link",
+        "company_id",
+        "companies",
+    ),
+]
+
+
+def upgrade() -> None:
+    for name, table, column, referred in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_="foreignkey")
+        op.create_foreign_key(
+            name, table, referred, [column], ["id"], ondelete="CASCADE"
+        )
+
+
+def downgrade() -> None:
+    for name, table, column, referred in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_="foreignkey")
+        op.create_foreign_key(name, table, referred, [column], ["id"])
@@ -0,0 +1,107 @@
+"""Benchmark get_aoi clip/simplify against large admin-area polygons.
+
+Needs a PostGIS database configured through the usual PG_DB_* env vars.
+Synthetic AOIs are inserted in a transaction which is rolled back at the end.
+
+    python bin/benchmarks/bench_aoi_clip.py --n-aois 20 --vertices 200000
+"""
+import argparse
+import math
+import random
+import time
+
+from shapely import geometry
+
+from oxeo.api.controllers import geom
+from oxeo.api.models import database, schemas
+from oxeo.api.responses import StreamedPage
+
+
+def admin_area(x0, y0, radius, n_vertices, rng):
+    """A jagged, roughly circular polygon with `n_vertices` vertices."""
+    coords = []
+    for ii in range(n_vertices):
+        theta = 2 * math.pi * ii / n_vertices
+        r = radius * (1 + 0.05 * rng.random())
+        coords.append((x0 + r * math.cos(theta), y0 + r * math.sin(theta)))
+    return geometry.MultiPolygon([geometry.Polygon(coords)])
+
+
+def fetch(result):
+    # large pages are returned unfetched, for streaming
+    if isinstance(result, StreamedPage):
+        return result.materialise()
+    return result
+
+
+def timeit(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - tic)
+    return min(timings), sum(timings) / len(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-aois", type=int, default=20)
+    parser.add_argument("--vertices", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db = database.SessionLocal()
+
+    try:
+        db_aois = [
+            database.AOI(
+                geometry=admin_area(ii % 5, ii // 5, 0.4, args.vertices, rng).wkt,
+                labels=["admin_area"],
+                properties={"benchmark": "clip"},
+            )
+            for ii in range(args.n_aois)
+        ]
+        db.add_all(db_aois)
+        db.flush()
+        geom.sync_aoi_subdivisions(db, [db_aoi.id for db_aoi in db_aois])
+
+        # one query box that covers every AOI, one that cuts through all of them
+        queries = {
+            "covering": geometry.box(-1, -1, 6, args.n_aois // 5 + 1),
+            "partial": geometry.box(-1, -1, 6, args.n_aois // 5 + 1).difference(
+                geometry.box(-1, -0.2, 6, 0.2)
+            ),
+        }
+
+        cases = {
+            "intersects": dict(),
+            "clip": dict(clip=True),
+            "simplify": dict(simplify=0.01),
+            "clip+simplify": dict(clip=True, simplify=0.01),
+        }
+
+        for qname, qgeom in queries.items():
+            for cname, kwargs in cases.items():
+                aoi_query = schemas.AOIQuery(
+                    geometry=schemas.Geometry(**geometry.mapping(qgeom)),
+                    keyed_values={"benchmark": "clip"},
+                    limit=args.n_aois,
+                    **kwargs,
+                )
+
+                best, mean = timeit(
+                    lambda aoi_query=aoi_query: fetch(
+                        geom.get_aoi(aoi_query=aoi_query.copy(), db=db, user=None)
+                    ),
+                    args.repeat,
+                )
+                print(f"{qname:>10} {cname:>14}: best {best:.3f}s mean {mean:.3f}s")
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark bulk AOI creation against one AOI per request.
+
+Times validating `--n-aois` synthetic GeoJSON features one at a time (schema
+parse, check_aoi, schema2shp) against the vectorised check_aoi_geometries, then,
+unless `--no-db`, inserting them through create_aoi in a loop against a single
+create_aois call. Inserts need the PG_DB_* env vars and run in one transaction
+that is rolled back.
+
+    python bin/benchmarks/bench_bulk_aois.py --n-aois 10000 --vertices 200
+"""
+import argparse
+import math
+import random
+import time
+
+from sqlalchemy.orm import Session
+
+from oxeo.api.controllers import geom
+from oxeo.api.models import database, schemas
+
+
+def feature(rng, n_vertices):
+    x0, y0 = rng.uniform(-170, 170), rng.uniform(-60, 60)
+    coords = []
+    for ii in range(n_vertices):
+        theta = 2 * math.pi * ii / n_vertices
+        r = 0.1 * (1 + 0.3 * rng.random())
+        coords.append([x0 + r * math.cos(theta), y0 + r * math.sin(theta)])
+    coords.append(coords[0])
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Polygon", "coordinates": [coords]},
+        "properties": {"benchmark": "bulk_aois"},
+        "labels": ["agricultural_area"],
+    }
+
+
+def validate_per_feature(features):
+    for f in features:
+        aoi = geom.check_aoi(schemas.Feature.parse_obj(f))
+        shp = geom.schema2shp(aoi.geometry, allowed_types=["Polygon", "MultiPolygon"])
+        shp.is_valid
+        shp.wkt
+
+
+def validate_vectorised(features):
+    geom.check_aoi_geometries([f["geometry"] for f in features])
+
+
+def timed(name, n, fn, *args):
+    tic = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - tic
+    print(f"{name:>24}: {n} features in {elapsed:.2f}s ({n / elapsed:.0f}/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-aois", type=int, default=10000)
+    parser.add_argument("--n-single", type=int, default=500)
+    parser.add_argument("--vertices", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-db", action="store_true")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    features = [feature(rng, args.vertices) for _ in range(args.n_aois)]
+
+    timed("validate per feature", args.n_aois, validate_per_feature, features)
+    timed("validate vectorised", args.n_aois, validate_vectorised, features)
+
+    if args.no_db:
+        return
+
+    connection = database.engine.connect()
+    transaction = connection.begin()
+    # joined to the outer transaction, so the controllers' commits are not final
+    db = Session(bind=connection)
+
+    try:
+        single = features[: args.n_single]
+        timed(
+            "create_aoi per feature",
+            len(single),
+            lambda: [
+                geom.create_aoi(db, schemas.Feature.parse_obj(f), None) for f in single
+            ],
+        )
+
+        for chunk in [100, 1000, 5000]:
+            geom.AOI_INSERT_CHUNK = chunk
+            timed(
+                f"create_aois chunk={chunk}",
+                args.n_aois,
+                geom.create_aois,
+                db,
+                features,
+                None,
+            )
+    finally:
+        db.close()
+        transaction.rollback()
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
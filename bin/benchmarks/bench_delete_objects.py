@@ -0,0 +1,79 @@
+"""Benchmark delete_objects for a large batch of event ids.
+
+Seeds `--rows` synthetic events for one scratch AOI (PG_DB_* env vars), then
+times deleting `--ids` of them one ORM object at a time (the old behaviour)
+against the set-based delete_objects. Everything runs in one transaction that
+is rolled back.
+
+    python bin/benchmarks/bench_delete_objects.py --ids 100000
+"""
+import argparse
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from oxeo.api.controllers import geom
+from oxeo.api.models import database, schemas
+
+SEED = """
+    INSERT INTO events (labels, aoi_id, datetime, properties)
+    SELECT ARRAY['ndvi']::"EventLabel"[],
+        :aoi_id,
+        DATE '2015-01-01' + i % 3650,
+        jsonb_build_object('value', i % 1000)
+    FROM generate_series(1, :rows) AS i
+    RETURNING id
+"""
+
+
+def delete_per_object(db, ids):
+    for _id in ids:
+        db.delete(db.query(database.Event).filter(database.Event.id == _id).first())
+    db.commit()
+
+
+def delete_set_based(db, ids):
+    geom.delete_objects(schemas.DeleteObj(table="event", id=ids), db=db, user=None)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--ids", type=int, default=100_000)
+    args = parser.parse_args()
+
+    connection = database.engine.connect()
+    transaction = connection.begin()
+    # joined to the outer transaction, so delete_objects' commit is not final
+    db = Session(bind=connection)
+
+    try:
+        db_aoi = database.AOI(
+            geometry="MULTIPOLYGON(((0 0, 0 1, 1 1, 1 0, 0 0)))",
+            labels=["waterbody"],
+            properties={"benchmark": "delete_objects"},
+        )
+        db.add(db_aoi)
+        db.flush()
+
+        ids = db.execute(text(SEED), {"aoi_id": db_aoi.id, "rows": args.rows})
+        ids = [row.id for row in ids]
+        db.execute(text("ANALYZE events"))
+
+        batches = {
+            "per object": (delete_per_object, ids[: args.ids]),
+            "set based": (delete_set_based, ids[args.ids : 2 * args.ids]),
+        }
+        for name, (fn, batch) in batches.items():
+            tic = time.perf_counter()
+            fn(db, batch)
+            print(f"{name:>10}: {len(batch)} ids in {time.perf_counter() - tic:.2f}s")
+    finally:
+        db.close()
+        transaction.rollback()
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark get_events-shaped reads on a heap vs a range-partitioned events table.
+
+Builds both tables in a scratch schema (PG_DB_* env vars) with `--rows` synthetic
+events spread over `--years` years, then times the same bounded query on each.
+
+    python bin/benchmarks/bench_events_partitions.py --rows 50000000
+"""
+import argparse
+import json
+import time
+
+from sqlalchemy import text
+
+from oxeo.api.models import database
+
+SCHEMA = "bench_partitions"
+
+COLUMNS = """
+    id integer NOT NULL,
+    labels text[],
+    aoi_id integer,
+    datetime date NOT NULL,
+    properties jsonb
+"""
+
+FILL = """
+    INSERT INTO {table}
+    SELECT i,
+        ARRAY[(ARRAY['ndvi','water_extents','soil_moisture'])[1 + i % 3]],
+        i % :n_aois,
+        DATE '{first_year}-01-01' + (i / :n_aois) % (:years * 365),
+        jsonb_build_object('value', i % 1000)
+    FROM generate_series(1, :rows) AS i
+"""
+
+QUERY = """
+    EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)
+    SELECT * FROM {table}
+    WHERE aoi_id IN :aoi_ids
+    AND labels @> ARRAY['ndvi']
+    AND datetime >= :start AND datetime <= :end
+    LIMIT 1001
+"""
+
+
+def setup(conn, args):
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+
+    conn.execute(text(f"CREATE TABLE {SCHEMA}.events_heap ({COLUMNS})"))
+    conn.execute(
+        text(
+            f"CREATE TABLE {SCHEMA}.events_part ({COLUMNS}) PARTITION BY RANGE (datetime)"
+        )
+    )
+    for year in range(args.first_year, args.first_year + args.years + 1):
+        conn.execute(
+            text(
+                f"CREATE TABLE {SCHEMA}.events_part_y{year} "
+                f"PARTITION OF {SCHEMA}.events_part "
+                f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+            )
+        )
+
+    params = dict(n_aois=args.n_aois, years=args.years, rows=args.rows)
+    for table in ["events_heap", "events_part"]:
+        tic = time.perf_counter()
+        conn.execute(
+            text(FILL.format(table=f"{SCHEMA}.{table}", first_year=args.first_year)),
+            params,
+        )
+        for cols in ["id", "datetime", "aoi_id, datetime"]:
+            conn.execute(text(f"CREATE INDEX ON {SCHEMA}.{table} ({cols})"))
+        conn.execute(text(f"ANALYZE {SCHEMA}.{table}"))
+        print(f"built {table} in {time.perf_counter() - tic:.1f}s")
+
+
+def run(conn, args):
+    params = dict(
+        aoi_ids=tuple(range(0, args.n_aois, max(1, args.n_aois // 50))),
+        start=f"{args.first_year + args.years // 2}-01-01",
+        end=f"{args.first_year + args.years // 2}-12-31",
+    )
+
+    results = {}
+    for table in ["events_heap", "events_part"]:
+        timings = []
+        for _ in range(args.repeat):
+            plan = conn.execute(
+                text(QUERY.format(table=f"{SCHEMA}.{table}")), params
+            ).scalar()
+            timings.append(plan[0]["Execution Time"])
+        results[table] = dict(best_ms=min(timings), mean_ms=sum(timings) / len(timings))
+        print(f"{table:>12}: {json.dumps(results[table])}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000_000)
+    parser.add_argument("--n-aois", type=int, default=10_000)
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--first-year", type=int, default=2003)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema")
+    args = parser.parse_args()
+
+    with database.engine.begin() as conn:
+        setup(conn, args)
+
+    try:
+        with database.engine.connect() as conn:
+            run(conn, args)
+    finally:
+        if not args.keep:
+            with database.engine.begin() as conn:
+                conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Benchmark update_aoi on large polygons, unchanged and changed.
+
+Inserts `--n-aois` AOIs of `--vertices` vertices (PG_DB_* env vars), then
+times updating all of them with the same geometry and with a shifted one,
+through the old path (load the stored geometry into Shapely, compare with
+`!=`, convert the new one twice, write WKT) and through update_aoi (compare
+normalised WKB hashes, write EWKB). Everything runs in one transaction that
+is rolled back.
+
+    python bin/benchmarks/bench_geometry_updates.py --n-aois 200 --vertices 20000
+"""
+import argparse
+import math
+import random
+import time
+
+from sqlalchemy.orm import Session
+
+from oxeo.api.controllers import geom
+from oxeo.api.models import database, schemas
+
+
+def coordinates(x0, y0, n_vertices, rng):
+    coords = []
+    for ii in range(n_vertices):
+        theta = 2 * math.pi * ii / n_vertices
+        r = 0.1 * (1 + 0.05 * rng.random())
+        coords.append([x0 + r * math.cos(theta), y0 + r * math.sin(theta)])
+    coords.append(coords[0])
+    return [coords]
+
+
+def feature(aoi_id, coords, shift=0.0):
+    return schemas.Feature(
+        id=str(aoi_id),
+        geometry=schemas.Geometry(
+            type="Polygon",
+            coordinates=[[[x + shift, y] for x, y in ring] for ring in coords],
+        ),
+        labels=["agricultural_area"],
+        properties={"benchmark": "geometry_updates"},
+    )
+
+
+def update_aoi_wkt(db, aoi, user):
+    """update_aoi's geometry handling before hashing and EWKB writes"""
+
+    aoi = geom.check_aoi(aoi)
+    db_aoi = db.query(database.AOI).filter(database.AOI.id == aoi.id).first()
+    db_aoi.labels = aoi.labels
+    db_aoi.properties = aoi.properties
+
+    allowed_types = ["Polygon", "MultiPolygon"]
+    if geom.pg2shapely(db_aoi.geometry) != geom.schema2shp(aoi.geometry, allowed_types):
+        db_aoi.geometry = geom.schema2shp(aoi.geometry, allowed_types).wkt
+        db.flush()
+        geom.sync_aoi_subdivisions(db, [db_aoi.id])
+
+    db.commit()
+    db.refresh(db_aoi)
+    return db_aoi
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-aois", type=int, default=200)
+    parser.add_argument("--vertices", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    connection = database.engine.connect()
+    transaction = connection.begin()
+    # joined to the outer transaction, so update_aoi's commits are not final
+    db = Session(bind=connection)
+
+    try:
+        shapes = [
+            coordinates(
+                rng.uniform(-170, 170), rng.uniform(-60, 60), args.vertices, rng
+            )
+            for _ in range(args.n_aois)
+        ]
+        ids, _ = geom.create_aois(
+            db,
+            [
+                dict(
+                    type="Feature",
+                    geometry=dict(type="Polygon", coordinates=c),
+                    labels=["agricultural_area"],
+                )
+                for c in shapes
+            ],
+            None,
+        )
+
+        for name, update in [("wkt", update_aoi_wkt), ("ewkb+hash", geom.update_aoi)]:
+            for case, shift in [("unchanged", 0.0), ("changed", 0.001)]:
+                payloads = [feature(aoi_id, c, shift) for aoi_id, c in zip(ids, shapes)]
+                tic = time.perf_counter()
+                for aoi in payloads:
+                    update(db, aoi, None)
+                elapsed = time.perf_counter() - tic
+                print(
+                    f"{name:>10} {case:>9}: {len(payloads)} x {args.vertices} "
+                    f"vertices in {elapsed:.2f}s"
+                )
+            # back to the originals for the next path
+            for aoi_id, c in zip(ids, shapes):
+                geom.update_aoi(db, feature(aoi_id, c), None)
+    finally:
+        db.close()
+        transaction.rollback()
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
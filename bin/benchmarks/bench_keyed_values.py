@@ -0,0 +1,103 @@
+"""Benchmark keyed_values event filters with and without the properties GIN index.
+
+Seeds `--rows` synthetic events for one scratch AOI (PG_DB_* env vars), times
+get_events with several keyed_values filters, then drops ix_events_properties
+and times them again. Everything runs in one transaction that is rolled back.
+
+    python bin/benchmarks/bench_keyed_values.py --rows 2000000
+"""
+import argparse
+import time
+from datetime import date
+
+from sqlalchemy import text
+
+from oxeo.api.controllers import geom
+from oxeo.api.models import database, schemas
+from oxeo.api.responses import StreamedPage
+
+SEED = """
+    INSERT INTO events (labels, aoi_id, datetime, properties)
+    SELECT ARRAY['ndvi']::"EventLabel"[],
+        :aoi_id,
+        DATE '2015-01-01' + i % 3650,
+        jsonb_build_object(
+            'value', i % 1000,
+            'source', (ARRAY['sentinel-2','landsat-8','modis'])[1 + i % 3],
+            'tile', 'T' || (i % 500)
+        )
+    FROM generate_series(1, :rows) AS i
+"""
+
+FILTERS = {
+    "equality": {"tile": "T42"},
+    "in": {"source": {"in": ["landsat-8", "modis"]}, "tile": "T7"},
+    "range": {"value": {"gte": 990}},
+    "has_key": {"tile": None},
+}
+
+
+def fetch(result):
+    # large pages are returned unfetched, for streaming
+    if isinstance(result, StreamedPage):
+        return result.materialise()
+    return result
+
+
+def timeit(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - tic)
+    return min(timings), sum(timings) / len(timings)
+
+
+def run(db, aoi_id, args, tag):
+    for name, keyed_values in FILTERS.items():
+        event_query = schemas.EventQuery(
+            aoi_id=aoi_id,
+            start_datetime=date(2015, 1, 1),
+            end_datetime=date(2025, 1, 1),
+            keyed_values=keyed_values,
+            limit=1000,
+        )
+        best, mean = timeit(
+            lambda event_query=event_query: fetch(
+                geom.get_events(event_query.copy(), db=db, user=None)
+            ),
+            args.repeat,
+        )
+        print(f"{tag:>8} {name:>9}: best {best:.3f}s mean {mean:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    db = database.SessionLocal()
+
+    try:
+        db_aoi = database.AOI(
+            geometry="MULTIPOLYGON(((0 0, 0 1, 1 1, 1 0, 0 0)))",
+            labels=["waterbody"],
+            properties={"benchmark": "keyed_values"},
+        )
+        db.add(db_aoi)
+        db.flush()
+
+        db.execute(text(SEED), {"aoi_id": db_aoi.id, "rows": args.rows})
+        db.execute(text("ANALYZE events"))
+
+        run(db, db_aoi.id, args, "gin")
+        db.execute(text("DROP INDEX ix_events_properties"))
+        run(db, db_aoi.id, args, "no index")
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
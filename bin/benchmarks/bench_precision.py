@@ -0,0 +1,137 @@
+"""Benchmark get_aoi/get_assets payload size and latency at several precisions.
+
+Needs a PostGIS database configured through the usual PG_DB_* env vars.
+Synthetic AOIs and assets are inserted in a transaction which is rolled back at
+the end. Sizes are reported raw and gzipped, for GeoJSON and geobuf.
+
+    python bin/benchmarks/bench_precision.py --n-aois 1000 --vertices 500
+"""
+import argparse
+import asyncio
+import gzip
+import math
+import random
+import time
+
+from shapely import geometry
+
+from oxeo.api.controllers import asset, geom
+from oxeo.api.models import database, schemas
+from oxeo.api.responses import StreamedPage
+
+PRECISIONS = [None, 9, 6, 5, 4]
+
+
+def polygon(x0, y0, radius, n_vertices, rng):
+    coords = []
+    for ii in range(n_vertices):
+        theta = 2 * math.pi * ii / n_vertices
+        r = radius * (1 + 0.05 * rng.random())
+        coords.append((x0 + r * math.cos(theta), y0 + r * math.sin(theta)))
+    return geometry.MultiPolygon([geometry.Polygon(coords)])
+
+
+async def read_stream(response):
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+def payload(response):
+    if isinstance(response, StreamedPage):
+        return b"".join(response.chunks())
+    if isinstance(response, schemas.FeatureCollection):
+        return response.json().encode()
+    return asyncio.run(read_stream(response))
+
+
+def measure(fn):
+    tic = time.perf_counter()
+    body = payload(fn())
+    return time.perf_counter() - tic, len(body), len(gzip.compress(body))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-aois", type=int, default=1000)
+    parser.add_argument("--n-assets", type=int, default=1000)
+    parser.add_argument("--vertices", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db = database.SessionLocal()
+
+    try:
+        db.add_all(
+            database.AOI(
+                geometry=polygon(
+                    rng.uniform(-180, 180),
+                    rng.uniform(-60, 60),
+                    0.1,
+                    args.vertices,
+                    rng,
+                ).wkt,
+                labels=["agricultural_area"],
+                properties={"benchmark": "precision"},
+            )
+            for _ in range(args.n_aois)
+        )
+        db.add_all(
+            database.Asset(
+                geometry=geometry.Point(
+                    rng.uniform(-180, 180), rng.uniform(-60, 60)
+                ).wkt,
+                name=f"asset-{ii}",
+                labels=["mine"],
+                properties={"benchmark": "precision"},
+            )
+            for ii in range(args.n_assets)
+        )
+        db.flush()
+
+        print(
+            f"{'query':>14} {'precision':>9} {'seconds':>8} {'bytes':>10} {'gzip':>10}"
+        )
+        for precision in PRECISIONS:
+            cases = {
+                "aoi GeoJSON": lambda precision=precision: geom.get_aoi(
+                    schemas.AOIQuery(
+                        keyed_values={"benchmark": "precision"},
+                        precision=precision,
+                        limit=1000,
+                    ),
+                    db,
+                    None,
+                ),
+                "aoi geobuf": lambda precision=precision: geom.get_aoi(
+                    schemas.AOIQuery(
+                        keyed_values={"benchmark": "precision"},
+                        format="geobuf",
+                        precision=precision,
+                        limit=1000,
+                    ),
+                    db,
+                    None,
+                ),
+                "assets GeoJSON": lambda precision=precision: asset.get_assets(
+                    schemas.AssetQuery(
+                        keyed_values={"benchmark": "precision"},
+                        precision=precision,
+                        limit=1000,
+                    ),
+                    db,
+                    None,
+                ),
+            }
+            for name, fn in cases.items():
+                seconds, size, gzipped = measure(fn)
+                print(
+                    f"{name:>14} {str(precision):>9} {seconds:>8.3f} "
+                    f"{size:>10} {gzipped:>10}"
+                )
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark response serialisation for 10k events and 1k polygon AOIs.
+
+No database is needed: synthetic rows are passed through the postprocess
+functions, then rendered the old way (response_model validation, then
+jsonable_encoder, then json.dumps) and the new way (orjson straight from the
+constructed models).
+
+    python bin/benchmarks/bench_serialisation.py --events 10000 --aois 1000
+"""
+import argparse
+import json
+import math
+import time
+from datetime import date, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+
+from oxeo.api.controllers import geom
+from oxeo.api.models import database, schemas
+from oxeo.api.responses import dumps
+
+
+def timeit(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - tic)
+    return min(timings), sum(timings) / len(timings)
+
+
+def polygon_geojson(ii, n_vertices):
+    ring = [
+        [
+            ii + 0.4 * math.cos(2 * math.pi * jj / n_vertices),
+            0.4 * math.sin(2 * math.pi * jj / n_vertices),
+        ]
+        for jj in range(n_vertices)
+    ]
+    ring.append(ring[0])
+    return json.dumps({"type": "MultiPolygon", "coordinates": [[ring]]})
+
+
+def fastapi_render(model, content):
+    """What FastAPI does for a route with a response_model and a JSONResponse"""
+    return json.dumps(jsonable_encoder(parse_obj_as(model, content))).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=10_000)
+    parser.add_argument("--aois", type=int, default=1_000)
+    parser.add_argument("--vertices", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    db_events = [
+        database.Event(
+            id=ii,
+            labels=["ndvi"],
+            aoi_id=ii % 100,
+            datetime=date(2015, 1, 1) + timedelta(days=ii % 3650),
+            properties={"value": ii / 1000, "source": "sentinel-2"},
+        )
+        for ii in range(args.events)
+    ]
+    db_aois = [
+        database.AOI(
+            id=ii,
+            geometry=polygon_geojson(ii, args.vertices),
+            labels=["agricultural_area"],
+            properties={"name": f"aoi-{ii}"},
+        )
+        for ii in range(args.aois)
+    ]
+
+    cases = {
+        "events": (
+            schemas.EventQueryReturn,
+            lambda: geom.postprocess_events(db_events, None),
+        ),
+        "aois": (
+            schemas.FeatureCollection,
+            lambda: geom.postprocess_aois(db_aois, None, "GeoJSON"),
+        ),
+    }
+
+    for name, (model, postprocess) in cases.items():
+        content = postprocess()
+        for rname, render in [
+            (
+                "response_model",
+                lambda model=model, content=content: fastapi_render(model, content),
+            ),
+            ("orjson", lambda content=content: dumps(content)),
+        ]:
+            best, mean = timeit(render, args.repeat)
+            print(f"{name:>6} {rname:>14}: best {best:.3f}s mean {mean:.3f}s")
+
+        best, mean = timeit(postprocess, args.repeat)
+        print(f"{name:>6} {'postprocess':>14}: best {best:.3f}s mean {mean:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,486 @@
+"""Load-test the read routes against a local PostGIS stand-in.
+
+Brings up a throwaway PostGIS (`--postgres docker` or `--postgres pg_ctl`, or
+reuses the PG_DB_* database with `--postgres env`), migrates it, seeds it with
+oxeo.api.models.synthetic, then drives each route in-process through the ASGI
+app and/or over uvicorn. p50/p95/p99 latency and throughput per route are
+printed and written as JSON; `--compare` diffs against an earlier run.
+
+    python bin/benchmarks/loadtest.py --postgres docker --aois 2000 \\
+        --start 2020-01-01 --end 2022-12-31 --out before.json
+    python bin/benchmarks/loadtest.py ... --out after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+
+import httpx
+from sqlalchemy import create_engine, text
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+POSTGIS_IMAGE = "postgis/postgis:14-3.3"
+PG_USER = PG_PW = PG_NAME = "oxeo_loadtest"
+
+BENCH_EMAIL = "loadtest@oxfordeo.com"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_db(url: str, timeout: float = 60):
+    engine = create_engine(url)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+        finally:
+            engine.dispose()
+
+
+@contextmanager
+def docker_postgres():
+    port = free_port()
+    name = f"oxeo-loadtest-{port}"
+    subprocess.run(
+        [
+            "docker",
+            "run",
+            "-d",
+            "--rm",
+            "--name",
+            name,
+            "-p",
+            f"{port}:5432",
+            "-e",
+            f"POSTGRES_USER={PG_USER}",
+            "-e",
+            f"POSTGRES_PASSWORD={PG_PW}",
+            "-e",
+            f"POSTGRES_DB={PG_NAME}",
+            POSTGIS_IMAGE,
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        yield f"127.0.0.1:{port}"
+    finally:
+        subprocess.run(["docker", "stop", name], stdout=subprocess.DEVNULL)
+
+
+@contextmanager
+def pg_ctl_postgres():
+    """A scratch cluster from the local PostgreSQL binaries (PostGIS installed)"""
+
+    port = free_port()
+    datadir = tempfile.mkdtemp(prefix="oxeo-loadtest-")
+    pwfile = os.path.join(datadir, "pwfile")
+    cluster = os.path.join(datadir, "data")
+    with open(pwfile, "w") as f:
+        f.write(PG_PW)
+
+    subprocess.run(
+        ["initdb", "-D", cluster, "-U", PG_USER, f"--pwfile={pwfile}", "-A", "md5"],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    subprocess.run(
+        [
+            "pg_ctl",
+            "-D",
+            cluster,
+            "-o",
+            f"-p {port} -k {datadir} -c listen_addresses=127.0.0.1",
+            "-l",
+            os.path.join(datadir, "postgres.log"),
+            "-w",
+            "start",
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        subprocess.run(
+            ["createdb", "-h", "127.0.0.1", "-p", str(port), "-U", PG_USER, PG_NAME],
+            check=True,
+            env={**os.environ, "PGPASSWORD": PG_PW},
+        )
+        yield f"127.0.0.1:{port}"
+    finally:
+        subprocess.run(
+            ["pg_ctl", "-D", cluster, "-m", "fast", "stop"], stdout=subprocess.DEVNULL
+        )
+        shutil.rmtree(datadir, ignore_errors=True)
+
+
+@contextmanager
+def local_postgres(mode: str):
+    """Point the PG_DB_* env vars at a PostGIS database for the duration"""
+
+    if mode == "env":
+        yield
+        return
+
+    stand_in = docker_postgres if mode == "docker" else pg_ctl_postgres
+    with stand_in() as host:
+        os.environ.update(
+            PG_DB_USER=PG_USER, PG_DB_PW=PG_PW, PG_DB_HOST=host, PG_DB_NAME=PG_NAME
+        )
+        yield
+
+
+def db_url() -> str:
+    env = os.environ
+    return (
+        f"postgresql://{env['PG_DB_USER']}:{env['PG_DB_PW']}"
+        f"@{env['PG_DB_HOST']}/{env['PG_DB_NAME']}"
+    )
+
+
+def migrate():
+    wait_for_db(db_url())
+    engine = create_engine(db_url())
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS hstore"))
+    engine.dispose()
+    subprocess.run(
+        [sys.executable, "-m", "alembic", "upgrade", "head"], cwd=REPO, check=True
+    )
+
+
+def seed(args) -> dict:
+    """Seed synthetic rows, returning the ids the request generators draw from"""
+
+    from oxeo.api.controllers import auth
+    from oxeo.api.models import database, schemas, synthetic
+
+    tic = time.perf_counter()
+    with database.engine.begin() as conn:
+        seeded = synthetic.seed_synthetic(
+            conn,
+            seed=args.seed,
+            n_aois=args.aois,
+            start=args.start,
+            end=args.end,
+            every=args.every,
+            n_companies=args.companies,
+            n_assets=args.assets,
+        )
+        conn.execute(text("ANALYZE"))
+    print(f"seeded {seeded['counts']} in {time.perf_counter() - tic:.1f}s")
+
+    db = database.SessionLocal()
+    try:
+        if auth.get_user(db, BENCH_EMAIL) is None:
+            auth.create_user(
+                db,
+                schemas.UserCreate(email=BENCH_EMAIL, password="loadtest", token=""),
+                role="admin",
+            )
+    finally:
+        db.close()
+
+    return {"aoi_ids": seeded["aoi_ids"]}
+
+
+def route_requests(ids: dict, args):
+    """route name -> f(rng) giving the (path, params) of one request"""
+
+    aoi_ids = ids["aoi_ids"]
+
+    def bbox(rng, size):
+        x, y = rng.uniform(-170, 170 - size), rng.uniform(-60, 60 - size)
+        ring = [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+        return json.dumps({"type": "Polygon", "coordinates": [ring]})
+
+    return {
+        "aoi_by_id": lambda rng: (
+            "/aoi/",
+            {"id": json.dumps(rng.sample(aoi_ids, min(10, len(aoi_ids))))},
+        ),
+        "aoi_by_geometry": lambda rng: (
+            "/aoi/",
+            {"geometry": bbox(rng, 20), "limit": 100},
+        ),
+        "events": lambda rng: (
+            "/events/",
+            {
+                "aoi_id": json.dumps(rng.choice(aoi_ids)),
+                "start_datetime": args.start.isoformat(),
+                "end_datetime": args.end.isoformat(),
+                "limit": 1000,
+            },
+        ),
+        "events_per_aoi": lambda rng: (
+            "/events/",
+            {
+                "aoi_id": json.dumps(rng.sample(aoi_ids, min(20, len(aoi_ids)))),
+                "start_datetime": args.start.isoformat(),
+                "end_datetime": args.end.isoformat(),
+                "limit_per_aoi": 50,
+            },
+        ),
+        "events_latest": lambda rng: (
+            "/events/latest/",
+            {"aoi_id": json.dumps(rng.sample(aoi_ids, min(100, len(aoi_ids))))},
+        ),
+        "assets": lambda rng: ("/assets/", {"limit": 1000}),
+        "companies": lambda rng: ("/companies/", {"limit": 1000}),
+    }
+
+
+def summarise(latencies, errors, wall) -> dict:
+    if len(latencies) < 2:
+        return dict(requests=len(latencies), errors=errors)
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return dict(
+        requests=len(latencies),
+        errors=errors,
+        mean_ms=1000 * statistics.fmean(latencies),
+        p50_ms=1000 * cuts[49],
+        p95_ms=1000 * cuts[94],
+        p99_ms=1000 * cuts[98],
+        throughput_rps=len(latencies) / wall,
+    )
+
+
+async def drive(client, make_request, n_requests, concurrency, rng) -> dict:
+    requests = [make_request(rng) for _ in range(n_requests)]
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        while requests:
+            path, params = requests.pop()
+            tic = time.perf_counter()
+            response = await client.get(path, params=params)
+            latencies.append(time.perf_counter() - tic)
+            if response.status_code != 200:
+                errors += 1
+
+    tic = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarise(latencies, errors, time.perf_counter() - tic)
+
+
+async def run_routes(client, routes, args) -> dict:
+    results = {}
+    for name, make_request in routes.items():
+        rng = random.Random(args.seed)
+        await drive(client, make_request, args.warmup, args.concurrency, rng)
+        results[name] = await drive(
+            client, make_request, args.requests, args.concurrency, rng
+        )
+        print(f"  {name:>16}: {json.dumps(results[name])}")
+    return results
+
+
+def bearer() -> dict:
+    from oxeo.api.controllers import auth
+
+    return {"Authorization": f"Bearer {auth.create_access_token({'sub': BENCH_EMAIL})}"}
+
+
+async def run_inprocess(routes, args) -> dict:
+    from oxeo.api.app import app
+
+    async with httpx.AsyncClient(
+        app=app, base_url="http://loadtest", headers=bearer(), timeout=None
+    ) as client:
+        return await run_routes(client, routes, args)
+
+
+@contextmanager
+def uvicorn_server(workers: int):
+    port = free_port()
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "oxeo.api.app:app",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        cwd=REPO,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"{base_url}/openapi.json").raise_for_status()
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline or proc.poll() is not None:
+                    raise
+                time.sleep(0.2)
+        yield base_url
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+async def run_uvicorn(routes, args, base_url) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url, headers=bearer(), timeout=None, limits=limits
+    ) as client:
+        return await run_routes(client, routes, args)
+
+
+def git_commit() -> str:
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True
+    )
+    return result.stdout.decode().strip()
+
+
+def compare(results: dict, baseline: dict):
+    print("\nchange vs baseline (p50 / p95 / throughput):")
+    for target, routes in results["results"].items():
+        for route, stats in routes.items():
+            base = baseline["results"].get(target, {}).get(route)
+            if not base or not base.get("requests") or not stats.get("requests"):
+                continue
+            ratios = [
+                stats[key] / base[key] - 1
+                for key in ["p50_ms", "p95_ms", "throughput_rps"]
+            ]
+            print(
+                f"  {target:>9} {route:>16}: "
+                + " / ".join(f"{ratio:+.1%}" for ratio in ratios)
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--postgres", choices=["docker", "pg_ctl", "env"], default="docker"
+    )
+    parser.add_argument("--no-seed", action="store_true", help="reuse seeded rows")
+    parser.add_argument("--aois", type=int, default=1000)
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2022, 1, 1))
+    parser.add_argument("--end", type=date.fromisoformat, default=date(2022, 12, 31))
+    parser.add_argument("--every", type=int, default=1, help="days between events")
+    parser.add_argument("--assets", type=int, default=5000)
+    parser.add_argument("--companies", type=int, default=500)
+    parser.add_argument(
+        "--targets",
+        nargs="+",
+        choices=["inprocess", "uvicorn"],
+        default=["inprocess", "uvicorn"],
+    )
+    parser.add_argument("--routes", nargs="+", default=None)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--compare", default=None, help="earlier results JSON")
+    parser.add_argument(
+        "--rate-limit",
+        action="store_true",
+        help="turn per-user rate limiting on; the single bench user mostly gets 429s",
+    )
+    args = parser.parse_args()
+
+    os.environ.setdefault("SERVER_SECRET", "loadtest-secret")
+    os.environ.setdefault("SERVER_ALGORITHM", "HS256")
+    # set before the app is imported, here and in the uvicorn workers
+    os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "120" if args.rate_limit else "0")
+
+    with local_postgres(args.postgres):
+        if args.postgres != "env":
+            migrate()
+
+        if args.no_seed:
+            engine = create_engine(db_url())
+            with engine.connect() as conn:
+                ids = {
+                    "aoi_ids": conn.execute(
+                        text("SELECT id FROM aois WHERE properties @> :tag"),
+                        {"tag": '{"synthetic": true}'},
+                    )
+                    .scalars()
+                    .all()
+                }
+            engine.dispose()
+        else:
+            ids = seed(args)
+
+        routes = route_requests(ids, args)
+        if args.routes is not None:
+            routes = {name: routes[name] for name in args.routes}
+
+        results = {}
+        if "inprocess" in args.targets:
+            print("in-process:")
+            results["inprocess"] = asyncio.run(run_inprocess(routes, args))
+        if "uvicorn" in args.targets:
+            print(f"uvicorn ({args.workers} workers):")
+            with uvicorn_server(args.workers) as base_url:
+                results["uvicorn"] = asyncio.run(run_uvicorn(routes, args, base_url))
+
+    report = dict(
+        meta=dict(
+            commit=git_commit(),
+            timestamp=datetime.now(timezone.utc).isoformat(),
+            python=platform.python_version(),
+            postgres=args.postgres,
+            scale=dict(
+                aois=args.aois,
+                start=args.start.isoformat(),
+                end=args.end.isoformat(),
+                every=args.every,
+                assets=args.assets,
+                companies=args.companies,
+            ),
+            requests=args.requests,
+            concurrency=args.concurrency,
+            workers=args.workers,
+            seed=args.seed,
+        ),
+        results=results,
+    )
+
+    out = args.out or f"loadtest_{report['meta']['commit'] or 'results'}.json"
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nwrote {out}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Create `events` partitions ahead of time. Run from cron, e.g. monthly.
+
+    python bin/create_event_partitions.py --ahead 2 --interval year
+"""
+import argparse
+from datetime import date
+
+from oxeo.api.models import database, partitions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--interval", choices=partitions.VALID_INTERVALS, default="year"
+    )
+    parser.add_argument(
+        "--ahead", type=int, default=2, help="number of intervals to create ahead"
+    )
+    parser.add_argument("--start", type=date.fromisoformat, default=date.today())
+    args = parser.parse_args()
+
+    end = args.start
+    for _ in range(args.ahead):
+        end = partitions.next_partition_start(
+            partitions.partition_start(end, args.interval), args.interval
+        )
+
+    with database.engine.begin() as conn:
+        created = partitions.ensure_event_partitions(
+            conn, args.start, end, args.interval
+        )
+
+    print(f"created {len(created)} partitions: {created}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Run pending export jobs. The API only records them, unless EXPORT_INLINE=1.
+
+    python bin/export_worker.py --poll 5
+"""
+import argparse
+import time
+
+from oxeo.api.controllers import export
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--poll", type=float, default=5, help="seconds between checks when idle"
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="exit once no jobs are pending"
+    )
+    args = parser.parse_args()
+
+    while True:
+        if export.run_pending_export():
+            continue
+        if args.once:
+            break
+        time.sleep(args.poll)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,10 @@ token = json.loads(r.text)["access_token"]
 
 headers = {"Authorization": f"Bearer {token}"}
 
+# posted as FeatureCollections of this many features
+CHUNK = 1000
+
+features = []
 for feature in gdf.iterfeatures():
     feature["properties"]["labels"] = "agricultural_area"
 
@@ -30,8 +34,15 @@ for feature in gdf.iterfeatures():
     if random.random() > 0.5:
         feature["properties"]["crop"] = random.choice(["maize", "soy"])
 
-    itemurl = "http://0.0.0.0:8081/aoi/"
-    r = requests.post(itemurl, headers=headers, json=feature)
+    features.append(feature)
+
+itemurl = "http://0.0.0.0:8081/aoi/"
+for start in range(0, len(features), CHUNK):
+    collection = {
+        "type": "FeatureCollection",
+        "features": features[start : start + CHUNK],  # noqa
+    }
+    r = requests.post(itemurl, headers=headers, json=collection)
 
     print(r.status_code)
     print(r.text)
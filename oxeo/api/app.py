@@ -4,8 +4,10 @@ from fastapi.responses import RedirectResponse
 from loguru import logger
 from mangum import Mangum
 
-from oxeo.api import routes
+from oxeo.api import compression, querylog, routes
 from oxeo.api.description import description
+from oxeo.api.models import database
+from oxeo.api.responses import ORJSONResponse
 
 tags_metadata = [
     {
@@ -28,12 +30,25 @@ tags_metadata = [
         "name": "Companies",
         "description": "Ultimate owners of assets.",
     },
+    {
+        "name": "Batch",
+        "description": "Several read queries in one round trip.",
+    },
+    {
+        "name": "Exports",
+        "description": "Whole query results as files, built in the background.",
+    },
+    {
+        "name": "Sync",
+        "description": "Incremental change feeds for mirroring AOIs, events and assets.",
+    },
 ]
 
 app = FastAPI(
     title="Oxford Earth Observation - API",
     description=description,
     openapi_tags=tags_metadata,
+    default_response_class=ORJSONResponse,
 )
 
 origins = [
@@ -50,6 +65,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(compression.CompressionMiddleware)
+
+# opt-in, see querylog.py
+querylog.install_from_env(app, database.engine)
+
 app.include_router(routes.router)
 
 
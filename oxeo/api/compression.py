@@ -0,0 +1,226 @@
+"""Response compression negotiated from `Accept-Encoding`.
+
+gzip is always available; Brotli and zstd are used when the optional `brotli`
+and `zstandard` packages are installed. Streaming bodies are compressed chunk by
+chunk as they are sent. Every response of a compressible content type carries
+`Vary: Accept-Encoding`, whether or not it was compressed, so caches keep the
+encodings apart.
+
+On Lambda, Mangum base64-encodes any body that isn't valid UTF-8, which covers
+compressed ones; a compressed body that happens to decode is passed on as the
+same bytes.
+"""
+import zlib
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# responses smaller than this are sent as-is
+MINIMUM_SIZE = 1000
+
+# server preference, used to break ties between equal q-values
+PREFERENCE = ["br", "zstd", "gzip"]
+
+COMPRESSED_CONTENT_TYPES = ["image/", "video/", "audio/", "application/zip"]
+
+
+def compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "")
+    return not any(content_type.startswith(t) for t in COMPRESSED_CONTENT_TYPES)
+
+
+def add_vary(message: Message):
+    """Add `Vary: Accept-Encoding` to a response start message, if compressible"""
+
+    headers = MutableHeaders(raw=message.setdefault("headers", []))
+    if compressible(headers):
+        headers.add_vary_header("Accept-Encoding")
+
+
+class _GZip:
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=5)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encoders() -> Dict[str, type]:
+    encoders = {"gzip": _GZip}
+    if brotli is not None:
+        encoders["br"] = _Brotli
+    if zstandard is not None:
+        encoders["zstd"] = _Zstd
+    return encoders
+
+
+def negotiate(accept_encoding: str, encoders: Dict[str, type]) -> Optional[str]:
+    """The coding to use for an `Accept-Encoding` header, or None for identity"""
+
+    qvalues = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        qvalues[coding.lower()] = q
+
+    candidates = [
+        (qvalues.get(coding, qvalues.get("*", 0.0)), -PREFERENCE.index(coding), coding)
+        for coding in PREFERENCE
+        if coding in encoders
+    ]
+    candidates = [c for c in candidates if c[0] > 0]
+
+    if not candidates:
+        return None
+    return max(candidates)[2]
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = MINIMUM_SIZE) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoders = available_encoders()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            coding = negotiate(headers.get("Accept-Encoding", ""), self.encoders)
+            if coding is not None:
+                responder = CompressionResponder(
+                    self.app, coding, self.encoders[coding], self.minimum_size
+                )
+                await responder(scope, receive, send)
+                return
+
+            async def send_with_vary(message: Message):
+                if message["type"] == "http.response.start":
+                    add_vary(message)
+                await send(message)
+
+            await self.app(scope, receive, send_with_vary)
+            return
+
+        await self.app(scope, receive, send)
+
+
+class CompressionResponder:
+    def __init__(self, app: ASGIApp, coding: str, encoder, minimum_size: int):
+        self.app = app
+        self.coding = coding
+        self.encoder = encoder
+        self.minimum_size = minimum_size
+        self.send: Send = None
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.compressor = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def set_headers(self, content_length: Optional[int] = None):
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        headers["Content-Encoding"] = self.coding
+        if content_length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(content_length)
+        add_vary(self.initial_message)
+
+    async def send_compressed(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # hold the headers back until the first body chunk decides the encoding
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = "content-encoding" in headers or not compressible(
+                headers
+            )
+            return
+
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if not self.started:
+            self.started = True
+
+            if self.passthrough or (len(body) < self.minimum_size and not more_body):
+                self.passthrough = True
+                add_vary(self.initial_message)
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+
+            self.compressor = self.encoder()
+
+            if not more_body:
+                message["body"] = (
+                    self.compressor.compress(body) + self.compressor.finish()
+                )
+                self.set_headers(len(message["body"]))
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+
+            # streaming: the compressed length isn't known up front
+            self.set_headers()
+            await self.send(self.initial_message)
+
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        data = self.compressor.compress(body)
+        if not more_body:
+            data += self.compressor.finish()
+        await self.send(
+            {"type": "http.response.body", "body": data, "more_body": more_body}
+        )
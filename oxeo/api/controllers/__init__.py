@@ -1,5 +1,5 @@
 from . import asset
 from . import authentication as auth
-from . import geom
+from . import batch, export, geom, planner, repair, sync
 
-__all__ = ["geom", "asset", "auth"]
+__all__ = ["geom", "asset", "auth", "batch", "export", "planner", "repair", "sync"]
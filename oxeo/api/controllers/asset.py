@@ -1,17 +1,28 @@
-from typing import List
+from functools import partial
+from typing import List, Optional
 
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import exists, func
+from sqlalchemy.orm import Session, defer
 from sqlalchemy.sql import or_
 
 from oxeo.api.controllers.geom import (
+    STREAM_MIN_LIMIT,
+    check_precision,
     enforce_list,
+    ewkb_hash,
+    filter_keyed_values,
+    geojson_geometry,
     geom2pg,
+    geometry_hash,
     pg2gj,
-    pg2shapely,
     schema2shp,
+    shp2ewkb,
 )
+from oxeo.api.controllers.planner import count_query
 from oxeo.api.models import database, schemas
+from oxeo.api.models.rows import CompanyRow, FeatureRow
+from oxeo.api.responses import STREAM_BATCH_SIZE, StreamedPage
 
 
 def check_not_id(asset):
@@ -47,21 +58,27 @@ def get_company_weights(db_assets_list: List[database.Asset], db: Session):
     return links
 
 
-def _postprocess_asset(asset: database.Asset, company_weight: dict) -> schemas.Feature:
+def _postprocess_asset(asset, company_weight: dict) -> FeatureRow:
 
-    properties = asset.properties
+    # copy, so ORM entities passed in here aren't dirtied
+    properties = dict(asset.properties or {})
     properties["labels"] = asset.labels
     properties["name"] = asset.name
     properties["company_weights"] = company_weight
-    geometry = schemas.Geometry(**pg2gj(asset.geometry))
 
-    return schemas.Feature(
-        type="Feature", geometry=geometry, properties=properties, id=asset.id
+    return FeatureRow(
+        type="Feature",
+        geometry=pg2gj(asset.geometry),
+        properties=properties,
+        id=str(asset.id),
     )
 
 
 def postprocess_assets(
-    db_assets_list: List[database.Asset], company_weights: dict, next_page: int
+    db_assets_list: List[database.Asset],
+    company_weights: dict,
+    next_page: int,
+    total: Optional[int] = None,
 ):
 
     """
@@ -72,39 +89,28 @@ def postprocess_assets(
         _postprocess_asset(asset, company_weights[asset.id]) for asset in db_assets_list
     ]
 
-    return schemas.FeatureCollection(
+    return schemas.FeatureCollection.construct(
         type="FeatureCollection",
         features=features,
-        properties={"next_page": next_page},
+        properties={"next_page": next_page, "total": total},
     )
 
 
-def get_assets(
-    asset_query: schemas.AssetQuery,
-    db: Session,
-    user: schemas.User,
+def postprocess_asset_rows(
+    rows, next_page: int, db: Session, total: Optional[int] = None
 ):
-    # db.query(database.Item).offset(skip).limit(limit).all()
-    if asset_query.limit is not None and asset_query.limit > 1000:
-        raise HTTPException(
-            status_code=400,
-            detail=f"query limit '{asset_query.limit}', max Asset limit is 1000.",
-        )
+    """`postprocess_assets` for column rows, looking up their company weights"""
 
-    # set the page and limit if none
-    if asset_query.page is None:
-        asset_query.page = 0
-    if asset_query.limit is None:
-        asset_query.limit = 10000
+    company_weights = get_company_weights(db_assets_list=rows, db=db) if rows else {}
 
-    Q = db.query(database.Asset)
+    return postprocess_assets(rows, company_weights, next_page, total)
 
-    # if single aoi_id is given, wrap it in list
-    if isinstance(asset_query.id, int):
-        asset_query.id = [asset_query.id]
+
+def filter_assets(Q, asset_query: schemas.AssetQuery):
+    """Apply the AssetQuery filters to `Q`"""
 
     if asset_query.id is not None:
-        Q = Q.filter(database.Asset.id.in_(tuple(asset_query.id)))
+        Q = Q.filter(database.Asset.id.in_(tuple(enforce_list(asset_query.id))))
 
     # do geometry if it's available
     if asset_query.geometry is not None:
@@ -114,6 +120,17 @@ def get_assets(
             )
         )
 
+    # do aoi containment if it's available
+    if asset_query.aoi_id is not None:
+        Q = Q.filter(
+            exists().where(
+                database.AOISubdivision.aoi_id.in_(
+                    tuple(enforce_list(asset_query.aoi_id))
+                ),
+                database.AOISubdivision.geometry.ST_Intersects(database.Asset.geometry),
+            )
+        )
+
     # do company name if it's available
     if asset_query.company_name is not None:
         Q = Q.where(database.Company.name == asset_query.company_name)
@@ -130,15 +147,67 @@ def get_assets(
 
     # do key-value pairs
     if asset_query.keyed_values is not None:
-        for key, value in asset_query.keyed_values.items():
-            if value is not None:
-                Q = Q.filter(database.Asset.properties[key].as_string() == value)
-            else:
-                Q = Q.filter(database.Asset.properties.has_key(key))  # noqa
+        Q = filter_keyed_values(Q, database.Asset.properties, asset_query.keyed_values)
+
+    return Q
+
+
+def get_assets(
+    asset_query: schemas.AssetQuery,
+    db: Session,
+    user: schemas.User,
+):
+    # db.query(database.Item).offset(skip).limit(limit).all()
+    if asset_query.limit is not None and asset_query.limit > 1000:
+        raise HTTPException(
+            status_code=400,
+            detail=f"query limit '{asset_query.limit}', max Asset limit is 1000.",
+        )
+
+    # set the page and limit if none
+    if asset_query.page is None:
+        asset_query.page = 0
+    if asset_query.limit is None:
+        asset_query.limit = 10000
+
+    check_precision(asset_query.precision)
+
+    Q = db.query(database.Asset)
+
+    # if single aoi_id is given, wrap it in list
+    if isinstance(asset_query.id, int):
+        asset_query.id = [asset_query.id]
+
+    Q = filter_assets(Q, asset_query)
 
-    # do pagination
+    total = count_query(db, Q, database.Asset.id, asset_query.count)
+
+    # do pagination, on a stable order so pages don't overlap
+    Q = Q.order_by(database.Asset.id)
     Q = Q.offset(asset_query.page * asset_query.limit).limit(asset_query.limit + 1)
 
+    geom_expr = database.Asset.geometry
+    if asset_query.precision is not None:
+        geom_expr = geojson_geometry(geom_expr, asset_query.precision)
+
+    # plain column tuples, no ORM entities
+    Q = Q.with_entities(
+        database.Asset.id,
+        database.Asset.name,
+        database.Asset.labels,
+        database.Asset.properties,
+        geom_expr.label("geometry"),
+    )
+
+    if asset_query.limit >= STREAM_MIN_LIMIT:
+        return StreamedPage(
+            Q.yield_per(STREAM_BATCH_SIZE),
+            asset_query.limit,
+            asset_query.page,
+            partial(postprocess_asset_rows, db=db, total=total),
+            "features",
+        )
+
     results = Q.all()
     if len(results) > asset_query.limit:
         next_page = asset_query.page + 1
@@ -147,13 +216,22 @@ def get_assets(
 
     results = results[0 : asset_query.limit]  # noqa
 
-    company_weights = get_company_weights(db_assets_list=results, db=db)
-
-    return postprocess_assets(results, company_weights, next_page)
+    return postprocess_asset_rows(results, next_page, db, total)
 
 
 def update_asset(asset: schemas.Asset, db: Session, user: schemas.User):
-    db_asset = db.query(database.Asset).filter(database.Asset.id == asset.id).first()
+    shp = schema2shp(asset.geometry, allowed_types=["Point"])
+
+    # the stored geometry is compared by hash, not loaded
+    row = (
+        db.query(database.Asset, geometry_hash(database.Asset.geometry))
+        .options(defer(database.Asset.geometry))
+        .filter(database.Asset.id == asset.id)
+        .first()
+    )
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Asset {asset.id} not found.")
+    db_asset, stored_hash = row
 
     # recreate company_weights
     company_name_keys = {company.id: company.name for company in db_asset.companies}
@@ -175,12 +253,9 @@ def update_asset(asset: schemas.Asset, db: Session, user: schemas.User):
         db_asset.properties = asset.properties
 
     # check geometry
-    if pg2shapely(db_asset.geometry) != schema2shp(
-        asset.geometry, allowed_types=["Point"]
-    ):
-        db_asset.geometry = schema2shp(
-            asset.geometry, allowed_types=["Polygon", "MultiPolygon"]
-        ).wkt
+    ewkb = shp2ewkb(shp)
+    if stored_hash != ewkb_hash(ewkb):
+        db_asset.geometry = ewkb
 
     # commit here before continuing to relationships
     db.commit()
@@ -222,6 +297,9 @@ def update_asset(asset: schemas.Asset, db: Session, user: schemas.User):
             link = Q.first()
             link.equity = asset.company_weights[company_name]
 
+        # link changes don't touch the asset row, so flag it for change feeds
+        db_asset.updated_at = func.now()
+
         db.commit()
         db.refresh(db_asset)
 
@@ -284,7 +362,9 @@ def get_companies(company_query: schemas.CompanyQuery, db: Session, user: schema
     if company_query.limit is None:
         company_query.limit = 1000
 
-    Q = db.query(database.Company)
+    Q = db.query(
+        database.Company.id, database.Company.name, database.Company.properties
+    )
 
     # if single id is given, wrap it in list
     if isinstance(company_query.id, int):
@@ -299,13 +379,14 @@ def get_companies(company_query: schemas.CompanyQuery, db: Session, user: schema
 
     # do key-value pairs
     if company_query.keyed_values is not None:
-        for key, value in company_query.keyed_values.items():
-            if value is not None:
-                Q = Q.filter(database.Company.properties[key].as_string() == value)
-            else:
-                Q = Q.filter(database.Company.properties.has_key(key))  # noqa
+        Q = filter_keyed_values(
+            Q, database.Company.properties, company_query.keyed_values
+        )
 
-    # do pagination
+    total = count_query(db, Q, database.Company.id, company_query.count)
+
+    # do pagination, on a stable order so pages don't overlap
+    Q = Q.order_by(database.Company.id)
     Q = Q.offset(company_query.page * company_query.limit).limit(
         company_query.limit + 1
     )
@@ -316,21 +397,24 @@ def get_companies(company_query: schemas.CompanyQuery, db: Session, user: schema
     else:
         next_page = None
 
-    return postprocess_companies(results[0 : company_query.limit], next_page)  # noqa
+    return postprocess_companies(
+        results[0 : company_query.limit], next_page, total  # noqa
+    )
 
 
-def _postprocess_company(db_company):
-    return schemas.Company(
+def _postprocess_company(db_company) -> CompanyRow:
+    return CompanyRow(
         id=db_company.id,
         name=db_company.name,
         properties=db_company.properties,
     )
 
 
-def postprocess_companies(db_companies: List[database.Company], next_page):
+def postprocess_companies(db_companies: List[database.Company], next_page, total=None):
     return dict(
         companies=[_postprocess_company(db_company) for db_company in db_companies],
         next_page=next_page,
+        total=total,
     )
 
 
@@ -369,7 +453,7 @@ def create_asset(asset: schemas.AssetCreate, db: Session, user: schemas.User):
 
     # create asset
     db_asset = database.Asset(
-        geometry=schema2shp(asset.geometry, allowed_types=["Point"]).wkt,
+        geometry=shp2ewkb(schema2shp(asset.geometry, allowed_types=["Point"])),
         name=asset.name,
         labels=enforce_list(asset.labels),
         properties=asset.properties,
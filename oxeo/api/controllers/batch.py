@@ -0,0 +1,74 @@
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from oxeo.api.controllers import asset, geom
+from oxeo.api.models import schemas
+
+# resource -> (query model, controller)
+BATCH_RESOURCES = {
+    "aoi": (schemas.AOIQuery, geom.get_aoi),
+    "events": (schemas.EventQuery, geom.get_events),
+    "assets": (schemas.AssetQuery, asset.get_assets),
+    "companies": (schemas.CompanyQuery, asset.get_companies),
+}
+
+BATCH_MAX_QUERIES = 10
+
+
+def parse_batch_query(name: str, batch_query: schemas.BatchQuery):
+    if batch_query.resource not in BATCH_RESOURCES:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Query '{name}': 'resource' must be one of "
+                f"{list(BATCH_RESOURCES.keys())}."
+            ),
+        )
+
+    model, _ = BATCH_RESOURCES[batch_query.resource]
+
+    try:
+        query = model(**batch_query.query)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Query '{name}': {e}")
+
+    # binary responses can't be embedded in the combined JSON body
+    if batch_query.resource == "aoi" and query.format == "geobuf":
+        raise HTTPException(
+            status_code=400,
+            detail=f"Query '{name}': format 'geobuf' is not supported in a batch.",
+        )
+
+    return query
+
+
+def run_batch(batch: schemas.BatchRequest, db: Session, user: schemas.User):
+    """Run every named sub-query on one session, returning results by name.
+
+    All sub-queries are validated before any of them runs; the first error
+    fails the whole batch.
+    """
+
+    if len(batch.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{len(batch.queries)} queries, max batch size is {BATCH_MAX_QUERIES}.",
+        )
+
+    queries = {
+        name: parse_batch_query(name, batch_query)
+        for name, batch_query in batch.queries.items()
+    }
+
+    results = {}
+    for name, query in queries.items():
+        _, controller = BATCH_RESOURCES[batch.queries[name].resource]
+        try:
+            results[name] = controller(query, db, user)
+        except HTTPException as e:
+            raise HTTPException(
+                status_code=e.status_code, detail=f"Query '{name}': {e.detail}"
+            )
+
+    return results
@@ -0,0 +1,451 @@
+"""Asynchronous exports of whole AOI, event and asset query results.
+
+A job is recorded in `export_jobs` and run by `bin/export_worker.py`. For
+local development, `EXPORT_INLINE=1` runs it in the API process once the
+response is sent instead. Rows are read through a server-side cursor,
+EXPORT_BATCH_SIZE at a time, and written to a compressed file in the store at
+`EXPORT_STORE`: a `file://` directory or an `s3://bucket/prefix`.
+
+On Lambda an invocation stays open until its background tasks finish and
+`/tmp` belongs to one container, so inline mode is ignored there and exports
+are refused unless `EXPORT_STORE` is on S3.
+
+Formats are gzipped NDJSON (GeoJSON features for AOIs and assets) and
+zstd-compressed Parquet (GeoParquet, with WKB geometries, for AOIs and assets).
+Parquet needs the optional `pyarrow` package.
+"""
+import gzip
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+from urllib.parse import urlparse
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, RedirectResponse
+from pydantic import ValidationError
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from oxeo.api.controllers.asset import filter_assets
+from oxeo.api.controllers.geom import (
+    EVENT_COLUMNS,
+    MAX_PRECISION,
+    aoi_geometry,
+    check_precision,
+    enforce_list,
+    filter_aois,
+    filter_events,
+    geojson_geometry,
+    geom2pg,
+)
+from oxeo.api.models import database, schemas
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+EXPORT_STORE = os.environ.get("EXPORT_STORE", "file:///tmp/oxeo-exports")
+ON_LAMBDA = "AWS_LAMBDA_FUNCTION_NAME" in os.environ
+EXPORT_INLINE = os.environ.get("EXPORT_INLINE", "0") == "1" and not ON_LAMBDA
+
+# rows fetched per round trip, and per Parquet row group
+EXPORT_BATCH_SIZE = 5000
+
+# resource -> query model
+EXPORT_RESOURCES = {
+    "aoi": schemas.AOIQuery,
+    "events": schemas.EventQuery,
+    "assets": schemas.AssetQuery,
+}
+
+EXPORT_FORMATS = {
+    "ndjson": ".ndjson.gz",
+    "parquet": ".parquet",
+}
+
+GEOMETRY_TYPES = {"aoi": ["MultiPolygon"], "assets": ["Point"]}
+
+
+class LocalStore:
+    """Export files in a local directory"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def put(self, key: str, filename: str):
+        os.makedirs(self.root, exist_ok=True)
+        shutil.move(filename, self.path(key))
+
+    def response(self, key: str):
+        return FileResponse(self.path(key), filename=key)
+
+
+class S3Store:
+    """Export files under an S3 prefix, downloaded through presigned URLs"""
+
+    def __init__(self, bucket: str, prefix: str):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3")
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, key: str, filename: str):
+        self.client.upload_file(filename, self.bucket, self.object_key(key))
+        os.remove(filename)
+
+    def response(self, key: str):
+        url = self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self.object_key(key)},
+            ExpiresIn=3600,
+        )
+        return RedirectResponse(url)
+
+
+def get_store(url: Optional[str] = None):
+    url = urlparse(url or EXPORT_STORE)
+    if url.scheme == "s3":
+        return S3Store(url.netloc, url.path)
+    if url.scheme in ("", "file"):
+        return LocalStore(url.path)
+    raise ValueError(f"Unsupported export store: {url.geturl()}")
+
+
+def parse_export(export: schemas.ExportCreate):
+    """The validated query model for `export`"""
+
+    if export.resource not in EXPORT_RESOURCES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"'resource' must be one of {list(EXPORT_RESOURCES.keys())}.",
+        )
+
+    if export.format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"'format' must be one of {list(EXPORT_FORMATS.keys())}.",
+        )
+
+    if export.format == "parquet" and pyarrow is None:
+        raise HTTPException(
+            status_code=400,
+            detail="format 'parquet' is not available on this server.",
+        )
+
+    try:
+        query = EXPORT_RESOURCES[export.resource](**export.query)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"'query': {e}")
+
+    check_precision(getattr(query, "precision", None))
+
+    if export.resource == "aoi" and query.clip and query.geometry is None:
+        raise HTTPException(
+            status_code=400,
+            detail="'clip' requires a 'geometry' to clip to.",
+        )
+
+    return query
+
+
+def _geometry(geom_expr, output_format: str, precision: Optional[int]):
+    if output_format == "parquet":
+        return func.ST_AsBinary(geom_expr)
+    return geojson_geometry(
+        geom_expr, MAX_PRECISION if precision is None else precision
+    )
+
+
+def export_query(db: Session, resource: str, query, output_format: str):
+    """A column Query for every row matching `query`, pagination ignored"""
+
+    if resource == "aoi":
+        query_geom = None
+        if query.geometry is not None:
+            query_geom = geom2pg(
+                query.geometry, allowed_types=["Polygon", "MultiPolygon"]
+            )
+        Q = db.query(
+            database.AOI.id,
+            database.AOI.labels,
+            database.AOI.properties,
+            _geometry(
+                aoi_geometry(query, query_geom), output_format, query.precision
+            ).label("geometry"),
+        )
+        if query.id is not None:
+            Q = Q.filter(database.AOI.id.in_(tuple(enforce_list(query.id))))
+        return filter_aois(Q, query, query_geom).order_by(database.AOI.id)
+
+    if resource == "events":
+        Q = db.query(*EVENT_COLUMNS).filter(
+            database.Event.aoi_id.in_(tuple(enforce_list(query.aoi_id)))
+        )
+        if isinstance(query.id, int):
+            query.id = [query.id]
+        return filter_events(Q, query).order_by(
+            database.Event.aoi_id, database.Event.datetime, database.Event.id
+        )
+
+    Q = db.query(
+        database.Asset.id,
+        database.Asset.name,
+        database.Asset.labels,
+        database.Asset.properties,
+        _geometry(database.Asset.geometry, output_format, query.precision).label(
+            "geometry"
+        ),
+    )
+    return filter_assets(Q, query).order_by(database.Asset.id)
+
+
+def _feature_line(row) -> bytes:
+    # properties as in the GET routes' features; company weights aren't exported
+    properties = dict(row.properties or {})
+    properties["labels"] = row.labels
+    if hasattr(row, "name"):
+        properties["name"] = row.name
+    else:
+        properties["aoi_id"] = row.id
+
+    # the geometry is already GeoJSON text, from ST_AsGeoJSON
+    return (
+        b'{"type":"Feature","geometry":'
+        + (row.geometry or "null").encode()
+        + b',"properties":'
+        + orjson.dumps(properties)
+        + b',"id":"'
+        + str(row.id).encode()
+        + b'"}\n'
+    )
+
+
+def _event_line(row) -> bytes:
+    event = dict(
+        id=row.id,
+        labels=row.labels,
+        aoi_id=row.aoi_id,
+        datetime=row.datetime,
+        keyed_values=row.properties,
+    )
+    return orjson.dumps(event) + b"\n"
+
+
+def write_ndjson(rows: Iterable, resource: str, filename: str) -> int:
+    line = _event_line if resource == "events" else _feature_line
+
+    n_rows = 0
+    with gzip.open(filename, "wb") as f:
+        for row in rows:
+            f.write(line(row))
+            n_rows += 1
+
+    return n_rows
+
+
+def _parquet_schema(resource: str):
+    pa = pyarrow
+    labels = pa.list_(pa.string())
+
+    if resource == "events":
+        return pa.schema(
+            [
+                ("id", pa.int64()),
+                ("labels", labels),
+                ("aoi_id", pa.int64()),
+                ("datetime", pa.date32()),
+                ("keyed_values", pa.string()),
+            ]
+        )
+
+    fields = [("id", pa.int64())]
+    if resource == "assets":
+        fields.append(("name", pa.string()))
+    fields += [
+        ("labels", labels),
+        ("properties", pa.string()),
+        ("geometry", pa.binary()),
+    ]
+
+    # GeoParquet; no "crs" means OGC:CRS84, i.e. EPSG:4326 in lon/lat order
+    geo = {
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        "columns": {
+            "geometry": {
+                "encoding": "WKB",
+                "geometry_types": GEOMETRY_TYPES[resource],
+            }
+        },
+    }
+
+    return pa.schema(fields, metadata={b"geo": orjson.dumps(geo)})
+
+
+def _parquet_columns(rows: List, schema) -> dict:
+    columns = {}
+    for name in schema.names:
+        source = "properties" if name == "keyed_values" else name
+        values = [getattr(row, source) for row in rows]
+        if source == "properties":
+            values = [orjson.dumps(v).decode() for v in values]
+        elif source == "geometry":
+            values = [bytes(v) if v is not None else None for v in values]
+        columns[name] = values
+    return columns
+
+
+def write_parquet(rows: Iterable, resource: str, filename: str) -> int:
+    schema = _parquet_schema(resource)
+
+    n_rows = 0
+    rows = iter(rows)
+    with pyarrow.parquet.ParquetWriter(filename, schema, compression="zstd") as w:
+        while True:
+            batch = list(islice(rows, EXPORT_BATCH_SIZE))
+            if not batch:
+                break
+            w.write_table(
+                pyarrow.Table.from_pydict(_parquet_columns(batch, schema), schema)
+            )
+            n_rows += len(batch)
+
+    return n_rows
+
+
+WRITERS = {"ndjson": write_ndjson, "parquet": write_parquet}
+
+
+def create_export(export: schemas.ExportCreate, db: Session, user: schemas.User):
+    if ON_LAMBDA and urlparse(EXPORT_STORE).scheme != "s3":
+        raise HTTPException(
+            status_code=503,
+            detail="Exports need an s3:// EXPORT_STORE on this deployment.",
+        )
+
+    parse_export(export)
+
+    db_job = database.ExportJob(
+        id=uuid.uuid4().hex,
+        user_id=user.id,
+        resource=export.resource,
+        format=export.format,
+        query=export.query,
+        status="pending",
+    )
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+
+    return db_job
+
+
+def get_export(export_id: str, db: Session, user: schemas.User):
+    db_job = db.query(database.ExportJob).filter_by(id=export_id).first()
+
+    if db_job is None or (db_job.user_id != user.id and user.role != "admin"):
+        raise HTTPException(status_code=404, detail=f"Export {export_id} not found.")
+
+    return db_job
+
+
+def download_export(export_id: str, db: Session, user: schemas.User):
+    db_job = get_export(export_id, db, user)
+
+    if db_job.status != "done":
+        raise HTTPException(
+            status_code=409,
+            detail=f"Export {export_id} is {db_job.status}, not done.",
+        )
+
+    return get_store().response(db_job.key)
+
+
+def claim_export(db: Session, export_id: Optional[str] = None):
+    """Mark the oldest pending job (or `export_id`) running and return it.
+
+    Rows are locked with SKIP LOCKED, so concurrent workers never share a job.
+    """
+
+    Q = db.query(database.ExportJob).filter(database.ExportJob.status == "pending")
+    if export_id is not None:
+        Q = Q.filter(database.ExportJob.id == export_id)
+
+    db_job = (
+        Q.order_by(database.ExportJob.created_at)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if db_job is None:
+        return None
+
+    db_job.status = "running"
+    db.commit()
+
+    return db_job
+
+
+def iter_rows(Q) -> Iterator:
+    # psycopg2 streams yield_per queries through a named server-side cursor
+    return iter(Q.yield_per(EXPORT_BATCH_SIZE))
+
+
+def run_export(db: Session, db_job: database.ExportJob, store=None):
+    """Run a claimed job, recording its outcome on the row"""
+
+    store = store or get_store()
+    key = db_job.id + EXPORT_FORMATS[db_job.format]
+
+    try:
+        query = parse_export(
+            schemas.ExportCreate(
+                resource=db_job.resource, format=db_job.format, query=db_job.query
+            )
+        )
+        Q = export_query(db, db_job.resource, query, db_job.format)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, key)
+            n_rows = WRITERS[db_job.format](iter_rows(Q), db_job.resource, filename)
+            store.put(key, filename)
+    except Exception as e:
+        db.rollback()
+        db_job.status = "failed"
+        db_job.error = e.detail if isinstance(e, HTTPException) else str(e)
+    else:
+        db_job.status = "done"
+        db_job.key = key
+        db_job.n_rows = n_rows
+
+    db_job.finished_at = datetime.now(timezone.utc)
+    db.commit()
+
+    return db_job
+
+
+def run_pending_export(export_id: Optional[str] = None) -> bool:
+    """Claim and run one pending job on a new session; False if there was none"""
+
+    db = database.SessionLocal()
+    try:
+        db_job = claim_export(db, export_id)
+        if db_job is None:
+            return False
+        run_export(db, db_job)
+        return True
+    finally:
+        db.close()
@@ -1,16 +1,70 @@
+import hashlib
 import io
-from typing import List, Union
+import json
+from functools import partial
+from typing import List, Optional, Set, Union
 
 import geobuf
+import numpy as np
+import orjson
+import shapely
 from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import StreamingResponse
 from geoalchemy2 import functions as gis_funcs
 from geoalchemy2.shape import from_shape, to_shape
+from pydantic import ValidationError
 from shapely import geometry
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    Integer,
+    any_,
+    bindparam,
+    case,
+    cast,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    true,
+    tuple_,
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, defer
 from sqlalchemy.sql import or_
-
+from sqlalchemy.types import UserDefinedType
+
+from oxeo.api.controllers import repair
+from oxeo.api.controllers.planner import (
+    check_count_mode,
+    check_query_cost,
+    check_query_geometry,
+    count_query,
+)
 from oxeo.api.models import database, schemas
+from oxeo.api.models.rows import EventRow, FeatureRow
+from oxeo.api.responses import STREAM_BATCH_SIZE, StreamedPage
+
+# AOIs with more vertices than this are clipped piecewise from aoi_subdivisions
+CLIP_SUBDIVIDE_VERTICES = 10000
+SUBDIVIDE_MAX_VERTICES = 256
+
+# pages of at least this many rows are streamed from a server-side cursor on
+# the request's session; above the default limits, so default requests aren't.
+# Needs fastapi<0.106, which closes yield dependencies after the response body.
+STREAM_MIN_LIMIT = 5000
+
+# features per bulk AOI request, and per multi-row INSERT
+AOI_BULK_MAX = 10000
+AOI_INSERT_CHUNK = 1000
+
+# decimal places of output coordinates; 15 is the most ST_AsGeoJSON keeps
+MAX_PRECISION = 15
+GEOBUF_PRECISION = 6
+
+# keyed_values comparison operators -> jsonpath operators
+KV_OPERATORS = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<=", "in": None}
 
 
 def geom2pg(geom: schemas.Geometry, allowed_types: List[str]):
@@ -23,10 +77,45 @@ def pg2shapely(pg_geom):
     return to_shape(pg_geom)
 
 
+def shp2ewkb(shapely_geom):
+    """Hex EWKB of `shapely_geom` (or an array of them), for writing"""
+    return shapely.to_wkb(
+        shapely.set_srid(shapely_geom, 4326), hex=True, include_srid=True
+    )
+
+
+def geometry_hash(geom_col):
+    """md5 of `geom_col`'s normalised WKB, computed in PostGIS"""
+    return func.md5(gis_funcs.ST_AsBinary(gis_funcs.ST_Normalize(geom_col), "NDR"))
+
+
+def ewkb_hash(ewkb: str) -> str:
+    """md5 of the normalised WKB of hex `ewkb`, equal to its geometry_hash"""
+    normalised = shapely.normalize(shapely.from_wkb(ewkb))
+    wkb = shapely.to_wkb(normalised, output_dimension=2, byte_order=1)
+    return hashlib.md5(wkb).hexdigest()
+
+
 def pg2gj(pg_geom):
+    # geometries selected through ST_AsGeoJSON are already serialised
+    if isinstance(pg_geom, str):
+        return json.loads(pg_geom)
     return geometry.mapping(to_shape(pg_geom))
 
 
+def check_precision(precision: Optional[int]):
+    if precision is not None and not 0 <= precision <= MAX_PRECISION:
+        raise HTTPException(
+            status_code=400,
+            detail=f"'precision' must be between 0 and {MAX_PRECISION}.",
+        )
+
+
+def geojson_geometry(geom_expr, precision: int):
+    """`geom_expr` as GeoJSON text with `precision` decimal places"""
+    return func.ST_AsGeoJSON(geom_expr, precision)
+
+
 def schema2shp(geom: schemas.Geometry, allowed_types: List[str]):
     shapely_geom = geometry.shape(geom.__dict__)
 
@@ -36,6 +125,15 @@ def schema2shp(geom: schemas.Geometry, allowed_types: List[str]):
             detail=f"Supplied geometry must one of f{allowed_types}.",
         )
 
+    if shapely_geom.type in ("Polygon", "MultiPolygon") and not shapely_geom.is_valid:
+        # repaired once here, rather than per row in SQL
+        shapely_geom = repair.polygonal(shapely.make_valid(shapely_geom))
+        if shapely_geom is None:
+            raise HTTPException(
+                status_code=400, detail="Geometry has no area once made valid."
+            )
+        return shapely_geom
+
     if shapely_geom.type == "Polygon":
         return geometry.MultiPolygon([shapely_geom])
     elif shapely_geom.type == "MultiPolygon":
@@ -49,6 +147,67 @@ def schema2shp(geom: schemas.Geometry, allowed_types: List[str]):
         )
 
 
+class JSONPath(UserDefinedType):
+    def get_col_spec(self, **kw):
+        return "JSONPATH"
+
+
+def filter_keyed_values(Q, properties_col, keyed_values: dict):
+    """Filter `Q` on a JSONB `properties_col` with the keyed_values syntax.
+
+    - {key: None} requires the key to be present.
+    - {key: value} matches the value exactly, type included.
+    - {key: {"gt"|"gte"|"lt"|"lte": value, ...}} compares typed values.
+    - {key: {"in": [value, ...]}} matches any of the values.
+
+    Equality and `in` compile to `@>` containment, which can use the
+    jsonb_path_ops GIN index on properties. Comparisons compile to a `@?`
+    range jsonpath and presence to `?`; neither can use that index, so they
+    only filter rows that something else has narrowed down.
+    """
+
+    for key, value in keyed_values.items():
+        if value is None:
+            Q = Q.filter(properties_col.has_key(key))  # noqa
+        elif isinstance(value, dict) and value and set(value) <= set(KV_OPERATORS):
+            if "in" in value:
+                if not isinstance(value["in"], list) or not value["in"]:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=(
+                            f"keyed_values '{key}': 'in' takes a non-empty list "
+                            + "of values."  # noqa
+                        ),
+                    )
+                Q = Q.filter(
+                    or_(*[properties_col.contains({key: v}) for v in value["in"]])
+                )
+
+            for op, v in value.items():
+                # lists and objects aren't jsonpath literals
+                if op != "in" and not isinstance(v, (str, int, float, bool)):
+                    raise HTTPException(
+                        status_code=400,
+                        detail=(
+                            f"keyed_values '{key}': '{op}' takes a string, "
+                            + "number or boolean."  # noqa
+                        ),
+                    )
+
+            comparisons = [
+                f"@ {KV_OPERATORS[op]} {json.dumps(v)}"
+                for op, v in value.items()
+                if op != "in"
+            ]
+            if comparisons:
+                path = f"$.{json.dumps(key)} ? ({' && '.join(comparisons)})"
+                Q = Q.filter(properties_col.op("@?")(cast(path, JSONPath())))
+        else:
+            Q = Q.filter(properties_col.contains({key: value}))
+
+    return Q
+
+
 def enforce_list(obj):
     if isinstance(obj, list):
         return obj
@@ -56,48 +215,113 @@ def enforce_list(obj):
         return [obj]
 
 
-def check_aoi(aoi: schemas.Feature):
-    """repackage aoi into a {geometry:, properties:} Feature"""
-
-    if aoi.properties is None:
-        aoi.properties = {}
-
-    # if aoi is supplied with an id or bbox update them in properties.
-    if aoi.bbox is not None:
-        aoi.properties["bbox"] = aoi.bbox
+def check_aoi_labels(labels, properties: dict):
+    """The AOI's labels, from `labels` or `properties`, and its other properties"""
 
-    if aoi.labels is None and "labels" not in aoi.properties.keys():
+    if labels is None and "labels" not in properties.keys():
         raise HTTPException(
             status_code=400,
             detail="'labels' required as a keyed value or as a property.",
         )
-    if aoi.labels is not None and "labels" in aoi.properties.keys():
+    if labels is not None and "labels" in properties.keys():
         raise HTTPException(
             status_code=400,
             detail="supply 'labels' required as either a keyed value or as a property.",
         )
-    if aoi.labels is not None:
-        aoi.labels = enforce_list(aoi.labels)
+    if labels is not None:
+        labels = enforce_list(labels)
     else:
-        aoi.labels = enforce_list(aoi.properties["labels"])
-        del aoi.properties["labels"]
+        labels = enforce_list(properties["labels"])
+        del properties["labels"]
 
-    for label in aoi.labels:
+    for label in labels:
         if label not in database.VALID_AOI_LABELS:
             raise HTTPException(
                 status_code=400,
                 detail=f"got label '{label}', must be in {database.VALID_AOI_LABELS}",
             )
 
+    return labels, properties
+
+
+def check_aoi(aoi: schemas.Feature):
+    """repackage aoi into a {geometry:, properties:} Feature"""
+
+    if aoi.properties is None:
+        aoi.properties = {}
+
+    # if aoi is supplied with an id or bbox update them in properties.
+    if aoi.bbox is not None:
+        aoi.properties["bbox"] = aoi.bbox
+
+    aoi.labels, aoi.properties = check_aoi_labels(aoi.labels, aoi.properties)
+
     return aoi
 
 
+def check_aoi_geometries(geometries: list):
+    """Parse, validate and repair GeoJSON AOI geometries in one vectorised pass.
+
+    Returns the geometries as hex EWKB MultiPolygons (None where they failed)
+    and the error for each failed index. See `repair` for what is repaired.
+    """
+
+    geoms = shapely.from_geojson(
+        [orjson.dumps(g) if isinstance(g, dict) else "null" for g in geometries],
+        on_invalid="ignore",
+    )
+    type_ids = shapely.get_type_id(geoms)
+
+    errors = {}
+    for ii in np.flatnonzero(~np.isin(type_ids, [3, 6])):
+        if geoms[ii] is None:
+            errors[ii] = "Geometry could not be parsed. Please submit valid geojson."
+        else:
+            errors[
+                ii
+            ] = f"Geometry must be a Polygon or MultiPolygon, got {geoms[ii].geom_type}."
+
+    # polygons become single-part multipolygons
+    polygons = np.flatnonzero(type_ids == 3)
+    geoms[polygons] = shapely.multipolygons(
+        geoms[polygons], indices=np.arange(len(polygons))
+    )
+
+    polygonal = np.flatnonzero(np.isin(type_ids, [3, 6]))
+    geoms[polygonal] = repair.repair_geometries(geoms[polygonal])
+    for ii in polygonal[shapely.is_missing(geoms[polygonal])]:
+        errors[ii] = "Geometry has no area once made valid."
+
+    ewkb = shp2ewkb(geoms)
+    ewkb[list(errors)] = None
+
+    return list(ewkb), {int(ii): error for ii, error in errors.items()}
+
+
+def aoi_ewkb(geom: schemas.Geometry) -> str:
+    """`geom` repaired for writing, as hex EWKB"""
+
+    ewkb, errors = check_aoi_geometries([geom.dict()])
+    if errors:
+        raise HTTPException(status_code=400, detail=errors[0])
+    return ewkb[0]
+
+
 def update_aoi(db: Session, aoi: schemas.Feature, user: schemas.User):
 
     aoi = check_aoi(aoi)
-
-    # update the db
-    db_aoi = db.query(database.AOI).filter(database.AOI.id == aoi.id).first()
+    ewkb = aoi_ewkb(aoi.geometry)
+
+    # update the db; the stored geometry is compared by hash, not loaded
+    row = (
+        db.query(database.AOI, geometry_hash(database.AOI.geometry))
+        .options(defer(database.AOI.geometry))
+        .filter(database.AOI.id == aoi.id)
+        .first()
+    )
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"AOI {aoi.id} not found.")
+    db_aoi, stored_hash = row
 
     # check labels
     if db_aoi.labels != aoi.labels:
@@ -108,16 +332,13 @@ def update_aoi(db: Session, aoi: schemas.Feature, user: schemas.User):
         db_aoi.properties = aoi.properties
 
     # check geometry
-    if pg2shapely(db_aoi.geometry) != schema2shp(
-        aoi.geometry, allowed_types=["Polygon", "MultiPolygon"]
-    ):
-        db_aoi.geometry = schema2shp(
-            aoi.geometry, allowed_types=["Polygon", "MultiPolygon"]
-        ).wkt
+    if stored_hash != ewkb_hash(ewkb):
+        db_aoi.geometry = ewkb
+        db.flush()
+        sync_aoi_subdivisions(db, [db_aoi.id])
 
-    # commit
+    # commit; not refreshed, so the geometry isn't read back
     db.commit()
-    db.refresh(db_aoi)
 
     return db_aoi
 
@@ -128,42 +349,198 @@ def create_aoi(db: Session, aoi: schemas.Feature, user: schemas.User):
 
     # do stuff here. put that db aoi in the db
     db_aoi = database.AOI(
-        geometry=schema2shp(
-            aoi.geometry, allowed_types=["Polygon", "MultiPolygon"]
-        ).wkt,
+        geometry=aoi_ewkb(aoi.geometry),
         labels=aoi.labels,
         properties=aoi.properties,
     )
 
     db.add(db_aoi)
+    db.flush()
+    sync_aoi_subdivisions(db, [db_aoi.id])
     db.commit()
     db.refresh(db_aoi)
 
     return db_aoi
 
 
-def _postprocess_aoi(aoi: database.AOI) -> schemas.Feature:
+def parse_aoi_body(body: bytes, content_type: str):
+    """A single schemas.Feature, or the features of a FeatureCollection or
+    NDJSON body as dicts. NDJSON lines that don't parse become None."""
+
+    if content_type.startswith("application/x-ndjson"):
+        features = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                features.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                features.append(None)
+        return features
+
+    try:
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Body is not valid JSON.")
+
+    if isinstance(payload, dict) and payload.get("type") == "FeatureCollection":
+        features = payload.get("features")
+        if not isinstance(features, list):
+            raise HTTPException(
+                status_code=400, detail="FeatureCollection 'features' must be a list."
+            )
+        return features
+
+    try:
+        return schemas.Feature.parse_obj(payload)
+    except ValidationError as e:
+        raise RequestValidationError(e.raw_errors)
+
+
+def create_aois(db: Session, features: list, user: schemas.User):
+    """Create AOIs from GeoJSON feature dicts, in one transaction.
+
+    Features that fail validation are skipped and reported by index; the rest
+    are inserted AOI_INSERT_CHUNK at a time with multi-row INSERTs. Returns the
+    new ids (None for skipped features) and the errors.
+    """
+
+    if len(features) > AOI_BULK_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{len(features)} features, max is {AOI_BULK_MAX} per request.",
+        )
+
+    errors = {}
+    rows = {}
+    for ii, feature in enumerate(features):
+        if not isinstance(feature, dict) or feature.get("type") != "Feature":
+            errors[ii] = "Not a GeoJSON Feature."
+            continue
+
+        properties = dict(feature.get("properties") or {})
+        if feature.get("bbox") is not None:
+            properties["bbox"] = feature["bbox"]
+
+        try:
+            labels, properties = check_aoi_labels(feature.get("labels"), properties)
+        except HTTPException as e:
+            errors[ii] = e.detail
+            continue
+
+        rows[ii] = dict(labels=labels, properties=properties)
+
+    ewkb, geometry_errors = check_aoi_geometries(
+        [
+            feature.get("geometry") if ii in rows else None
+            for ii, feature in enumerate(features)
+        ]
+    )
+    for ii, error in geometry_errors.items():
+        errors.setdefault(ii, error)
+
+    valid = [ii for ii in rows if ii not in errors]
+    ids = [None] * len(features)
+
+    for start in range(0, len(valid), AOI_INSERT_CHUNK):
+        chunk = valid[start : start + AOI_INSERT_CHUNK]  # noqa
+        new_ids = db.execute(
+            insert(database.AOI)
+            .values([dict(geometry=ewkb[ii], **rows[ii]) for ii in chunk])
+            .returning(database.AOI.id)
+        ).scalars()
+        for ii, new_id in zip(chunk, new_ids):
+            ids[ii] = new_id
+
+    if valid:
+        sync_aoi_subdivisions(db, [ids[ii] for ii in valid])
+        db.commit()
+
+    return ids, errors
+
+
+def sync_aoi_subdivisions(db: Session, aoi_ids: List[int]):
+    """Rebuild the aoi_subdivisions pieces for `aoi_ids`. Doesn't commit."""
+
+    db.query(database.AOISubdivision).filter(
+        database.AOISubdivision.aoi_id.in_(tuple(aoi_ids))
+    ).delete(synchronize_session=False)
+
+    pieces = select(
+        database.AOI.id,
+        gis_funcs.ST_Subdivide(database.AOI.geometry, SUBDIVIDE_MAX_VERTICES),
+    ).where(database.AOI.id.in_(tuple(aoi_ids)))
+
+    db.execute(
+        insert(database.AOISubdivision).from_select(["aoi_id", "geometry"], pieces)
+    )
+
+
+def intersects_aoi_subdivisions(aoi_id_col, geom):
+    """Filter on `aoi_id_col` having a subdivided piece intersecting `geom`"""
+
+    return aoi_id_col.in_(
+        select(database.AOISubdivision.aoi_id).where(
+            database.AOISubdivision.geometry.ST_Intersects(geom)
+        )
+    )
+
+
+def clip_geometry(geom_col, clip_geom):
+    """Intersect `geom_col` with `clip_geom`, returning polygonal output.
+
+    Geometries already covered by `clip_geom` are passed through untouched.
+    Geometries above CLIP_SUBDIVIDE_VERTICES are intersected piecewise from
+    aoi_subdivisions, so only the pieces that actually touch `clip_geom` are cut.
+    """
+
+    pieces = database.AOISubdivision.geometry
+    subdivided = (
+        select(gis_funcs.ST_Union(gis_funcs.ST_Intersection(pieces, clip_geom)))
+        .where(database.AOISubdivision.aoi_id == database.AOI.id)
+        .where(pieces.ST_Intersects(clip_geom))
+        .scalar_subquery()
+    )
+
+    clipped = case(
+        (gis_funcs.ST_CoveredBy(geom_col, clip_geom), geom_col),
+        (gis_funcs.ST_NPoints(geom_col) > CLIP_SUBDIVIDE_VERTICES, subdivided),
+        else_=gis_funcs.ST_Intersection(geom_col, clip_geom),
+    )
 
-    properties = aoi.properties
+    # intersections can return lower-dimension slivers; keep the polygons only
+    return gis_funcs.ST_Multi(gis_funcs.ST_CollectionExtract(clipped, 3))
+
+
+def _postprocess_aoi(aoi) -> FeatureRow:
+
+    # copy, so ORM entities passed in here aren't dirtied
+    properties = dict(aoi.properties or {})
     properties["labels"] = aoi.labels
     properties["aoi_id"] = aoi.id
-    geometry = schemas.Geometry(**pg2gj(aoi.geometry))
 
-    return schemas.Feature(
-        type="Feature", geometry=geometry, properties=properties, id=aoi.id
+    return FeatureRow(
+        type="Feature",
+        geometry=pg2gj(aoi.geometry),
+        properties=properties,
+        id=str(aoi.id),
     )
 
 
 def postprocess_aois(
-    aois: Union[database.AOI, List[database.AOI]], next_page: int, output_format: str
+    aois: Union[database.AOI, List[database.AOI]],
+    next_page: int,
+    output_format: str,
+    total: Optional[int] = None,
+    precision: Optional[int] = None,
 ):
     if not isinstance(aois, list):
         aois = [aois]
 
-    fc = schemas.FeatureCollection(
+    fc = schemas.FeatureCollection.construct(
         type="FeatureCollection",
         features=[_postprocess_aoi(aoi) for aoi in aois],
-        properties={"next_page": next_page},
+        properties={"next_page": next_page, "total": total},
     )
 
     if output_format == "geobuf":
@@ -171,13 +548,57 @@ def postprocess_aois(
         # cast back to dict
         fc = fc.__dict__
         fc["features"] = [ft.to_geojson() for ft in fc["features"]]
-        pbf = geobuf.encode(fc)
+        pbf = geobuf.encode(fc, GEOBUF_PRECISION if precision is None else precision)
 
         return StreamingResponse(io.BytesIO(pbf), media_type="application/octet-stream")
     else:
         return fc
 
 
+def filter_aois(Q, aoi_query: schemas.AOIQuery, query_geom=None):
+    """Apply the non-id AOIQuery filters to `Q`; `query_geom` is the parsed
+    `aoi_query.geometry`"""
+
+    # do labels
+    if aoi_query.labels is not None:
+
+        # OR condition
+        conditions = [
+            database.AOI.labels.contains(f"{{{label}}}") for label in aoi_query.labels
+        ]
+        Q = Q.filter(or_(*conditions))
+        # AND condition
+        # for label in aoi_query.labels:
+        #     Q = Q.filter(database.AOI.labels.contains(f"{{{label}}}"))
+
+    # do geometry if it's available
+    if query_geom is not None:
+        Q = Q.filter(intersects_aoi_subdivisions(database.AOI.id, query_geom))
+
+    # do key-value pairs
+    if aoi_query.keyed_values is not None:
+        Q = filter_keyed_values(Q, database.AOI.properties, aoi_query.keyed_values)
+
+    return Q
+
+
+def aoi_geometry(aoi_query: schemas.AOIQuery, query_geom=None):
+    """The AOI geometry with the query's clip, centroid and simplify applied"""
+
+    # geometry transforms compose in order: clip -> centroid | simplify -> precision
+    geom_expr = database.AOI.geometry
+
+    if aoi_query.clip:
+        geom_expr = clip_geometry(geom_expr, query_geom)
+
+    if aoi_query.centroids:
+        geom_expr = gis_funcs.ST_Centroid(geom_expr)
+    elif aoi_query.simplify is not None:
+        geom_expr = gis_funcs.ST_Simplify(geom_expr, aoi_query.simplify)
+
+    return geom_expr
+
+
 def get_aoi(aoi_query: schemas.AOIQuery, db: Session, user: schemas.User):
 
     # db.query(database.Item).offset(skip).limit(limit).all()
@@ -199,6 +620,8 @@ def get_aoi(aoi_query: schemas.AOIQuery, db: Session, user: schemas.User):
     else:
         aoi_query.format = "GeoJSON"
 
+    check_precision(aoi_query.precision)
+
     # set the page and limit if none
 
     if (
@@ -219,6 +642,12 @@ def get_aoi(aoi_query: schemas.AOIQuery, db: Session, user: schemas.User):
         if aoi_query.limit is None:
             aoi_query.limit = 1000
 
+    if aoi_query.clip and aoi_query.geometry is None:
+        raise HTTPException(
+            status_code=400,
+            detail="'clip' requires a 'geometry' to clip to.",
+        )
+
     if isinstance(aoi_query.id, int):
         aoi_query.id = enforce_list(aoi_query.id)
 
@@ -235,88 +664,58 @@ def get_aoi(aoi_query: schemas.AOIQuery, db: Session, user: schemas.User):
             # multiple aoi requested. Add as a filter.
             Q = Q.filter(database.AOI.id.in_(tuple(aoi_query.id)))
 
-    # do labels
-    if aoi_query.labels is not None:
-
-        # OR condition
-        conditions = [
-            database.AOI.labels.contains(f"{{{label}}}") for label in aoi_query.labels
-        ]
-        Q = Q.filter(or_(*conditions))
-        # AND condition
-        # for label in aoi_query.labels:
-        #     Q = Q.filter(database.AOI.labels.contains(f"{{{label}}}"))
-
     # do geometry if it's available
+    query_geom = None
     if aoi_query.geometry is not None:
-        Q = Q.filter(
-            database.AOI.geometry.ST_Intersects(
-                geom2pg(aoi_query.geometry, allowed_types=["Polygon", "MultiPolygon"])
-            )
+        query_shape = schema2shp(
+            aoi_query.geometry, allowed_types=["Polygon", "MultiPolygon"]
         )
+        check_query_geometry(
+            query_shape,
+            narrowed=aoi_query.id is not None
+            or aoi_query.labels is not None  # noqa
+            or aoi_query.keyed_values is not None,  # noqa
+        )
+        query_geom = from_shape(query_shape, srid=4326)
 
-    # do key-value pairs
-    if aoi_query.keyed_values is not None:
-        for key, value in aoi_query.keyed_values.items():
-            if value is not None:
-                Q = Q.filter(database.AOI.properties[key].as_string() == value)
-            else:
-                Q = Q.filter(database.AOI.properties.has_key(key))  # noqa
+    Q = filter_aois(Q, aoi_query, query_geom)
 
-    # do pagination
-    Q = Q.offset(aoi_query.page * aoi_query.limit).limit(aoi_query.limit + 1)
+    filtered = Q
 
-    if aoi_query.centroids is not None:
+    # do pagination, on a stable order so pages don't overlap
+    Q = Q.order_by(database.AOI.id)
+    Q = Q.offset(aoi_query.page * aoi_query.limit).limit(aoi_query.limit + 1)
 
-        if aoi_query.centroids:
-            Q = Q.with_entities(
-                database.AOI.id, database.AOI.labels, database.AOI.properties
-            )
-            Q = Q.add_columns(
-                gis_funcs.ST_Centroid(database.AOI.geometry).label("geometry")
-            )
+    geom_expr = aoi_geometry(aoi_query, query_geom)
 
-    elif aoi_query.simplify is not None:
+    if aoi_query.precision is not None:
+        geom_expr = geojson_geometry(geom_expr, aoi_query.precision)
 
-        Q = Q.with_entities(
-            database.AOI.id, database.AOI.labels, database.AOI.properties
-        )
-
-        if aoi_query.clip:  # broken
-            Q = Q.add_columns(
-                gis_funcs.ST_Simplify(
-                    gis_funcs.ST_MakeValid(
-                        gis_funcs.ST_Intersection(
-                            database.AOI.geometry,
-                            geom2pg(
-                                aoi_query.geometry,
-                                allowed_types=["Polygon", "MultiPolygon"],
-                            ),
-                        ).label("geometry"),
-                    ),
-                    aoi_query.simplify,
-                ).label("geometry")
-            )
-        else:
-            Q = Q.add_columns(
-                gis_funcs.ST_Simplify(database.AOI.geometry, aoi_query.simplify).label(
-                    "geometry"
-                )
-            )
+    # plain column tuples, no ORM entities
+    Q = Q.with_entities(
+        database.AOI.id,
+        database.AOI.labels,
+        database.AOI.properties,
+        geom_expr.label("geometry"),
+    )
 
-    elif aoi_query.clip is not None:
-        Q = Q.with_entities(
-            database.AOI.id, database.AOI.labels, database.AOI.properties
-        )
-        Q = Q.add_columns(
-            gis_funcs.ST_MakeValid(
-                gis_funcs.ST_Intersection(
-                    database.AOI.geometry,
-                    geom2pg(
-                        aoi_query.geometry, allowed_types=["Polygon", "MultiPolygon"]
-                    ),
-                )
-            ).label("geometry")
+    check_query_cost(
+        db, Q.statement, "add 'labels', use a smaller 'geometry' or a lower 'limit'"
+    )
+    total = count_query(db, filtered, database.AOI.id, aoi_query.count)
+
+    if aoi_query.limit >= STREAM_MIN_LIMIT and aoi_query.format == "GeoJSON":
+        return StreamedPage(
+            Q.yield_per(STREAM_BATCH_SIZE),
+            aoi_query.limit,
+            aoi_query.page,
+            partial(
+                postprocess_aois,
+                output_format=aoi_query.format,
+                total=total,
+                precision=aoi_query.precision,
+            ),
+            "features",
         )
 
     results = Q.all()
@@ -327,8 +726,12 @@ def get_aoi(aoi_query: schemas.AOIQuery, db: Session, user: schemas.User):
         next_page = None
 
     return postprocess_aois(
-        results[0 : aoi_query.limit], next_page, aoi_query.format  # noqa
-    )  # noqa
+        results[0 : aoi_query.limit],  # noqa
+        next_page,
+        aoi_query.format,
+        total,
+        aoi_query.precision,
+    )
 
 
 def check_not_id(event):
@@ -358,8 +761,19 @@ def update_event(event: schemas.Event, db: Session, user: schemas.User):
 
 def update_events(events: List[schemas.Event], db: Session, user: schemas.User):
 
+    # events may move between aois, so refresh the old and the new ones
+    aoi_ids = {
+        row.aoi_id
+        for row in db.query(database.Event.aoi_id).filter(
+            database.Event.id.in_(tuple(event.id for event in events))
+        )
+    }
+
     db_events = [update_event(event, db, user) for event in events]
 
+    refresh_latest_events(db, aoi_ids | {db_event.aoi_id for db_event in db_events})
+    db.commit()
+
     return db_events
 
 
@@ -375,6 +789,8 @@ def create_events(events: List[schemas.EventCreate], db: Session, user: schemas.
     ]
 
     db.add_all(db_events)
+    db.flush()
+    upsert_latest_events(db, db_events)
     db.commit()
     for db_event in db_events:
         db.refresh(db_event)
@@ -382,10 +798,153 @@ def create_events(events: List[schemas.EventCreate], db: Session, user: schemas.
     return db_events
 
 
-def postprocess_events(db_events_list: List[database.Event], next_page: int):
+def upsert_latest_events(db: Session, db_events: List[database.Event]):
+    """Fold newly written events into latest_events. Doesn't commit."""
+
+    # one candidate per (aoi_id, label), as ON CONFLICT can't touch a row twice
+    latest = {}
+    for db_event in db_events:
+        for label in db_event.labels:
+            key = (db_event.aoi_id, label)
+            if key not in latest or (db_event.datetime, db_event.id) > (
+                latest[key].datetime,
+                latest[key].id,
+            ):
+                latest[key] = db_event
+
+    if not latest:
+        return
+
+    stmt = pg_insert(database.LatestEvent).values(
+        [
+            dict(
+                aoi_id=aoi_id,
+                label=label,
+                event_id=db_event.id,
+                datetime=db_event.datetime,
+                properties=db_event.properties,
+            )
+            for (aoi_id, label), db_event in latest.items()
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["aoi_id", "label"],
+        set_=dict(
+            event_id=stmt.excluded.event_id,
+            datetime=stmt.excluded.datetime,
+            properties=stmt.excluded.properties,
+        ),
+        where=tuple_(database.LatestEvent.datetime, database.LatestEvent.event_id)
+        <= tuple_(stmt.excluded.datetime, stmt.excluded.event_id),
+    )
+    db.execute(stmt)
+
+
+def refresh_latest_events(db: Session, aoi_ids: Set[int]):
+    """Recompute latest_events for `aoi_ids` from events. Doesn't commit."""
+
+    if not aoi_ids:
+        return
+
+    db.query(database.LatestEvent).filter(
+        database.LatestEvent.aoi_id.in_(tuple(aoi_ids))
+    ).delete(synchronize_session=False)
+
+    labelled = (
+        select(
+            database.Event.aoi_id,
+            func.unnest(database.Event.labels).label("label"),
+            database.Event.id,
+            database.Event.datetime,
+            database.Event.properties,
+        )
+        .where(database.Event.aoi_id.in_(tuple(aoi_ids)))
+        .subquery()
+    )
+    latest = (
+        select(labelled)
+        .distinct(labelled.c.aoi_id, labelled.c.label)
+        .order_by(
+            labelled.c.aoi_id,
+            labelled.c.label,
+            labelled.c.datetime.desc(),
+            labelled.c.id.desc(),
+        )
+    )
+
+    db.execute(
+        insert(database.LatestEvent).from_select(
+            ["aoi_id", "label", "event_id", "datetime", "properties"], latest
+        )
+    )
+
+
+def get_latest_events(
+    latest_query: schemas.LatestEventQuery, db: Session, user: schemas.User
+):
+
+    if latest_query.limit is not None and latest_query.limit > 10000:
+        raise HTTPException(
+            status_code=400,
+            detail=f"query limit '{latest_query.limit}', max Event limit is 10000.",
+        )
+
+    # set the page and limit if none
+    if latest_query.page is None:
+        latest_query.page = 0
+    if latest_query.limit is None:
+        latest_query.limit = 10000
+
+    Q = db.query(
+        database.LatestEvent.event_id,
+        database.LatestEvent.label,
+        database.LatestEvent.aoi_id,
+        database.LatestEvent.datetime,
+        database.LatestEvent.properties,
+    )
+
+    if latest_query.aoi_id is not None:
+        Q = Q.filter(
+            database.LatestEvent.aoi_id.in_(tuple(enforce_list(latest_query.aoi_id)))
+        )
+
+    if latest_query.labels is not None:
+        Q = Q.filter(database.LatestEvent.label.in_(tuple(latest_query.labels)))
+
+    # do pagination
+    Q = Q.order_by(database.LatestEvent.aoi_id, database.LatestEvent.label)
+    Q = Q.offset(latest_query.page * latest_query.limit).limit(latest_query.limit + 1)
+
+    results = Q.all()
+    if len(results) > latest_query.limit:
+        next_page = latest_query.page + 1
+    else:
+        next_page = None
 
     events_list = [
-        schemas.Event(
+        EventRow(
+            id=latest.event_id,
+            labels=[latest.label],
+            aoi_id=latest.aoi_id,
+            datetime=latest.datetime,
+            keyed_values=latest.properties,
+        )
+        for latest in results[0 : latest_query.limit]  # noqa
+    ]
+
+    return schemas.EventQueryReturn.construct(
+        events=events_list, next_page=next_page, total=None
+    )
+
+
+def postprocess_events(
+    db_events_list: List[database.Event],
+    next_page: int,
+    total: Optional[int] = None,
+):
+
+    events_list = [
+        EventRow(
             id=event.id,
             labels=event.labels,
             aoi_id=event.aoi_id,
@@ -395,7 +954,57 @@ def postprocess_events(db_events_list: List[database.Event], next_page: int):
         for event in db_events_list
     ]
 
-    return schemas.EventQueryReturn(events=events_list, next_page=next_page)
+    return schemas.EventQueryReturn.construct(
+        events=events_list, next_page=next_page, total=total
+    )
+
+
+# the columns an EventRow is built from
+EVENT_COLUMNS = (
+    database.Event.id,
+    database.Event.labels,
+    database.Event.aoi_id,
+    database.Event.datetime,
+    database.Event.properties,
+)
+
+
+def filter_events(Q, event_query: schemas.EventQuery):
+    """Apply the non-aoi EventQuery filters to a Query or Select `Q`"""
+
+    if event_query.id is not None:
+        Q = Q.filter(database.Event.id.in_(tuple(event_query.id)))
+
+    # do labels
+    if event_query.labels is not None:
+
+        # OR condition
+        conditions = [
+            database.Event.labels.contains(f"{{{label}}}")
+            for label in event_query.labels
+        ]
+        Q = Q.filter(or_(*conditions))
+
+    # do key-value pairs
+    if event_query.keyed_values is not None:
+        Q = filter_keyed_values(Q, database.Event.properties, event_query.keyed_values)
+
+    # do dates
+    Q = Q.filter(database.Event.datetime >= event_query.start_datetime)
+    Q = Q.filter(database.Event.datetime <= event_query.end_datetime)
+
+    return Q
+
+
+def event_order(order: str):
+    """(datetime, id) ordering, matching the (aoi_id, datetime, id) index"""
+
+    if order == "desc":
+        return (database.Event.datetime.desc(), database.Event.id.desc())
+    return (database.Event.datetime.asc(), database.Event.id.asc())
+
+
+EVENTS_COST_HINT = "use fewer 'aoi_id's, a shorter date range or a lower 'limit'"
 
 
 def get_events(event_query: schemas.EventQuery, db: Session, user: schemas.User):
@@ -407,49 +1016,52 @@ def get_events(event_query: schemas.EventQuery, db: Session, user: schemas.User)
             detail=f"query limit '{event_query.limit}', max Event limit is 10000.",
         )
 
+    check_count_mode(event_query.count)
+
+    if event_query.order is not None and event_query.order not in ["asc", "desc"]:
+        raise HTTPException(
+            status_code=400,
+            detail="'order' must be one of ['asc','desc'].",
+        )
+
     # set the page and limit if none
     if event_query.page is None:
         event_query.page = 0
     if event_query.limit is None:
         event_query.limit = 20
 
-    Q = db.query(database.Event)
-
     # if single aoi_id is given, wrap it in list
     if isinstance(event_query.aoi_id, int):
         event_query.aoi_id = [event_query.aoi_id]
     if isinstance(event_query.id, int):
         event_query.id = [event_query.id]
 
-    if event_query.id is not None:
-        Q = Q.filter(database.Event.id.in_(tuple(event_query.id)))
+    if event_query.limit_per_aoi is not None:
+        return get_events_per_aoi(event_query, db, user)
+
+    Q = db.query(*EVENT_COLUMNS)
 
     Q = Q.filter(database.Event.aoi_id.in_(tuple(event_query.aoi_id)))
 
-    # do labels
-    if event_query.labels is not None:
+    Q = filter_events(Q, event_query)
 
-        # OR condition
-        conditions = [
-            database.Event.labels.contains(f"{{{label}}}")
-            for label in event_query.labels
-        ]
-        Q = Q.filter(or_(*conditions))
+    filtered = Q
 
-    # do key-value pairs
-    if event_query.keyed_values is not None:
-        for key, value in event_query.keyed_values.items():
-            if value is not None:
-                Q = Q.filter(database.Event.properties[key].as_string() == value)
-            else:
-                Q = Q.filter(database.Event.properties.has_key(key))  # noqa
+    # do pagination, on a stable order so pages don't overlap
+    Q = Q.order_by(*event_order(event_query.order or "asc"))
+    Q = Q.offset(event_query.page * event_query.limit).limit(event_query.limit + 1)
 
-    # do dates
-    Q = Q.filter(database.Event.datetime >= event_query.start_datetime)
-    Q = Q.filter(database.Event.datetime <= event_query.end_datetime)
+    check_query_cost(db, Q.statement, EVENTS_COST_HINT)
+    total = count_query(db, filtered, database.Event.id, event_query.count)
 
-    # do pagination
-    Q = Q.offset(event_query.page * event_query.limit).limit(event_query.limit + 1)
+    if event_query.limit >= STREAM_MIN_LIMIT:
+        return StreamedPage(
+            Q.yield_per(STREAM_BATCH_SIZE),
+            event_query.limit,
+            event_query.page,
+            partial(postprocess_events, total=total),
+            "events",
+        )
 
     results = Q.all()
     if len(results) > event_query.limit:
@@ -457,51 +1069,173 @@ def get_events(event_query: schemas.EventQuery, db: Session, user: schemas.User)
     else:
         next_page = None
 
-    return postprocess_events(results[0 : event_query.limit], next_page)  # noqa
+    return postprocess_events(results[0 : event_query.limit], next_page, total)  # noqa
+
+
+def get_events_per_aoi(
+    event_query: schemas.EventQuery, db: Session, user: schemas.User
+):
+    """`limit_per_aoi` events for each aoi, paged per aoi and grouped by aoi_id.
+
+    Each aoi gets its own LATERAL subquery, so every group is a short range scan
+    on (aoi_id, datetime) instead of one global sort over all the aois.
+    """
+
+    n_aois = len(set(event_query.aoi_id))
+    if event_query.limit_per_aoi * n_aois > 10000:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"'limit_per_aoi' {event_query.limit_per_aoi} over {n_aois} aois "
+                + "exceeds the max Event limit of 10000."  # noqa
+            ),
+        )
+
+    aoi_ids = (
+        func.unnest(postgresql.array(sorted(set(event_query.aoi_id))))
+        .table_valued("aoi_id")
+        .render_derived()
+    )
+
+    per_aoi = filter_events(select(*EVENT_COLUMNS), event_query)
+    per_aoi = (
+        per_aoi.filter(database.Event.aoi_id == aoi_ids.c.aoi_id)
+        .order_by(*event_order(event_query.order or "asc"))
+        .offset(event_query.page * event_query.limit_per_aoi)
+        .limit(event_query.limit_per_aoi + 1)
+        .lateral("per_aoi")
+    )
+
+    statement = select(per_aoi).select_from(aoi_ids).join(per_aoi, true())
+    check_query_cost(db, statement, EVENTS_COST_HINT)
+
+    results = db.execute(statement).all()
+
+    # the total counts every matching event, not just the first N per aoi
+    total = None
+    if event_query.count not in (None, "none"):
+        Q = db.query(database.Event).filter(
+            database.Event.aoi_id.in_(tuple(event_query.aoi_id))
+        )
+        total = count_query(
+            db, filter_events(Q, event_query), database.Event.id, event_query.count
+        )
+
+    grouped = {}
+    for event in results:
+        grouped.setdefault(event.aoi_id, []).append(event)
+
+    if any(len(events) > event_query.limit_per_aoi for events in grouped.values()):
+        next_page = event_query.page + 1
+    else:
+        next_page = None
+
+    return schemas.EventQueryGroupedReturn.construct(
+        events={
+            aoi_id: postprocess_events(
+                events[0 : event_query.limit_per_aoi], None  # noqa
+            ).events
+            for aoi_id, events in grouped.items()
+        },
+        next_page=next_page,
+        total=total,
+    )
+
+
+def delete_with_tombstones(db: Session, model, condition) -> List[int]:
+    """DELETE matching rows and record their tombstones in one statement.
+
+    Returns the deleted ids. Doesn't commit.
+    """
+
+    deleted = (
+        delete(model)
+        .where(condition)
+        .returning(model.id)
+        .cte(f"deleted_{model.__tablename__}")
+    )
+    stmt = (
+        insert(database.Tombstone)
+        .from_select(
+            ["table_name", "object_id"],
+            select(literal(model.__tablename__), deleted.c.id),
+        )
+        .returning(database.Tombstone.object_id)
+    )
+
+    return [row.object_id for row in db.execute(stmt)]
 
 
 def delete_objects(delete_query: schemas.DeleteObj, db: Session, user: schemas.User):
+    """Delete every id in `delete_query` and its dependent rows, in one transaction.
+
+    Deleting an aoi also deletes its events, subdivisions and latest_events;
+    deleting an asset or company deletes its assets_companies_link rows.
+    Returns the deleted ids and per-table row counts.
+    """
 
     if delete_query.table not in ["event", "aoi", "asset", "company"]:
         raise HTTPException(
             status_code=400,
             detail="Field `Table` must be one of [event,aoi,asset,company]",
         )
-    delete_query.id = enforce_list(delete_query.id)
 
-    if delete_query.table == "events":
-        db.query(database.Event).filter(
-            database.Event.id.in_(tuple(delete_query.id))
-        ).delete()
-        db.commit()
-    if delete_query.table == "aoi":
-        db.query(database.AOI).filter(
-            database.AOI.id.in_(tuple(delete_query.id))
-        ).delete()
-        db.commit()
-    if delete_query.table == "asset":
-        db_asset = (
-            db.query(database.Asset)
-            .filter(database.Asset.id.in_(tuple(delete_query.id)))
-            .first()
+    # one array parameter, however many ids are sent
+    ids = bindparam(
+        "ids", list(enforce_list(delete_query.id)), type_=postgresql.ARRAY(Integer)
+    )
+    counts = {}
+
+    if delete_query.table == "event":
+        aoi_ids = {
+            row.aoi_id
+            for row in db.query(database.Event.aoi_id).filter(
+                database.Event.id == any_(ids)
+            )
+        }
+        deleted_ids = delete_with_tombstones(
+            db, database.Event, database.Event.id == any_(ids)
         )
-        for company in db_asset.companies:
-            company.assets.remove(db_asset)
+        counts["events"] = len(deleted_ids)
+        refresh_latest_events(db, aoi_ids)
 
-        db.delete(db_asset)
+    if delete_query.table == "aoi":
+        counts["events"] = len(
+            delete_with_tombstones(
+                db, database.Event, database.Event.aoi_id == any_(ids)
+            )
+        )
+        for model in [database.AOISubdivision, database.LatestEvent]:
+            counts[model.__tablename__] = db.execute(
+                delete(model).where(model.aoi_id == any_(ids))
+            ).rowcount
+        deleted_ids = delete_with_tombstones(
+            db, database.AOI, database.AOI.id == any_(ids)
+        )
+        counts["aois"] = len(deleted_ids)
 
-        db.commit()
+    if delete_query.table == "asset":
+        counts["assets_companies_link"] = db.execute(
+            delete(database.AssetCompany).where(
+                database.AssetCompany.asset_id == any_(ids)
+            )
+        ).rowcount
+        deleted_ids = delete_with_tombstones(
+            db, database.Asset, database.Asset.id == any_(ids)
+        )
+        counts["assets"] = len(deleted_ids)
 
     if delete_query.table == "company":
-        db_company = (
-            db.query(database.Company)
-            .filter(database.Company.id.in_(tuple(delete_query.id)))
-            .first()
+        counts["assets_companies_link"] = db.execute(
+            delete(database.AssetCompany).where(
+                database.AssetCompany.company_id == any_(ids)
+            )
+        ).rowcount
+        deleted_ids = delete_with_tombstones(
+            db, database.Company, database.Company.id == any_(ids)
         )
-        for asset in db_company.assets:
-            asset.companies.remote(db_company)
+        counts["companies"] = len(deleted_ids)
 
-        db.delete(db_company)
-        db.commit()
+    db.commit()
 
-    return delete_query.id
+    return sorted(deleted_ids), counts
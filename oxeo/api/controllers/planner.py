@@ -0,0 +1,148 @@
+import os
+
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+VALID_COUNT_MODES = ("exact", "estimate", "none")
+
+# exact counts stop here; a total equal to this means "at least this many"
+COUNT_EXACT_MAX = 1000000
+
+# reads whose planner estimate ("Total Cost", before any LIMIT) is above this
+# are refused; unset, reads are not EXPLAINed first
+QUERY_COST_BUDGET = (
+    float(os.environ["QUERY_COST_BUDGET"])
+    if os.environ.get("QUERY_COST_BUDGET")
+    else None
+)
+
+# query geometries above these are refused before planning; the area is in
+# square degrees, and only applies when nothing else narrows the query
+QUERY_MAX_VERTICES = int(os.environ.get("QUERY_MAX_VERTICES", 100000))
+QUERY_MAX_AREA = float(os.environ.get("QUERY_MAX_AREA", 2500))
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) wrapper for a select, with its binds processed."""
+
+    inherit_cache = False
+
+    def __init__(self, statement, analyze: bool = False, buffers: bool = False):
+        self.statement = statement
+        self.analyze = analyze
+        self.buffers = buffers
+
+
+def explain_prefix(analyze: bool = False, buffers: bool = False) -> str:
+    options = ["FORMAT JSON"]
+    if analyze:
+        options.append("ANALYZE")
+    if buffers:
+        options.append("BUFFERS")
+    return f"EXPLAIN ({', '.join(options)}) "
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return explain_prefix(element.analyze, element.buffers) + compiler.process(
+        element.statement, **kw
+    )
+
+
+def explain(db: Session, statement, **kwargs) -> dict:
+    """The top plan node for `statement`"""
+
+    return db.execute(Explain(statement, **kwargs)).scalar()[0]["Plan"]
+
+
+def check_count_mode(count):
+    if count is not None and count not in VALID_COUNT_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"'count' must be one of {list(VALID_COUNT_MODES)}.",
+        )
+
+
+def count_query(db: Session, Q, id_col, count):
+    """Total rows matching the filtered Query `Q`, before pagination.
+
+    `estimate` reads the planner's row estimate and costs one EXPLAIN.
+    `exact` runs COUNT(*) over at most COUNT_EXACT_MAX rows.
+    """
+
+    check_count_mode(count)
+
+    if count is None or count == "none":
+        return None
+
+    Q = Q.with_entities(id_col)
+
+    if count == "estimate":
+        return int(explain(db, Q.statement)["Plan Rows"])
+
+    return (
+        db.query(func.count()).select_from(Q.limit(COUNT_EXACT_MAX).subquery()).scalar()
+    )
+
+
+def count_vertices(shapely_geom) -> int:
+    if hasattr(shapely_geom, "geoms"):
+        return sum(count_vertices(part) for part in shapely_geom.geoms)
+    if shapely_geom.geom_type == "Polygon":
+        return len(shapely_geom.exterior.coords) + sum(
+            len(ring.coords) for ring in shapely_geom.interiors
+        )
+    return len(shapely_geom.coords)
+
+
+def check_query_geometry(shapely_geom, narrowed: bool):
+    """Refuse query geometries too detailed, or too large unless `narrowed`"""
+
+    n_vertices = count_vertices(shapely_geom)
+    if n_vertices > QUERY_MAX_VERTICES:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Query geometry has {n_vertices} vertices, the max is "
+                + f"{QUERY_MAX_VERTICES}. Please simplify it."  # noqa
+            ),
+        )
+
+    if not narrowed and shapely_geom.area > QUERY_MAX_AREA:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Query geometry covers {shapely_geom.area:.0f} square degrees, "
+                + f"the max without 'id', 'labels' or 'keyed_values' is "  # noqa
+                + f"{QUERY_MAX_AREA:.0f}."  # noqa
+            ),
+        )
+
+
+def check_query_cost(db: Session, statement, hint: str):
+    """Refuse `statement` if the planner estimates it above QUERY_COST_BUDGET.
+
+    Costs one EXPLAIN (no ANALYZE), so only planning, before it runs. A
+    top-level LIMIT scales the estimate down to the rows returned, so the cost
+    is taken from the plan under it: what producing every match would cost.
+    """
+
+    if not QUERY_COST_BUDGET:
+        return
+
+    plan = explain(db, statement)
+    while plan["Node Type"] == "Limit" and plan.get("Plans"):
+        plan = plan["Plans"][0]
+    cost = plan["Total Cost"]
+    if cost > QUERY_COST_BUDGET:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Query is estimated to cost {cost:.0f}, over the budget of "
+                + f"{QUERY_COST_BUDGET:.0f}. Please narrow it ({hint}), "  # noqa
+                + "or request the whole result from /exports/."  # noqa
+            ),
+        )
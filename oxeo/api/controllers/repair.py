@@ -0,0 +1,121 @@
+"""Write-time validation and repair of AOI geometries.
+
+Geometries are repaired once, before they are stored, so reads never need
+ST_MakeValid. In order, each geometry has repeated vertices removed, is
+optionally snapped to a `GEOMETRY_GRID_SIZE` grid (degrees), is made valid,
+keeps only its polygonal parts and has its rings oriented the GeoJSON way
+(exteriors counter-clockwise, holes clockwise). Geometries with no area left
+come back as None.
+
+`repair_stats` counts the geometries checked and changed by each step, since
+the process started.
+"""
+import os
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+import shapely
+from loguru import logger
+from shapely.geometry.polygon import orient
+
+GRID_SIZE = (
+    float(os.environ["GEOMETRY_GRID_SIZE"])
+    if os.environ.get("GEOMETRY_GRID_SIZE")
+    else None
+)
+
+# shapely type ids
+POLYGON = 3
+COLLECTION_TYPES = (4, 5, 6, 7)
+
+repair_stats: Counter = Counter()
+
+
+def polygonal(geom) -> Optional[shapely.MultiPolygon]:
+    """The non-empty polygons in `geom` as a MultiPolygon, None if there are none"""
+
+    parts = shapely.get_parts(geom)
+    while np.isin(shapely.get_type_id(parts), COLLECTION_TYPES).any():
+        parts = shapely.get_parts(parts)
+
+    parts = parts[(shapely.get_type_id(parts) == POLYGON) & ~shapely.is_empty(parts)]
+    if not len(parts):
+        return None
+    return shapely.multipolygons(parts)
+
+
+def _changed(before, after):
+    return ~shapely.equals_exact(before, after, tolerance=0)
+
+
+def _orient(geoms):
+    """Orient the rings of MultiPolygons `geoms`; returns the indices changed"""
+
+    parts, part_index = shapely.get_parts(geoms, return_index=True)
+    rings, ring_index = shapely.get_rings(parts, return_index=True)
+
+    # each polygon's exterior comes first
+    exterior = np.ones(len(rings), dtype=bool)
+    exterior[1:] = ring_index[1:] != ring_index[:-1]
+    wrong = np.unique(ring_index[shapely.is_ccw(rings) != exterior])
+    if not len(wrong):
+        return wrong
+
+    parts[wrong] = [orient(part, sign=1.0) for part in parts[wrong]]
+    changed = np.unique(part_index[wrong])
+    for ii in changed:
+        geoms[ii] = shapely.multipolygons(parts[part_index == ii])
+
+    return changed
+
+
+def repair_geometries(geoms, grid_size: Optional[float] = GRID_SIZE) -> np.ndarray:
+    """Repaired copies of the polygonal `geoms`, as MultiPolygons or None"""
+
+    geoms = np.array(geoms, dtype=object)
+    original = geoms.copy()
+    counts = Counter(checked=len(geoms))
+
+    deduplicated = shapely.remove_repeated_points(geoms)
+    counts["deduplicated"] = int(
+        (
+            shapely.get_num_coordinates(deduplicated)
+            < shapely.get_num_coordinates(geoms)
+        ).sum()
+    )
+    geoms = deduplicated
+
+    if grid_size:
+        snapped = shapely.set_precision(geoms, grid_size)
+        counts["snapped"] = int(_changed(geoms, snapped).sum())
+        geoms = snapped
+
+    invalid = np.flatnonzero(~shapely.is_valid(geoms))
+    counts["made_valid"] = len(invalid)
+    geoms[invalid] = [polygonal(g) for g in shapely.make_valid(geoms[invalid])]
+
+    # snapping and repair can collapse or split parts
+    rebuild = np.flatnonzero(
+        (shapely.get_type_id(geoms) != 6) | shapely.is_empty(geoms)
+    )
+    geoms[rebuild] = [polygonal(g) for g in geoms[rebuild]]
+
+    present = np.flatnonzero(~shapely.is_missing(geoms))
+    counts["rejected"] = len(geoms) - len(present)
+
+    # _orient works in place, on a copy here
+    oriented = geoms[present]
+    counts["reoriented"] = len(_orient(oriented)) if len(present) else 0
+    geoms[present] = oriented
+
+    counts["repaired"] = int(_changed(original[present], oriented).sum())
+
+    repair_stats.update(counts)
+    if counts["repaired"] or counts["rejected"]:
+        logger.info(
+            "repaired {repaired} and rejected {rejected} of {checked} geometries",
+            **counts,
+        )
+
+    return geoms
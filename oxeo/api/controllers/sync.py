@@ -0,0 +1,144 @@
+import json
+from typing import Iterator
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from oxeo.api.controllers.geom import pg2gj
+from oxeo.api.models import database, schemas
+
+SYNC_TABLES = {
+    "aois": database.AOI,
+    "events": database.Event,
+    "assets": database.Asset,
+}
+
+# rows fetched per round trip while streaming
+SYNC_BATCH_SIZE = 1000
+
+# updated_at and deleted_at are now() in the writing transaction, i.e. its
+# start time, and it may commit long after. Nothing still open can write a
+# timestamp before its own start, so the feed stops short of the oldest open
+# transaction; rows stamped from there on are sent by the next request.
+# Other sessions' xact_start is only visible for the same database role (or
+# with pg_read_all_stats), which is how the API and workers connect.
+WATERMARK = text(
+    """
+    SELECT least(now(), min(xact_start)) FROM pg_stat_activity
+    WHERE xact_start IS NOT NULL AND pid <> pg_backend_pid()
+    """
+)
+
+
+def _serialise_aoi(aoi: database.AOI) -> dict:
+    return dict(
+        id=aoi.id,
+        geometry=pg2gj(aoi.geometry),
+        labels=aoi.labels,
+        properties=aoi.properties,
+    )
+
+
+def _serialise_event(event: database.Event) -> dict:
+    return dict(
+        id=event.id,
+        aoi_id=event.aoi_id,
+        labels=event.labels,
+        datetime=event.datetime,
+        keyed_values=event.properties,
+    )
+
+
+def _serialise_asset(asset: database.Asset) -> dict:
+    return dict(
+        id=asset.id,
+        geometry=pg2gj(asset.geometry),
+        name=asset.name,
+        labels=asset.labels,
+        properties=asset.properties,
+    )
+
+
+SERIALISERS = {
+    "aois": _serialise_aoi,
+    "events": _serialise_event,
+    "assets": _serialise_asset,
+}
+
+
+def _line(record: dict) -> str:
+    return json.dumps(record, default=str) + "\n"
+
+
+def iter_changes(
+    db: Session, changes_query: schemas.ChangesQuery, until
+) -> Iterator[str]:
+    """NDJSON change records for every table, each table in id order.
+
+    Covers rows stamped in [since, until); a row stamped exactly at `since` may
+    be sent twice, never skipped.
+    """
+
+    for table in changes_query.tables:
+        model = SYNC_TABLES[table]
+        serialise = SERIALISERS[table]
+
+        Q = (
+            db.query(model)
+            .filter(model.updated_at >= changes_query.since)
+            .filter(model.updated_at < until)
+            .order_by(model.id)
+            .yield_per(SYNC_BATCH_SIZE)
+        )
+        for row in Q:
+            yield _line(
+                dict(
+                    table=table,
+                    op="upsert",
+                    id=row.id,
+                    updated_at=row.updated_at,
+                    row=serialise(row),
+                )
+            )
+
+        Q = (
+            db.query(database.Tombstone)
+            .filter(database.Tombstone.table_name == table)
+            .filter(database.Tombstone.deleted_at >= changes_query.since)
+            .filter(database.Tombstone.deleted_at < until)
+            .order_by(database.Tombstone.object_id)
+            .yield_per(SYNC_BATCH_SIZE)
+        )
+        for tombstone in Q:
+            yield _line(
+                dict(
+                    table=table,
+                    op="delete",
+                    id=tombstone.object_id,
+                    updated_at=tombstone.deleted_at,
+                )
+            )
+
+
+def get_changes(changes_query: schemas.ChangesQuery, db: Session, user: schemas.User):
+
+    if changes_query.tables is None:
+        changes_query.tables = list(SYNC_TABLES.keys())
+
+    for table in changes_query.tables:
+        if table not in SYNC_TABLES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"'tables' must be a subset of {list(SYNC_TABLES.keys())}.",
+            )
+
+    # fix the upper bound up front, clients pass it back as the next `since`
+    until = db.execute(WATERMARK).scalar()
+
+    return StreamingResponse(
+        iter_changes(db, changes_query, until),
+        media_type="application/x-ndjson",
+        headers={"X-Changes-Until": until.isoformat()},
+    )
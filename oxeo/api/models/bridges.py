@@ -30,19 +30,23 @@ def to_assetquery(
     name: Optional[str] = None,
     company_name: Optional[str] = None,
     geometry: Optional[str] = None,
+    aoi_id: Optional[str] = None,
     labels: Optional[str] = None,
     keyed_values: Optional[str] = None,
+    precision: Optional[int] = None,
+    count: Optional[str] = None,
     limit: Optional[int] = None,
     page: Optional[int] = None,
 ):
     params = {"company_name": company_name}
 
     for key, val, type_ob in zip(
-        ["id", "geometry", "labels", "keyed_values"],
-        [id, geometry, labels, keyed_values],
+        ["id", "geometry", "aoi_id", "labels", "keyed_values"],
+        [id, geometry, aoi_id, labels, keyed_values],
         [
             Union[int, List[int]],
             Optional[schemas.Geometry],
+            Optional[Union[int, List[int]]],
             Optional[List[str]],
             Optional[dict],
         ],
@@ -57,7 +61,9 @@ def to_assetquery(
         except TypeError:
             err_msg(key, val, type_ob)
 
-    asset_query = schemas.AssetQuery(**params, limit=limit, page=page)
+    asset_query = schemas.AssetQuery(
+        **params, precision=precision, count=count, limit=limit, page=page
+    )
 
     return asset_query
 
@@ -66,6 +72,7 @@ def to_companyquery(
     id: Optional[str] = Query(default=None, example=None),
     name: Optional[str] = Query(default=None, example="""my-company-name"""),
     keyed_values: Optional[str] = Query(default=None, example=None),
+    count: Optional[str] = Query(default=None, example=None),
     limit: Optional[int] = Query(default=None, example=None),
     page: Optional[int] = Query(default=None, example=None),
 ):
@@ -86,7 +93,7 @@ def to_companyquery(
         except TypeError:
             err_msg(key, val, type_ob)
 
-    asset_query = schemas.CompanyQuery(**params, limit=limit, page=page)
+    asset_query = schemas.CompanyQuery(**params, count=count, limit=limit, page=page)
 
     return asset_query
 
@@ -98,7 +105,14 @@ def to_eventquery(
     id: Optional[str] = Query(default=None, example=None),
     labels: Optional[str] = Query(default=None, example="""["ndvi"]"""),
     keyed_values: Optional[str] = Query(default=None, example=None),
+    count: Optional[str] = Query(default=None, example=None),
     limit: Optional[int] = Query(default=None, example=None),
+    limit_per_aoi: Optional[int] = Query(default=None, example=None),
+    order: Optional[str] = Query(
+        default=None,
+        example=None,
+        description="'asc' (default) or 'desc' by datetime, also per aoi.",
+    ),
     page: Optional[int] = Query(default=None, example=None),
 ):
 
@@ -140,13 +154,43 @@ def to_eventquery(
         **params,
         start_datetime=start_datetime,
         end_datetime=end_datetime,
+        count=count,
         limit=limit,
+        limit_per_aoi=limit_per_aoi,
+        order=order,
         page=page,
     )
 
     return event_query
 
 
+def to_latesteventquery(
+    aoi_id: Optional[str] = Query(default=None, example="[2197, 2198]"),
+    labels: Optional[str] = Query(default=None, example="""["water_extents"]"""),
+    limit: Optional[int] = Query(default=None, example=None),
+    page: Optional[int] = Query(default=None, example=None),
+):
+
+    params = {}
+
+    for key, val, type_ob in zip(
+        ["aoi_id", "labels"],
+        [aoi_id, labels],
+        [Optional[Union[int, List[int]]], Optional[List[str]]],
+    ):
+        try:
+            params[key] = json.loads(val) if val is not None else val
+        except TypeError:
+            err_msg(key, val, None)
+
+        try:
+            parse_obj_as(type_ob, params[key])
+        except TypeError:
+            err_msg(key, val, type_ob)
+
+    return schemas.LatestEventQuery(**params, limit=limit, page=page)
+
+
 def to_aoiquery(
     id: Optional[str] = Query(default=None, example=None),
     geometry: Optional[str] = Query(
@@ -165,6 +209,8 @@ def to_aoiquery(
     centroids: Optional[bool] = Query(default=None, example=None),
     clip: Optional[bool] = Query(default=None, example=None),
     format: Optional[str] = Query(default="GeoJSON", example="GeoJSON"),
+    precision: Optional[int] = Query(default=None, example=6),
+    count: Optional[str] = Query(default=None, example=None),
     limit: Optional[int] = Query(default=None, example=2),
     page: Optional[int] = Query(default=None, example=None),
 ):
@@ -203,8 +249,36 @@ def to_aoiquery(
         centroids=centroids,
         clip=clip,
         format=format,
+        precision=precision,
+        count=count,
         limit=limit,
         page=page,
     )
 
     return aoi_query
+
+
+def to_changesquery(
+    since: str = Query(default=..., example="2022-09-01T00:00:00+00:00"),
+    tables: Optional[str] = Query(default=None, example="""["aois", "events"]"""),
+):
+
+    try:
+        params = {"tables": json.loads(tables) if tables is not None else tables}
+    except TypeError:
+        err_msg("tables", tables, None)
+
+    try:
+        parse_obj_as(Optional[List[str]], params["tables"])
+    except TypeError:
+        err_msg("tables", tables, Optional[List[str]])
+
+    try:
+        since = parser.parse(since)
+    except ParserError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Parameter 'since' not datetime parseable: {since}",
+        )
+
+    return schemas.ChangesQuery(**params, since=since)
@@ -8,9 +8,11 @@ from sqlalchemy import (
     Date,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     create_engine,
+    func,
 )
 from sqlalchemy.dialects.postgresql import ARRAY, ENUM, JSONB
 from sqlalchemy.ext.declarative import declarative_base
@@ -40,6 +42,7 @@ VALID_EVENT_LABELS = (
     "prediction",
 )
 VALID_ASSET_LABELS = ("mine", "power_station")
+VALID_EXPORT_STATUSES = ("pending", "running", "done", "failed")
 
 
 # Dependency
@@ -80,21 +83,113 @@ class AOI(Base):
     geometry = Column(Geometry(geometry_type="MultiPolygon", srid=4326))
     labels = Column(ARRAY(ENUM(*VALID_AOI_LABELS, name="AOILabel")), index=True)
     properties = Column(JSONB)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        index=True,
+    )
+
+    __table_args__ = (
+        Index(
+            "ix_aois_properties",
+            "properties",
+            postgresql_using="gin",
+            postgresql_ops={"properties": "jsonb_path_ops"},
+        ),
+    )
+
+
+class AOISubdivision(Base):
+    # ST_Subdivide'd pieces of each AOI, kept in sync by controllers.geom
+
+    __tablename__ = "aoi_subdivisions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    aoi_id = Column(Integer, ForeignKey("aois.id", ondelete="CASCADE"), index=True)
+    geometry = Column(Geometry(srid=4326))
 
 
 class Event(Base):
 
     __tablename__ = "events"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # range-partitioned on datetime, see oxeo.api.models.partitions
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     labels = Column(ARRAY(ENUM(*VALID_EVENT_LABELS, name="EventLabel")), index=True)
-    aoi_id = Column(Integer, ForeignKey("aois.id"))
-    datetime = Column(Date, index=True)
+    aoi_id = Column(Integer, ForeignKey("aois.id", ondelete="CASCADE"))
+    datetime = Column(Date, primary_key=True, index=True)
     properties = Column(JSONB)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        index=True,
+    )
+
+    __table_args__ = (
+        Index("ix_events_aoi_id_datetime_id", "aoi_id", "datetime", "id"),
+        Index(
+            "ix_events_properties",
+            "properties",
+            postgresql_using="gin",
+            postgresql_ops={"properties": "jsonb_path_ops"},
+        ),
+        {"postgresql_partition_by": "RANGE (datetime)"},
+    )
 
     # aoi = relationship("AOI", back_populates="events")
 
 
+class LatestEvent(Base):
+    # most recent event per (aoi_id, label), kept in sync by controllers.geom
+
+    __tablename__ = "latest_events"
+
+    aoi_id = Column(
+        Integer, ForeignKey("aois.id", ondelete="CASCADE"), primary_key=True
+    )
+    label = Column(ENUM(*VALID_EVENT_LABELS, name="EventLabel"), primary_key=True)
+    event_id = Column(Integer)  # no FK: events is partitioned on (id, datetime)
+    datetime = Column(Date)
+    properties = Column(JSONB)
+
+
+class Tombstone(Base):
+    # deleted rows, for clients syncing changes
+
+    __tablename__ = "tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    table_name = Column(String)
+    object_id = Column(Integer)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_tombstones_table_name_deleted_at", "table_name", "deleted_at"),
+    )
+
+
+class ExportJob(Base):
+    # asynchronous exports, see controllers/export.py
+
+    __tablename__ = "export_jobs"
+
+    id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    resource = Column(String)
+    format = Column(String)
+    query = Column(JSONB)
+    status = Column(ENUM(*VALID_EXPORT_STATUSES, name="export_status"), index=True)
+    key = Column(String)
+    n_rows = Column(Integer)
+    error = Column(String)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
+
+
 class Asset(Base):
 
     __tablename__ = "assets"
@@ -104,10 +199,26 @@ class Asset(Base):
     name = Column(String, unique=True)
     labels = Column(ARRAY(ENUM(*VALID_ASSET_LABELS, name="AssetLabel")), index=True)
     properties = Column(JSONB)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        index=True,
+    )
     companies = relationship(
         "Company", secondary="assets_companies_link", back_populates="assets"
     )
 
+    __table_args__ = (
+        Index(
+            "ix_assets_properties",
+            "properties",
+            postgresql_using="gin",
+            postgresql_ops={"properties": "jsonb_path_ops"},
+        ),
+    )
+
 
 class Company(Base):
 
@@ -120,11 +231,24 @@ class Company(Base):
     )
     properties = Column(JSONB)
 
+    __table_args__ = (
+        Index(
+            "ix_companies_properties",
+            "properties",
+            postgresql_using="gin",
+            postgresql_ops={"properties": "jsonb_path_ops"},
+        ),
+    )
+
 
 class AssetCompany(Base):
 
     __tablename__ = "assets_companies_link"
-    company_id = Column(Integer, ForeignKey("companies.id"), primary_key=True)
-    asset_id = Column(Integer, ForeignKey("assets.id"), primary_key=True)
+    company_id = Column(
+        Integer, ForeignKey("companies.id", ondelete="CASCADE"), primary_key=True
+    )
+    asset_id = Column(
+        Integer, ForeignKey("assets.id", ondelete="CASCADE"), primary_key=True
+    )
     equity = Column(Integer)
     properties = Column(JSONB)  # ownership percentages and such
@@ -0,0 +1,142 @@
+"""Range partitions for the `events` table.
+
+`events` is partitioned on `datetime`, by year by default. Rows with no
+matching partition land in `events_default`; creating a partition moves any
+such rows out of the default partition before attaching it. Ranges already
+covered by an existing partition, of either interval, are left alone.
+"""
+import re
+from datetime import date
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+
+VALID_INTERVALS = ("year", "month")
+
+# pg_get_expr(relpartbound) of a range partition on a date column
+RANGE_BOUND = re.compile(r"FOR VALUES FROM \((.+)\) TO \((.+)\)")
+
+
+def partition_start(day: date, interval: str = "year") -> date:
+    if interval == "year":
+        return date(day.year, 1, 1)
+    elif interval == "month":
+        return date(day.year, day.month, 1)
+    else:
+        raise ValueError(f"interval must be one of {VALID_INTERVALS}")
+
+
+def next_partition_start(start: date, interval: str = "year") -> date:
+    if interval == "year":
+        return date(start.year + 1, 1, 1)
+    elif start.month == 12:
+        return date(start.year + 1, 1, 1)
+    else:
+        return date(start.year, start.month + 1, 1)
+
+
+def partition_name(start: date, interval: str = "year") -> str:
+    if interval == "year":
+        return f"events_y{start.year}"
+    return f"events_m{start.year}_{start.month:02d}"
+
+
+def partition_bounds(
+    start: date, end: date, interval: str = "year"
+) -> List[Tuple[str, date, date]]:
+    """(name, lower, upper) for every partition needed to cover [start, end]"""
+
+    bounds = []
+    lower = partition_start(start, interval)
+    while lower <= end:
+        upper = next_partition_start(lower, interval)
+        bounds.append((partition_name(lower, interval), lower, upper))
+        lower = upper
+    return bounds
+
+
+def _bound_value(value: str) -> date:
+    if value == "MINVALUE":
+        return date.min
+    if value == "MAXVALUE":
+        return date.max
+    return date.fromisoformat(value.strip("'"))
+
+
+def parse_partition_bound(bound: str) -> Optional[Tuple[date, date]]:
+    """(lower, upper) of a range partition's bound expression, None for DEFAULT"""
+
+    match = RANGE_BOUND.fullmatch(bound)
+    if match is None:
+        return None
+    return _bound_value(match.group(1)), _bound_value(match.group(2))
+
+
+def existing_partitions(db) -> List[Tuple[str, date, date]]:
+    """(name, lower, upper) of the range partitions attached to `events`"""
+
+    rows = db.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'events'::regclass"
+        )
+    ).all()
+
+    partitions = []
+    for name, bound in rows:
+        bounds = parse_partition_bound(bound)
+        if bounds is not None:
+            partitions.append((name, *bounds))
+    return partitions
+
+
+def ensure_event_partitions(db, start: date, end: date, interval: str = "year"):
+    """Create any missing `events` partitions covering [start, end].
+
+    Ranges overlapping an existing partition are skipped, e.g. months inside a
+    yearly partition, since they couldn't be attached. `db` can be a Session
+    or a Connection. Doesn't commit. Returns the names of the partitions
+    created.
+    """
+
+    existing = existing_partitions(db)
+
+    created = []
+    for name, lower, upper in partition_bounds(start, end, interval):
+        if any(lower < e_upper and e_lower < upper for _, e_lower, e_upper in existing):
+            continue
+
+        exists = db.execute(
+            text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}
+        ).scalar()
+        if exists:
+            continue
+
+        params = {"lower": lower, "upper": upper}
+        db.execute(
+            text(
+                f"CREATE TABLE {name} "
+                "(LIKE events INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            )
+        )
+        # attaching fails if events_default still holds rows for this range
+        db.execute(
+            text(
+                "WITH moved AS ("
+                "DELETE FROM events_default "
+                "WHERE datetime >= :lower AND datetime < :upper RETURNING *"
+                f") INSERT INTO {name} SELECT * FROM moved"
+            ),
+            params,
+        )
+        db.execute(
+            text(
+                f"ALTER TABLE events ATTACH PARTITION {name} "
+                "FOR VALUES FROM (:lower) TO (:upper)"
+            ),
+            params,
+        )
+        created.append(name)
+
+    return created
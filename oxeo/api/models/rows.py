@@ -0,0 +1,60 @@
+"""Lightweight read-only rows for query responses.
+
+Read paths select plain column tuples with `Query.with_entities` and wrap them
+in these instead of building ORM entities and validated pydantic models. Each
+row serialises to the same JSON as the schema it stands in for; `keys` and
+`__getitem__` let `dict(row)` (and so `jsonable_encoder`) work too.
+"""
+
+
+class Row:
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            object.__setattr__(self, name, kwargs.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={getattr(self, k)!r}" for k in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def keys(self):
+        return self.__slots__
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class EventRow(Row):
+    """schemas.Event"""
+
+    __slots__ = ("labels", "aoi_id", "datetime", "keyed_values", "id")
+
+
+class CompanyRow(Row):
+    """schemas.Company"""
+
+    __slots__ = ("name", "properties", "id")
+
+
+class FeatureRow(Row):
+    """schemas.Feature, with `geometry` as a GeoJSON dict"""
+
+    __slots__ = ("type", "geometry", "properties", "id", "bbox", "labels")
+
+    def to_geojson(self) -> dict:
+        return {
+            "type": self.type,
+            "geometry": self.geometry,
+            "properties": self.properties,
+            "id": self.id,
+        }
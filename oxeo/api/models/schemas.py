@@ -1,6 +1,6 @@
 # oxeo/api/models/data.py
 
-from datetime import date
+from datetime import date, datetime
 
 # data models for pydantic
 from typing import Dict, List, Optional, Tuple, TypeVar, Union
@@ -133,6 +133,8 @@ class AOIQuery(BaseModel):
     centroids: Optional[bool] = Field(default=None, example=None)
     clip: Optional[bool] = Field(default=None, example=None)
     format: Optional[str] = Field(default="GeoJSON", example="GeoJSON")
+    precision: Optional[int] = Field(default=None, example=None)
+    count: Optional[str] = Field(default=None, example=None)
     limit: Optional[int] = Field(default=None, example=2)
     page: Optional[int] = Field(default=None, example=None)
 
@@ -151,6 +153,13 @@ class Event(EventCreate):
 class EventQueryReturn(BaseModel):
     events: List[Event]
     next_page: Optional[int]
+    total: Optional[int]
+
+
+class EventQueryGroupedReturn(BaseModel):
+    events: Dict[int, List[Event]]  # keyed by aoi_id
+    next_page: Optional[int]
+    total: Optional[int]
 
 
 class EventQuery(BaseModel):
@@ -160,6 +169,16 @@ class EventQuery(BaseModel):
     start_datetime: date
     end_datetime: date
     keyed_values: Optional[dict]
+    count: Optional[str]
+    limit: Optional[int]
+    limit_per_aoi: Optional[int]
+    order: Optional[str]  # "asc" (default) or "desc", by datetime then id
+    page: Optional[int]
+
+
+class LatestEventQuery(BaseModel):
+    aoi_id: Optional[Union[int, List[int]]]
+    labels: Optional[List[str]]
     limit: Optional[int]
     page: Optional[int]
 
@@ -181,8 +200,11 @@ class AssetQuery(BaseModel):
     name: Optional[str]
     company_name: Optional[str]
     geometry: Optional[Geometry]
+    aoi_id: Optional[Union[int, List[int]]]
     labels: Optional[List[str]]
     keyed_values: Optional[dict]
+    precision: Optional[int]
+    count: Optional[str]
     limit: Optional[int]
     page: Optional[int]
 
@@ -190,6 +212,7 @@ class AssetQuery(BaseModel):
 class AssetQueryReturn(BaseModel):
     assets: List[Asset]
     next_page: Optional[int]
+    total: Optional[int]
 
 
 class CompanyCreate(BaseModel):
@@ -205,6 +228,7 @@ class CompanyQuery(BaseModel):
     id: Optional[Union[List[int], int]]
     name: Optional[str]
     keyed_values: Optional[dict]
+    count: Optional[str]
     limit: Optional[int]
     page: Optional[int]
 
@@ -212,8 +236,57 @@ class CompanyQuery(BaseModel):
 class CompanyQueryReturn(BaseModel):
     companies: List[Company]
     next_page: Optional[int]
+    total: Optional[int]
 
 
 class DeleteObj(BaseModel):
     id: Union[int, List[int]]
     table: str
+
+
+class ChangesQuery(BaseModel):
+    since: datetime
+    tables: Optional[List[str]]
+
+
+class BatchQuery(BaseModel):
+    resource: str = Field(default=..., example="events")
+    query: dict = Field(
+        default={},
+        example={
+            "aoi_id": 2197,
+            "start_datetime": "2018-01-01",
+            "end_datetime": "2018-06-30",
+        },
+    )
+
+
+class BatchRequest(BaseModel):
+    queries: Dict[str, BatchQuery]
+
+
+class ExportCreate(BaseModel):
+    resource: str = Field(default=..., example="events")
+    format: str = Field(default="ndjson", example="parquet")
+    query: dict = Field(
+        default={},
+        example={
+            "aoi_id": [2197, 2198],
+            "start_datetime": "2000-01-01",
+            "end_datetime": "2022-12-31",
+        },
+    )
+
+
+class ExportJob(BaseModel):
+    id: str
+    resource: str
+    format: str
+    status: str
+    n_rows: Optional[int]
+    error: Optional[str]
+    created_at: datetime
+    finished_at: Optional[datetime]
+
+    class Config:
+        orm_mode = True
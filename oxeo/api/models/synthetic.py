@@ -0,0 +1,260 @@
+"""Deterministic synthetic AOIs, events, assets and companies, loaded with COPY.
+
+Every table draws from its own `random.Random` seeded from `seed` and the
+table name, so the same arguments always produce the same rows. Rows are
+formatted as CSV in Python and streamed to Postgres in chunks with COPY;
+subdivisions and latest_events are then derived set-based in SQL.
+
+All rows carry `{"synthetic": true}` in their properties.
+"""
+import csv
+import io
+import json
+import math
+import random
+from datetime import date, timedelta
+from itertools import islice
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from oxeo.api.controllers.geom import refresh_latest_events, sync_aoi_subdivisions
+from oxeo.api.models import database, partitions
+
+# rows formatted per COPY round trip
+COPY_CHUNK_ROWS = 100_000
+
+SYNTHETIC = json.dumps({"synthetic": True})
+
+
+def table_rng(seed: int, table: str) -> random.Random:
+    return random.Random(f"{seed}:{table}")
+
+
+def copy_rows(
+    conn, table: str, columns: Sequence[str], rows: Iterable[Sequence]
+) -> int:
+    """COPY `rows` into `table` in chunks. `conn` is a SQLAlchemy Connection."""
+
+    cursor = conn.connection.cursor()
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+
+    n_rows = 0
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, COPY_CHUNK_ROWS))
+        if not chunk:
+            break
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(chunk)
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+        n_rows += len(chunk)
+
+    return n_rows
+
+
+def reserve_ids(conn, table: str, n: int) -> List[int]:
+    """Take `n` consecutive ids from `table`'s id sequence"""
+
+    if n == 0:
+        return []
+
+    conn.execute(text(f"LOCK TABLE {table} IN EXCLUSIVE MODE"))
+    last = conn.execute(
+        text(
+            "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+            "nextval(pg_get_serial_sequence(:table, 'id')) + :n - 1)"
+        ),
+        {"table": table, "n": n},
+    ).scalar()
+    return list(range(last - n + 1, last + 1))
+
+
+def pg_array(values: Sequence[str]) -> str:
+    return "{" + ",".join(values) + "}"
+
+
+def ring_wkt(x0: float, y0: float, radius: float, n_vertices: int, rng) -> str:
+    """A jagged star-shaped ring; vertices in angle order keep it simple"""
+
+    coords = []
+    for ii in range(n_vertices):
+        theta = 2 * math.pi * ii / n_vertices
+        r = radius * (1 + 0.3 * rng.random())
+        coords.append(f"{x0 + r * math.cos(theta):.6f} {y0 + r * math.sin(theta):.6f}")
+    coords.append(coords[0])
+    return "((" + ",".join(coords) + "))"
+
+
+def multipolygon_ewkt(rng, vertices: Tuple[int, int], max_parts: int) -> str:
+    x0, y0 = rng.uniform(-170, 170), rng.uniform(-60, 60)
+    radius = rng.uniform(0.01, 0.2)
+    n_parts = rng.randint(1, max_parts)
+
+    # parts sit 3 radii apart, so they never overlap
+    parts = [
+        ring_wkt(x0 + 3 * radius * k, y0, radius, rng.randint(*vertices), rng)
+        for k in range(n_parts)
+    ]
+    return "SRID=4326;MULTIPOLYGON(" + ",".join(parts) + ")"
+
+
+def aoi_rows(ids, seed, vertices, max_parts) -> Iterator[tuple]:
+    rng = table_rng(seed, "aois")
+    for aoi_id in ids:
+        yield (
+            aoi_id,
+            multipolygon_ewkt(rng, vertices, max_parts),
+            pg_array([rng.choice(database.VALID_AOI_LABELS)]),
+            json.dumps({"synthetic": True, "name": f"aoi-{aoi_id}"}),
+        )
+
+
+def event_value(label: str, season: float, rng) -> float:
+    if label == "ndvi":
+        return round(0.5 + 0.3 * season + rng.gauss(0, 0.05), 4)
+    if label == "total_precipitation":
+        return round(max(0.0, rng.gauss(2 + 2 * season, 2)), 3)
+    if label == "prediction":
+        return round(rng.random(), 4)
+    return round(1000 * (1 + 0.4 * season) * rng.uniform(0.9, 1.1), 2)
+
+
+def event_rows(aoi_ids, seed, start, end, labels, every) -> Iterator[tuple]:
+    rng = table_rng(seed, "events")
+
+    # everything that doesn't depend on the aoi is formatted once
+    days = [
+        (
+            day.isoformat(),
+            math.sin(2 * math.pi * day.timetuple().tm_yday / 365.25),
+        )
+        for day in (
+            start + timedelta(days=d) for d in range(0, (end - start).days + 1, every)
+        )
+    ]
+    label_arrays = [(label, pg_array([label])) for label in labels]
+
+    for aoi_id in aoi_ids:
+        for day, season in days:
+            for label, label_array in label_arrays:
+                yield (
+                    label_array,
+                    aoi_id,
+                    day,
+                    f'{{"value": {event_value(label, season, rng)}}}',
+                )
+
+
+def company_rows(ids, seed) -> Iterator[tuple]:
+    rng = table_rng(seed, "companies")
+    for company_id in ids:
+        yield (
+            company_id,
+            f"synthetic-company-{company_id}",
+            json.dumps({"synthetic": True, "country": rng.choice(["GB", "ZA", "BR"])}),
+        )
+
+
+def asset_rows(ids, seed) -> Iterator[tuple]:
+    rng = table_rng(seed, "assets")
+    for asset_id in ids:
+        x, y = rng.uniform(-170, 170), rng.uniform(-60, 60)
+        yield (
+            asset_id,
+            f"SRID=4326;POINT({x:.6f} {y:.6f})",
+            f"synthetic-asset-{asset_id}",
+            pg_array([rng.choice(database.VALID_ASSET_LABELS)]),
+            SYNTHETIC,
+        )
+
+
+def equity_weights(n: int, rng) -> List[int]:
+    """`n` positive integer weights summing to 100"""
+
+    cuts = sorted(rng.sample(range(1, 100), n - 1))
+    return [b - a for a, b in zip([0] + cuts, cuts + [100])]
+
+
+def link_rows(asset_ids, company_ids, seed, max_owners) -> Iterator[tuple]:
+    rng = table_rng(seed, "assets_companies_link")
+    for asset_id in asset_ids:
+        owners = rng.sample(
+            company_ids, rng.randint(1, min(max_owners, len(company_ids)))
+        )
+        for company_id, equity in zip(owners, equity_weights(len(owners), rng)):
+            yield (company_id, asset_id, equity)
+
+
+def seed_synthetic(
+    conn,
+    seed: int = 0,
+    n_aois: int = 1000,
+    vertices: Tuple[int, int] = (16, 256),
+    max_parts: int = 3,
+    start: date = date(2018, 1, 1),
+    end: date = date(2022, 12, 31),
+    labels: Sequence[str] = database.VALID_EVENT_LABELS,
+    every: int = 1,
+    n_companies: int = 500,
+    n_assets: int = 5000,
+    max_owners: int = 3,
+) -> dict:
+    """Generate and load a synthetic dataset in `conn`'s transaction.
+
+    Events are daily (every `every` days) between `start` and `end`, one per
+    label per AOI. Returns the new ids and the row count of each table.
+    """
+
+    counts = {}
+
+    aoi_ids = reserve_ids(conn, "aois", n_aois)
+    counts["aois"] = copy_rows(
+        conn,
+        "aois",
+        ["id", "geometry", "labels", "properties"],
+        aoi_rows(aoi_ids, seed, vertices, max_parts),
+    )
+
+    partitions.ensure_event_partitions(conn, start, end)
+    counts["events"] = copy_rows(
+        conn,
+        "events",
+        ["labels", "aoi_id", "datetime", "properties"],
+        event_rows(aoi_ids, seed, start, end, labels, every),
+    )
+
+    company_ids = reserve_ids(conn, "companies", n_companies)
+    counts["companies"] = copy_rows(
+        conn,
+        "companies",
+        ["id", "name", "properties"],
+        company_rows(company_ids, seed),
+    )
+
+    asset_ids = reserve_ids(conn, "assets", n_assets)
+    counts["assets"] = copy_rows(
+        conn,
+        "assets",
+        ["id", "geometry", "name", "labels", "properties"],
+        asset_rows(asset_ids, seed),
+    )
+    if company_ids:
+        counts["assets_companies_link"] = copy_rows(
+            conn,
+            "assets_companies_link",
+            ["company_id", "asset_id", "equity"],
+            link_rows(asset_ids, company_ids, seed, max_owners),
+        )
+
+    # derived tables, set-based
+    db = Session(bind=conn)
+    sync_aoi_subdivisions(db, aoi_ids)
+    refresh_latest_events(db, set(aoi_ids))
+    db.flush()
+
+    return dict(
+        aoi_ids=aoi_ids, company_ids=company_ids, asset_ids=asset_ids, counts=counts
+    )
@@ -0,0 +1,233 @@
+"""Opt-in slow-query log for the SQL the API generates.
+
+Enabled by setting `SLOW_QUERY_MS`. Every statement slower than that is logged
+with its bound parameters, the route that issued it and its normalised shape
+(literals and IN-lists collapsed, so the same filter combination always has
+the same `shape_id`). A `SLOW_QUERY_EXPLAIN_SAMPLE` fraction of slow plain
+SELECTs are re-run under EXPLAIN (ANALYZE, BUFFERS), inside a savepoint, and
+the plan is logged with them.
+Records go to the loguru logger, and also as JSON lines to `SLOW_QUERY_LOG`
+when that is set.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy import event
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from oxeo.api.controllers.planner import explain_prefix
+
+current_route: ContextVar[Optional[str]] = ContextVar("current_route", default=None)
+
+# longer parameter values (geometries, mostly) are cut to this many characters
+MAX_PARAM_CHARS = 200
+
+_IN_LIST = re.compile(r"IN \(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_PARAM = re.compile(r"%\(\w+\)s|%s|\$\d+|\?")
+_NUMBER = re.compile(r"\b\d+(\.\d+)?\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_SPACE = re.compile(r"\s+")
+
+# EXPLAIN ANALYZE really runs the statement, so locking reads and sequence
+# calls are left alone as well as writes (including WITH ... DELETE)
+_SIDE_EFFECTS = re.compile(
+    r"\bFOR\s+(NO\s+KEY\s+)?(UPDATE|SHARE)\b|\bFOR\s+KEY\s+SHARE\b"
+    r"|\b(nextval|setval)\s*\(",
+    re.IGNORECASE,
+)
+
+
+def query_shape(statement: str) -> str:
+    """`statement` with parameters, literals and IN-lists collapsed"""
+
+    shape = _STRING.sub("?", statement)
+    shape = _PARAM.sub("?", shape)
+    shape = _IN_LIST.sub("IN (...)", shape)
+    shape = _NUMBER.sub("?", shape)
+    return _SPACE.sub(" ", shape).strip()
+
+
+def explainable(statement: str) -> bool:
+    """Whether `statement` is a plain SELECT, safe to re-run under ANALYZE"""
+
+    return bool(
+        re.match(r"\s*SELECT\b", statement, re.IGNORECASE)
+        and not _SIDE_EFFECTS.search(statement)  # noqa
+    )
+
+
+def _truncate(value):
+    if isinstance(value, (bytes, memoryview)):
+        value = bytes(value).hex()
+    if isinstance(value, str) and len(value) > MAX_PARAM_CHARS:
+        return value[:MAX_PARAM_CHARS] + "..."
+    return value
+
+
+def _parameters(parameters):
+    if isinstance(parameters, dict):
+        return {key: _truncate(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_truncate(value) for value in parameters]
+    return parameters
+
+
+class FileSink:
+    """Append records as JSON lines to `path`"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, record: dict):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+
+
+def log_sink(record: dict):
+    logger.warning(
+        "slow query {shape_id} {duration_ms:.1f}ms on {route}",
+        **record,
+    )
+
+
+class SlowQueryLog:
+    def __init__(
+        self,
+        threshold_ms: float,
+        explain_sample: float = 0.0,
+        sinks: Optional[list] = None,
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain_sample = explain_sample
+        self.sinks = sinks if sinks is not None else [log_sink]
+        self._rng = random.Random()
+
+    def install(self, engine):
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+        event.listen(engine, "handle_error", self.handle_error)
+
+    def remove(self, engine):
+        event.remove(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", self.after_cursor_execute)
+        event.remove(engine, "handle_error", self.handle_error)
+
+    def before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        started = conn.info["query_start"].pop()
+        duration_ms = 1000 * (time.perf_counter() - started)
+
+        if duration_ms < self.threshold_ms or conn.info.get("explaining"):
+            return
+
+        shape = query_shape(statement)
+        record = dict(
+            duration_ms=duration_ms,
+            route=current_route.get(),
+            shape_id=hashlib.sha1(shape.encode()).hexdigest()[:12],
+            shape=shape,
+            statement=statement,
+            parameters=_parameters(parameters),
+        )
+
+        if (
+            not executemany
+            and self.explain_sample > 0  # noqa
+            and explainable(statement)  # noqa
+            and self._rng.random() < self.explain_sample  # noqa
+        ):
+            record["plan"] = self.explain(conn, statement, parameters)
+
+        for sink in self.sinks:
+            sink(record)
+
+    def handle_error(self, exception_context):
+        # failed statements never reach after_cursor_execute
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+    def explain(self, conn, statement, parameters):
+        """Re-run `statement` under EXPLAIN (ANALYZE, BUFFERS) on its connection.
+
+        Runs in a savepoint on the DBAPI cursor (this is inside a cursor event,
+        under SQLAlchemy's transaction bookkeeping), so a failed EXPLAIN can't
+        leave the caller's transaction aborted.
+        """
+
+        conn.info["explaining"] = True
+        try:
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute("SAVEPOINT slow_query_explain")
+                try:
+                    cursor.execute(
+                        explain_prefix(analyze=True, buffers=True) + statement,
+                        parameters,
+                    )
+                    return cursor.fetchone()[0]
+                finally:
+                    cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                    cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            finally:
+                cursor.close()
+        except Exception as e:
+            return {"error": str(e)}
+        finally:
+            conn.info["explaining"] = False
+
+
+class RouteMiddleware:
+    """Record the method and path of the current request for the log"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = current_route.set(f"{scope['method']} {scope['path']}")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_route.reset(token)
+
+
+def install_from_env(app, engine) -> Optional[SlowQueryLog]:
+    """Install the slow-query log on `engine` and `app` if SLOW_QUERY_MS is set"""
+
+    threshold_ms = os.environ.get("SLOW_QUERY_MS")
+    if threshold_ms is None:
+        return None
+
+    sinks: list = [log_sink]
+    if os.environ.get("SLOW_QUERY_LOG"):
+        sinks.append(FileSink(os.environ["SLOW_QUERY_LOG"]))
+
+    slow_query_log = SlowQueryLog(
+        threshold_ms=float(threshold_ms),
+        explain_sample=float(os.environ.get("SLOW_QUERY_EXPLAIN_SAMPLE", 0)),
+        sinks=sinks,
+    )
+    slow_query_log.install(engine)
+    app.add_middleware(RouteMiddleware)
+
+    return slow_query_log
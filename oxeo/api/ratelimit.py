@@ -0,0 +1,272 @@
+"""Per-user rate limiting and concurrency caps for the read routes.
+
+Each user has a token bucket refilled at `RATE_LIMIT_PER_MINUTE` tokens a
+minute up to `RATE_LIMIT_BURST`, and may have at most `RATE_LIMIT_CONCURRENCY`
+requests in flight. A request costs one token plus extra for the features
+that make it expensive (see `query_cost`). Rejected requests get a 429 with
+`Retry-After`.
+
+Limiting is off unless `RATE_LIMIT_PER_MINUTE` is set. State is shared
+through Redis when `RATE_LIMIT_REDIS_URL` is set; otherwise it is kept in
+process memory, so each worker (or Lambda container) limits independently,
+which only suits single-process deployments.
+"""
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException, status
+
+from oxeo.api.controllers.authentication import get_current_active_user
+from oxeo.api.models import database, schemas
+
+# tokens per request, before query features
+ROUTE_COSTS = {
+    "aoi": 1.0,
+    "events": 1.0,
+    "latest_events": 1.0,
+    "assets": 1.0,
+    "companies": 1.0,
+    "changes": 5.0,
+}
+
+# rows requested per extra token
+ROWS_PER_TOKEN = {
+    "aoi": 1000,
+    "events": 1000,
+    "latest_events": 1000,
+    "assets": 1000,
+    "companies": 1000,
+}
+
+# AOI geometry operations, per 1000 rows
+GEOMETRY_COSTS = {"simplify": 5.0, "clip": 5.0}
+
+# exact counts scan the whole filtered set
+COUNT_COST = 2.0
+
+# rows a route returns when no limit is given
+DEFAULT_LIMITS = {
+    "aoi": 1000,
+    "events": 20,
+    "latest_events": 10000,
+    "assets": 1000,
+    "companies": 1000,
+}
+
+# concurrency slots expire in case a worker dies holding one
+SLOT_TTL_SECONDS = 300
+
+
+def _limit(resource: str, query: dict) -> int:
+    limit = query.get("limit")
+    if resource == "aoi" and query.get("centroids") and limit and limit > 1000:
+        # get_aoi raises centroid limits over 1000 to the maximum
+        return 50000
+    limit = limit or DEFAULT_LIMITS.get(resource, 0)
+
+    if resource == "events" and query.get("limit_per_aoi"):
+        aoi_ids = query.get("aoi_id")
+        n_aois = len(set(aoi_ids)) if isinstance(aoi_ids, list) else 1
+        limit = max(limit, query["limit_per_aoi"] * n_aois)
+
+    return limit
+
+
+def query_cost(resource: str, query: dict) -> float:
+    """Tokens charged for one query to `resource`.
+
+    `query` is a query schema as a dict; a batch costs the sum of its queries.
+    """
+
+    if resource == "batch":
+        return sum(
+            query_cost(q["resource"], q.get("query") or {})
+            for q in query["queries"].values()
+        )
+
+    cost = ROUTE_COSTS.get(resource, 1.0)
+    if resource not in ROWS_PER_TOKEN:
+        return cost
+
+    limit = _limit(resource, query)
+    cost += limit / ROWS_PER_TOKEN[resource]
+
+    if resource == "aoi":
+        for feature, feature_cost in GEOMETRY_COSTS.items():
+            if query.get(feature):
+                cost += feature_cost * max(limit, 1) / 1000
+
+    if resource == "events" and isinstance(query.get("aoi_id"), list):
+        cost += len(query["aoi_id"]) / 100
+
+    if query.get("count") == "exact":
+        cost += COUNT_COST
+
+    return cost
+
+
+class MemoryBackend:
+    """Buckets and slot counts in this process"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+        self.slots: Dict[str, int] = {}
+
+    async def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        """Take `cost` tokens; returns 0, or the seconds until they'd be available"""
+
+        now = self.clock()
+        tokens, updated = self.buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+
+        if tokens < cost:
+            self.buckets[key] = (tokens, now)
+            return (cost - tokens) / rate
+
+        self.buckets[key] = (tokens - cost, now)
+        return 0.0
+
+    async def acquire(self, key: str, limit: int) -> bool:
+        if self.slots.get(key, 0) >= limit:
+            return False
+        self.slots[key] = self.slots.get(key, 0) + 1
+        return True
+
+    async def release(self, key: str):
+        self.slots[key] -= 1
+        if not self.slots[key]:
+            del self.slots[key]
+
+
+# KEYS[1] bucket; ARGV cost, rate, burst, now. Returns the wait in seconds.
+TAKE_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local cost, rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]),
+    tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens < cost then
+    wait = (cost - tokens) / rate
+else
+    tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBackend:
+    """Buckets and slot counts shared through Redis"""
+
+    def __init__(self, url: str):
+        import aioredis
+
+        self.redis = aioredis.from_url(url)
+
+    async def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        wait = await self.redis.eval(
+            TAKE_SCRIPT, 1, key, cost, rate, burst, time.time()
+        )
+        return float(wait)
+
+    async def acquire(self, key: str, limit: int) -> bool:
+        active = await self.redis.incr(key)
+        await self.redis.expire(key, SLOT_TTL_SECONDS)
+        if active > limit:
+            await self.redis.decr(key)
+            return False
+        return True
+
+    async def release(self, key: str):
+        await self.redis.decr(key)
+
+
+class RateLimiter:
+    def __init__(self, backend, per_minute: float, burst: float, concurrency: int):
+        self.backend = backend
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.concurrency = concurrency
+
+    @asynccontextmanager
+    async def admit(self, user_id: int, cost: float):
+        """Hold a concurrency slot for `user_id` and charge `cost` tokens"""
+
+        slot = f"ratelimit:{user_id}:active"
+        if not await self.backend.acquire(slot, self.concurrency):
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"At most {self.concurrency} concurrent requests per user.",
+                headers={"Retry-After": "1"},
+            )
+
+        try:
+            # a request dearer than the whole bucket still goes through, on a full one
+            wait = await self.backend.take(
+                f"ratelimit:{user_id}:tokens",
+                min(cost, self.burst),
+                self.rate,
+                self.burst,
+            )
+            if wait > 0:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail=f"Rate limit exceeded; request cost {cost:.1f} tokens.",
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+            yield
+        finally:
+            await self.backend.release(slot)
+
+
+def from_env() -> Optional[RateLimiter]:
+    if not os.environ.get("RATE_LIMIT_PER_MINUTE"):
+        return None
+
+    per_minute = float(os.environ["RATE_LIMIT_PER_MINUTE"])
+    if per_minute <= 0:
+        return None
+
+    if os.environ.get("RATE_LIMIT_REDIS_URL"):
+        backend = RedisBackend(os.environ["RATE_LIMIT_REDIS_URL"])
+    else:
+        backend = MemoryBackend()
+
+    return RateLimiter(
+        backend,
+        per_minute=per_minute,
+        burst=float(os.environ.get("RATE_LIMIT_BURST", per_minute)),
+        concurrency=int(os.environ.get("RATE_LIMIT_CONCURRENCY", 4)),
+    )
+
+
+limiter = from_env()
+
+
+def rate_limit(resource: str, query_dependency: Callable):
+    """A route dependency charging `query_cost(resource, query)` to the user"""
+
+    async def dependency(
+        query=Depends(query_dependency),
+        user: database.User = Depends(get_current_active_user),
+    ):
+        if limiter is None:
+            yield
+            return
+
+        async with limiter.admit(user.id, query_cost(resource, query.dict())):
+            yield
+
+    return dependency
+
+
+def batch_body(batch: schemas.BatchRequest):
+    # same name as the /batch/ route's body parameter, so FastAPI shares it
+    return batch
@@ -0,0 +1,106 @@
+"""orjson rendering for API responses.
+
+Routes that return a Response skip FastAPI's response_model validation and
+`jsonable_encoder` pass, while the response_model still documents the route in
+the OpenAPI schema. The hot read routes return `render(...)` for that reason.
+
+Large pages are returned by the controllers as a `StreamedPage`, rendered as
+a streamed body built from a server-side cursor a batch of rows at a time.
+"""
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator
+
+import orjson
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+from oxeo.api.models.rows import Row
+
+# rows fetched per round trip, and postprocessed and serialised together
+STREAM_BATCH_SIZE = 1000
+
+
+class StreamedPage:
+    """A page of results, fetched and serialised STREAM_BATCH_SIZE rows at a time.
+
+    `rows` yields up to `limit` + 1 rows; the extra one only sets next_page.
+    `postprocess(rows, next_page)` builds the same page the non-streamed path
+    returns, and `key` names its list of items.
+    """
+
+    def __init__(
+        self,
+        rows: Iterable,
+        limit: int,
+        page: int,
+        postprocess: Callable,
+        key: str,
+    ):
+        self.rows = rows
+        self.limit = limit
+        self.page = page
+        self.postprocess = postprocess
+        self.key = key
+
+    def _split(self, next_page):
+        # the serialised page with no items, either side of its items list
+        marker = b'"' + self.key.encode() + b'":[]'
+        head, tail = dumps(self.postprocess([], next_page)).split(marker, 1)
+        return head + marker[:-1], b"]" + tail
+
+    def chunks(self) -> Iterator[bytes]:
+        rows = iter(self.rows)
+
+        head, _ = self._split(None)
+        yield head
+
+        n_rows = 0
+        while n_rows < self.limit:
+            batch = list(islice(rows, min(STREAM_BATCH_SIZE, self.limit - n_rows)))
+            if not batch:
+                break
+            items = getattr(self.postprocess(batch, None), self.key)
+            chunk = b",".join(dumps(item) for item in items)
+            yield chunk if not n_rows else b"," + chunk
+            n_rows += len(batch)
+
+        next_page = self.page + 1 if next(rows, None) is not None else None
+        _, tail = self._split(next_page)
+        yield tail
+
+    def materialise(self):
+        """The whole page, as the non-streamed path returns it"""
+
+        rows = list(islice(self.rows, self.limit + 1))
+        next_page = self.page + 1 if len(rows) > self.limit else None
+        return self.postprocess(rows[0 : self.limit], next_page)  # noqa
+
+
+def _default(obj):
+    if isinstance(obj, Row):
+        return obj.to_dict()
+    if isinstance(obj, StreamedPage):
+        # embedded in a larger body, e.g. a batch
+        return obj.materialise()
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def render(content: Any) -> Response:
+    """`content` serialised to JSON bytes, unless it is already a Response"""
+
+    if isinstance(content, Response):
+        return content
+    if isinstance(content, StreamedPage):
+        return StreamingResponse(content.chunks(), media_type="application/json")
+    return ORJSONResponse(content)
@@ -3,12 +3,21 @@ import os
 from datetime import timedelta
 from typing import List, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    Request,
+    status,
+)
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
 import oxeo.api.controllers as C
+from oxeo.api import ratelimit
 from oxeo.api.models import bridges, database, schemas
+from oxeo.api.responses import render
 
 router = APIRouter()
 
@@ -17,6 +26,10 @@ admin_checker = C.auth.RoleChecker(["admin"])
 requires_admin = [Depends(C.auth.get_current_active_user), Depends(admin_checker)]
 
 
+def rate_limited(resource, query_dependency):
+    return [Depends(ratelimit.rate_limit(resource, query_dependency))]
+
+
 def err_msg(key, val, type_ob):
     if key == "geometry":
         msg = f"Parameter '{key}' could not be parsed." + "Please submit valid geojson."
@@ -134,20 +147,60 @@ def read_users(
     return user
 
 
+async def aoi_body(request: Request):
+    return C.geom.parse_aoi_body(
+        await request.body(), request.headers.get("content-type", "")
+    )
+
+
 @router.post(
     "/aoi/",
     dependencies=requires_admin,
     status_code=status.HTTP_201_CREATED,
     tags=["AOIs"],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "oneOf": [
+                            {"$ref": "#/components/schemas/Feature"},
+                            {"$ref": "#/components/schemas/FeatureCollection"},
+                        ]
+                    }
+                },
+                "application/x-ndjson": {
+                    "schema": {"$ref": "#/components/schemas/Feature"}
+                },
+            },
+        }
+    },
 )
 def post_aoi(
-    aoi: schemas.Feature,
+    aoi: Union[schemas.Feature, list] = Depends(aoi_body),
     db: Session = Depends(database.get_db),
     user: database.User = Depends(C.auth.get_current_active_user),
 ):
-    _aoi = C.geom.create_aoi(db=db, aoi=aoi, user=user)
+    """Create an AOI from a Feature, or many from a FeatureCollection or from
+    newline-delimited features (`Content-Type: application/x-ndjson`).
 
-    return {"id": _aoi.id}
+    Bulk requests return the new ids in feature order, with `null` and an entry
+    in `errors` for each feature that was rejected.
+    """
+    if isinstance(aoi, schemas.Feature):
+        _aoi = C.geom.create_aoi(db=db, aoi=aoi, user=user)
+        return {"id": _aoi.id}
+
+    ids, errors = C.geom.create_aois(db=db, features=aoi, user=user)
+    errors = [
+        {"index": index, "detail": detail} for index, detail in sorted(errors.items())
+    ]
+
+    if errors and all(_id is None for _id in ids):
+        raise HTTPException(status_code=400, detail=errors)
+
+    return {"id": ids, "errors": errors}
 
 
 @router.post(
@@ -166,9 +219,16 @@ def update_aoi(
     return {"id": _aoi.id}
 
 
+@router.get("/aoi/repairs/", dependencies=requires_admin, tags=["AOIs"])
+def get_aoi_repairs():
+    """Counts of AOI geometries checked and repaired on write by this worker
+    since it started, per repair step."""
+    return dict(C.repair.repair_stats)
+
+
 @router.get(
     "/aoi/",
-    dependencies=requires_auth,
+    dependencies=requires_auth + rate_limited("aoi", bridges.to_aoiquery),
     response_model=Union[schemas.FeatureCollection, str],
     tags=["AOIs"],
 )
@@ -178,7 +238,7 @@ def get_aoi(
     aoi_query: schemas.AOIQuery = Depends(bridges.to_aoiquery),
 ):
 
-    return C.geom.get_aoi(aoi_query=aoi_query, db=db, user=user)
+    return render(C.geom.get_aoi(aoi_query=aoi_query, db=db, user=user))
 
 
 @router.post(
@@ -225,8 +285,8 @@ def update_events(
 
 @router.get(
     "/events/",
-    dependencies=requires_auth,
-    response_model=schemas.EventQueryReturn,
+    dependencies=requires_auth + rate_limited("events", bridges.to_eventquery),
+    response_model=Union[schemas.EventQueryReturn, schemas.EventQueryGroupedReturn],
     tags=["Events"],
 )
 def get_events(
@@ -235,7 +295,23 @@ def get_events(
     event_query: schemas.EventQuery = Depends(bridges.to_eventquery),
 ):
 
-    return C.geom.get_events(event_query=event_query, db=db, user=user)
+    return render(C.geom.get_events(event_query=event_query, db=db, user=user))
+
+
+@router.get(
+    "/events/latest/",
+    dependencies=requires_auth
+    + rate_limited("latest_events", bridges.to_latesteventquery),
+    response_model=schemas.EventQueryReturn,
+    tags=["Events"],
+)
+def get_latest_events(
+    db: Session = Depends(database.get_db),
+    user: database.User = Depends(C.auth.get_current_active_user),
+    latest_query: schemas.LatestEventQuery = Depends(bridges.to_latesteventquery),
+):
+
+    return render(C.geom.get_latest_events(latest_query=latest_query, db=db, user=user))
 
 
 @router.post("/assets/", dependencies=requires_admin, status_code=200, tags=["Assets"])
@@ -276,7 +352,7 @@ def update_assets(
 
 @router.get(
     "/assets/",
-    dependencies=requires_auth,
+    dependencies=requires_auth + rate_limited("assets", bridges.to_assetquery),
     response_model=schemas.FeatureCollection,
     tags=["Assets"],
 )
@@ -286,7 +362,7 @@ def get_assets(
     asset_query: schemas.AssetQuery = Depends(bridges.to_assetquery),
 ):
 
-    return C.asset.get_assets(asset_query=asset_query, db=db, user=user)
+    return render(C.asset.get_assets(asset_query=asset_query, db=db, user=user))
 
 
 @router.post(
@@ -316,7 +392,7 @@ def update_companies(
 
 @router.get(
     "/companies/",
-    dependencies=requires_auth,
+    dependencies=requires_auth + rate_limited("companies", bridges.to_companyquery),
     response_model=schemas.CompanyQueryReturn,
     tags=["Companies"],
 )
@@ -326,7 +402,7 @@ def get_companies(
     company_query: schemas.CompanyQuery = Depends(bridges.to_companyquery),
 ):
 
-    return C.asset.get_companies(company_query, db, user)
+    return render(C.asset.get_companies(company_query, db, user))
 
 
 @router.post(
@@ -340,8 +416,101 @@ def delete_objs(
     db: Session = Depends(database.get_db),
     user: database.User = Depends(C.auth.get_current_active_user),
 ):
-    return {
-        "dropped ids": C.geom.delete_objects(
-            delete_query=delete_query, db=db, user=user
-        )
-    }
+    dropped_ids, counts = C.geom.delete_objects(
+        delete_query=delete_query, db=db, user=user
+    )
+
+    return {"dropped ids": dropped_ids, "counts": counts}
+
+
+@router.post(
+    "/batch/",
+    dependencies=requires_auth + rate_limited("batch", ratelimit.batch_body),
+    tags=["Batch"],
+)
+def post_batch(
+    batch: schemas.BatchRequest,
+    db: Session = Depends(database.get_db),
+    user: database.User = Depends(C.auth.get_current_active_user),
+):
+    """Run several named AOI, event, asset and company queries in one request.
+
+    Each query is `{"resource": ..., "query": {...}}`, where `query` takes the
+    same fields as the matching GET route. Results are returned under the
+    same names.
+    """
+
+    return render(C.batch.run_batch(batch=batch, db=db, user=user))
+
+
+@router.get(
+    "/changes/",
+    dependencies=requires_auth + rate_limited("changes", bridges.to_changesquery),
+    tags=["Sync"],
+)
+def get_changes(
+    db: Session = Depends(database.get_db),
+    user: database.User = Depends(C.auth.get_current_active_user),
+    changes_query: schemas.ChangesQuery = Depends(bridges.to_changesquery),
+):
+    """Rows changed or deleted since `since`, as NDJSON.
+
+    Pass the `X-Changes-Until` response header back as the next `since`.
+    """
+
+    return C.sync.get_changes(changes_query=changes_query, db=db, user=user)
+
+
+@router.post(
+    "/exports/",
+    dependencies=requires_auth,
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=schemas.ExportJob,
+    tags=["Exports"],
+)
+def post_export(
+    export: schemas.ExportCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(database.get_db),
+    user: database.User = Depends(C.auth.get_current_active_user),
+):
+    """Export every row matching an AOI, event or asset query to a file.
+
+    `query` takes the same fields as the matching GET route; `limit` and
+    `page` are ignored. Poll `/exports/{id}` until the job is `done`, then
+    fetch it from `/exports/{id}/download`.
+    """
+
+    db_job = C.export.create_export(export=export, db=db, user=user)
+
+    if C.export.EXPORT_INLINE:
+        background_tasks.add_task(C.export.run_pending_export, db_job.id)
+
+    return db_job
+
+
+@router.get(
+    "/exports/{export_id}",
+    dependencies=requires_auth,
+    response_model=schemas.ExportJob,
+    tags=["Exports"],
+)
+def get_export(
+    export_id: str,
+    db: Session = Depends(database.get_db),
+    user: database.User = Depends(C.auth.get_current_active_user),
+):
+    return C.export.get_export(export_id=export_id, db=db, user=user)
+
+
+@router.get(
+    "/exports/{export_id}/download",
+    dependencies=requires_auth,
+    tags=["Exports"],
+)
+def download_export(
+    export_id: str,
+    db: Session = Depends(database.get_db),
+    user: database.User = Depends(C.auth.get_current_active_user),
+):
+    return C.export.download_export(export_id=export_id, db=db, user=user)
@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from oxeo.api.models import database
+
+
+@pytest.fixture
+def db():
+    """A session on the PG_DB_* database, rolled back after the test.
+
+    Tests using it are skipped when no database is reachable.
+    """
+
+    try:
+        connection = database.engine.connect()
+    except OperationalError:
+        pytest.skip("no database available")
+
+    transaction = connection.begin()
+    session = Session(bind=connection)
+
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
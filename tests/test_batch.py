@@ -0,0 +1,55 @@
+import pytest
+from fastapi import HTTPException
+
+from oxeo.api.controllers import batch
+from oxeo.api.models import schemas
+
+
+def make_batch(**queries):
+    return schemas.BatchRequest(
+        queries={
+            name: dict(resource=resource, query=query)
+            for name, (resource, query) in queries.items()
+        }
+    )
+
+
+def test_run_batch_dispatches_by_resource(monkeypatch):
+    calls = []
+
+    def fake_controller(query, db, user):
+        calls.append((type(query), db))
+        return {"ok": True}
+
+    monkeypatch.setitem(
+        batch.BATCH_RESOURCES, "companies", (schemas.CompanyQuery, fake_controller)
+    )
+    monkeypatch.setitem(
+        batch.BATCH_RESOURCES, "assets", (schemas.AssetQuery, fake_controller)
+    )
+
+    db = object()
+    results = batch.run_batch(
+        make_batch(a=("companies", {"name": "x"}), b=("assets", {"limit": 5})),
+        db,
+        None,
+    )
+
+    assert results == {"a": {"ok": True}, "b": {"ok": True}}
+    assert calls == [(schemas.CompanyQuery, db), (schemas.AssetQuery, db)]
+
+
+@pytest.mark.parametrize(
+    "resource, query",
+    [
+        ("users", {}),
+        ("events", {"aoi_id": 1}),
+        ("aoi", {"format": "geobuf"}),
+    ],
+)
+def test_run_batch_rejects_invalid_queries_before_running(resource, query):
+    with pytest.raises(HTTPException) as exc:
+        batch.run_batch(make_batch(bad=(resource, query)), None, None)
+
+    assert exc.value.status_code == 400
+    assert exc.value.detail.startswith("Query 'bad'")
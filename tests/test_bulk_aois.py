@@ -0,0 +1,135 @@
+import orjson
+import pytest
+import shapely
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from sqlalchemy.dialects import postgresql
+
+from oxeo.api.controllers import geom
+from oxeo.api.models import schemas
+
+SQUARE = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+BOWTIE = {"type": "Polygon", "coordinates": [[[0, 0], [1, 1], [1, 0], [0, 1], [0, 0]]]}
+FLAT = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [2, 0], [0, 0]]]}
+
+
+def feature(geometry=SQUARE, labels=("waterbody",), **kwargs):
+    return dict(type="Feature", geometry=geometry, labels=list(labels), **kwargs)
+
+
+def test_check_aoi_geometries_normalises_and_reports_by_index():
+    multi = {"type": "MultiPolygon", "coordinates": [SQUARE["coordinates"]]}
+    point = {"type": "Point", "coordinates": [0, 0]}
+
+    ewkb, errors = geom.check_aoi_geometries(
+        [SQUARE, FLAT, point, None, {"type": "Nope"}, multi]
+    )
+
+    assert set(errors) == {1, 2, 3, 4}
+    assert errors[1] == "Geometry has no area once made valid."
+    assert "got Point" in errors[2]
+    assert "could not be parsed" in errors[3] and "could not be parsed" in errors[4]
+
+    assert [e is None for e in ewkb] == [False, True, True, True, True, False]
+    # polygons are stored as single-part multipolygons, with the SRID
+    square = shapely.from_wkb(ewkb[0])
+    assert square.geom_type == "MultiPolygon" and shapely.get_srid(square) == 4326
+    assert ewkb[0] == ewkb[5]
+
+
+def test_check_aoi_geometries_repairs_invalid_polygons():
+    (ewkb,), errors = geom.check_aoi_geometries([BOWTIE])
+
+    assert not errors
+    bowtie = shapely.from_wkb(ewkb)
+    assert bowtie.is_valid and len(bowtie.geoms) == 2
+
+
+class RecordingSession:
+    def __init__(self):
+        self.statements = []
+        self.next_id = 100
+        self.committed = False
+
+    def execute(self, stmt):
+        self.statements.append(stmt)
+        return self
+
+    def scalars(self):
+        params = self.statements[-1].compile(dialect=postgresql.dialect()).params
+        n_rows = sum(key.startswith("geometry_m") for key in params)
+        ids = list(range(self.next_id, self.next_id + n_rows))
+        self.next_id += n_rows
+        return iter(ids)
+
+    def commit(self):
+        self.committed = True
+
+
+def test_create_aois_inserts_valid_features_in_chunks(monkeypatch):
+    synced = []
+    monkeypatch.setattr(geom, "AOI_INSERT_CHUNK", 2)
+    monkeypatch.setattr(
+        geom, "sync_aoi_subdivisions", lambda db, ids: synced.append(ids)
+    )
+
+    features = [
+        feature(),
+        feature(labels=["not-a-label"]),
+        feature(geometry=FLAT),
+        None,
+        dict(
+            type="Feature",
+            geometry=SQUARE,
+            properties={"labels": "basin"},
+            bbox=[0, 0, 1, 1],
+        ),
+        feature(),
+    ]
+    db = RecordingSession()
+
+    ids, errors = geom.create_aois(db, features, None)
+
+    assert ids == [100, None, None, None, 101, 102]
+    assert sorted(errors) == [1, 2, 3]
+    assert "not-a-label" in errors[1]
+    assert errors[3] == "Not a GeoJSON Feature."
+
+    # three valid features in chunks of two
+    assert len(db.statements) == 2
+    params = db.statements[0].compile(dialect=postgresql.dialect()).params
+    assert params["labels_m1"] == ["basin"]
+    assert params["properties_m1"] == {"bbox": [0, 0, 1, 1]}
+
+    assert synced == [[100, 101, 102]] and db.committed
+
+
+def test_create_aois_caps_features(monkeypatch):
+    monkeypatch.setattr(geom, "AOI_BULK_MAX", 2)
+
+    with pytest.raises(HTTPException) as e:
+        geom.create_aois(RecordingSession(), [feature()] * 3, None)
+    assert e.value.status_code == 400
+
+
+def test_parse_aoi_body():
+    single = geom.parse_aoi_body(orjson.dumps(feature()), "application/json")
+    assert isinstance(single, schemas.Feature)
+
+    collection = {"type": "FeatureCollection", "features": [feature(), feature()]}
+    assert geom.parse_aoi_body(orjson.dumps(collection), "application/json") == [
+        feature(),
+        feature(),
+    ]
+
+    ndjson = orjson.dumps(feature()) + b"\n{not json\n\n" + orjson.dumps(feature())
+    assert geom.parse_aoi_body(ndjson, "application/x-ndjson") == [
+        feature(),
+        None,
+        feature(),
+    ]
+
+    with pytest.raises(HTTPException):
+        geom.parse_aoi_body(b"{", "application/json")
+    with pytest.raises(RequestValidationError):
+        geom.parse_aoi_body(b'{"type": "Feature"}', "application/json")
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from oxeo.api import compression
+
+FEATURES = [{"type": "Feature", "coordinates": [[32.7, -17.4]] * 50}] * 20
+
+
+def make_client():
+    app = FastAPI()
+    app.add_middleware(compression.CompressionMiddleware)
+
+    @app.get("/large")
+    def large():
+        return FEATURES
+
+    @app.get("/small")
+    def small():
+        return {"id": 1}
+
+    @app.get("/png")
+    def png():
+        return Response(b"\x89PNG" * 500, media_type="image/png")
+
+    @app.get("/stream")
+    def stream():
+        lines = (json.dumps(f) + "\n" for f in FEATURES)
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize(
+    "accept, expected",
+    [
+        ("gzip, deflate", "gzip"),
+        ("gzip;q=0, deflate", None),
+        ("*", "gzip"),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_negotiate(accept, expected):
+    assert compression.negotiate(accept, {"gzip": None}) == expected
+
+
+def test_negotiate_prefers_highest_q_then_server_preference():
+    encoders = {"gzip": None, "br": None, "zstd": None}
+
+    assert compression.negotiate("gzip, br, zstd", encoders) == "br"
+    assert compression.negotiate("gzip, br;q=0.5, zstd;q=0.8", encoders) == "gzip"
+    assert compression.negotiate("zstd, gzip;q=0.9", encoders) == "zstd"
+
+
+def test_large_responses_are_compressed():
+    response = make_client().get("/large", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert response.json() == FEATURES
+
+
+def test_small_responses_are_not_compressed():
+    response = make_client().get("/small", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"id": 1}
+
+
+@pytest.mark.parametrize(
+    "path, accept", [("/small", "gzip"), ("/large", "identity"), ("/small", "")]
+)
+def test_uncompressed_responses_vary_on_accept_encoding(path, accept):
+    response = make_client().get(path, headers={"Accept-Encoding": accept})
+
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+def test_compressed_content_types_do_not_vary():
+    for accept in ["gzip", "identity"]:
+        response = make_client().get("/png", headers={"Accept-Encoding": accept})
+
+        assert "content-encoding" not in response.headers
+        assert "vary" not in response.headers
+
+
+def test_streaming_responses_are_compressed_incrementally():
+    response = make_client().get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert [json.loads(line) for line in response.text.splitlines()] == FEATURES
@@ -0,0 +1,151 @@
+import gzip
+import json
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from shapely import geometry, wkb
+
+from oxeo.api.controllers import export
+from oxeo.api.models import schemas
+
+
+def aoi_row(id, labels=("waterbody",), properties=None, geometry=None):
+    return SimpleNamespace(
+        id=id, labels=list(labels), properties=properties or {}, geometry=geometry
+    )
+
+
+def event_row(id, aoi_id, day, value):
+    return SimpleNamespace(
+        id=id,
+        labels=["ndvi"],
+        aoi_id=aoi_id,
+        datetime=day,
+        properties={"value": value},
+    )
+
+
+@pytest.mark.parametrize(
+    "resource, output_format, query, message",
+    [
+        ("companies", "ndjson", {}, "'resource' must be one of"),
+        ("aoi", "csv", {}, "'format' must be one of"),
+        ("events", "ndjson", {"aoi_id": 1}, "'query'"),
+        ("aoi", "ndjson", {"precision": 99}, "'precision'"),
+        ("aoi", "ndjson", {"clip": True}, "'clip' requires a 'geometry'"),
+    ],
+)
+def test_parse_export_rejects_invalid_jobs(resource, output_format, query, message):
+    with pytest.raises(HTTPException) as exc:
+        export.parse_export(
+            schemas.ExportCreate(resource=resource, format=output_format, query=query)
+        )
+
+    assert exc.value.status_code == 400
+    assert message in exc.value.detail
+
+
+def test_write_ndjson_writes_features_like_the_get_routes(tmp_path):
+    filename = str(tmp_path / "aois.ndjson.gz")
+    rows = [
+        aoi_row(
+            1, properties={"name": "a"}, geometry='{"type":"Point","coordinates":[1,2]}'
+        ),
+        aoi_row(2),
+    ]
+
+    assert export.write_ndjson(iter(rows), "aoi", filename) == 2
+
+    with gzip.open(filename, "rt") as f:
+        features = [json.loads(line) for line in f]
+
+    assert features[0] == {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [1, 2]},
+        "properties": {"name": "a", "labels": ["waterbody"], "aoi_id": 1},
+        "id": "1",
+    }
+    assert features[1]["geometry"] is None
+
+
+def test_write_ndjson_writes_events(tmp_path):
+    filename = str(tmp_path / "events.ndjson.gz")
+    export.write_ndjson([event_row(7, 1, date(2020, 1, 1), 0.5)], "events", filename)
+
+    with gzip.open(filename, "rt") as f:
+        assert json.loads(f.readline()) == {
+            "id": 7,
+            "labels": ["ndvi"],
+            "aoi_id": 1,
+            "datetime": "2020-01-01",
+            "keyed_values": {"value": 0.5},
+        }
+
+
+def test_write_parquet_writes_geoparquet_in_batches(tmp_path, monkeypatch):
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+
+    shapes = [geometry.MultiPolygon([geometry.box(i, 0, i + 1, 1)]) for i in range(5)]
+    rows = (
+        aoi_row(i, properties={"i": i}, geometry=memoryview(shape.wkb))
+        for i, shape in enumerate(shapes)
+    )
+    filename = str(tmp_path / "aois.parquet")
+
+    assert export.write_parquet(rows, "aoi", filename) == 5
+
+    parquet = pq.ParquetFile(filename)
+    assert parquet.metadata.num_row_groups == 3
+    geo = json.loads(parquet.schema_arrow.metadata[b"geo"])
+    assert geo["primary_column"] == "geometry"
+    assert geo["columns"]["geometry"]["encoding"] == "WKB"
+
+    table = parquet.read().to_pydict()
+    assert table["id"] == [0, 1, 2, 3, 4]
+    assert json.loads(table["properties"][3]) == {"i": 3}
+    assert wkb.loads(table["geometry"][4]).equals(shapes[4])
+
+
+def test_local_store_moves_files_under_its_root(tmp_path):
+    src = tmp_path / "src.ndjson.gz"
+    src.write_bytes(b"data")
+
+    store = export.get_store(f"file://{tmp_path / 'exports'}")
+    store.put("job.ndjson.gz", str(src))
+
+    assert not src.exists()
+    assert (tmp_path / "exports" / "job.ndjson.gz").read_bytes() == b"data"
+    assert store.response("job.ndjson.gz").path == store.path("job.ndjson.gz")
+
+
+def test_run_export_records_failures_on_the_job(tmp_path):
+    class FakeSession:
+        def rollback(self):
+            pass
+
+        def commit(self):
+            pass
+
+    db_job = SimpleNamespace(
+        id="abc", resource="events", format="ndjson", query={}, error=None
+    )
+
+    export.run_export(FakeSession(), db_job, store=export.LocalStore(str(tmp_path)))
+
+    assert db_job.status == "failed"
+    assert db_job.error.startswith("'query'")
+    assert db_job.finished_at is not None
+
+
+def test_create_export_needs_s3_on_lambda(monkeypatch):
+    monkeypatch.setattr(export, "ON_LAMBDA", True)
+    monkeypatch.setattr(export, "EXPORT_STORE", "file:///tmp/oxeo-exports")
+
+    with pytest.raises(HTTPException) as e:
+        export.create_export(
+            schemas.ExportCreate(resource="aoi", format="ndjson", query={}), None, None
+        )
+    assert e.value.status_code == 503
@@ -0,0 +1,221 @@
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+from geoalchemy2.shape import from_shape
+from shapely import geometry
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from oxeo.api.controllers import geom, planner
+from oxeo.api.models import database, schemas
+
+
+def compile_pg(clause):
+    return str(clause.compile(dialect=postgresql.dialect()))
+
+
+def test_clip_geometry_short_circuits_and_subdivides():
+    clip_geom = from_shape(geometry.box(0, 0, 1, 1), srid=4326)
+    sql = compile_pg(geom.clip_geometry(database.AOI.geometry, clip_geom))
+
+    # covered geometries are returned as-is, before any intersection is attempted
+    assert sql.index("ST_CoveredBy(aois.geometry") < sql.index("ST_Intersection")
+    # large geometries are cut piecewise from the pre-subdivided side table
+    assert "aoi_subdivisions.aoi_id = aois.id" in sql
+    assert sql.startswith("ST_Multi(ST_CollectionExtract(")
+
+
+@pytest.mark.parametrize("order, sql", [(None, "ASC"), ("desc", "DESC")])
+def test_get_events_per_aoi_uses_lateral_limit(monkeypatch, order, sql):
+    monkeypatch.setattr(planner, "QUERY_COST_BUDGET", 1000)
+    statements = []
+
+    class RecordingSession:
+        def execute(self, stmt):
+            statements.append(compile_pg(stmt))
+            return self
+
+        def all(self):
+            return []
+
+        def scalar(self):
+            # the admission check's EXPLAIN
+            return [{"Plan": {"Node Type": "Nested Loop", "Total Cost": 1.0}}]
+
+    event_query = schemas.EventQuery(
+        aoi_id=[3, 1, 3],
+        start_datetime=date(2020, 1, 1),
+        end_datetime=date(2021, 1, 1),
+        limit_per_aoi=12,
+        order=order,
+    )
+
+    result = geom.get_events(event_query, RecordingSession(), None)
+
+    assert result.events == {} and result.next_page is None
+    assert statements[0].startswith("EXPLAIN (FORMAT JSON) SELECT")
+    assert "JOIN LATERAL" in statements[-1]
+    # same default order as without limit_per_aoi
+    assert f"ORDER BY events.datetime {sql}, events.id {sql}" in statements[-1]
+
+
+def test_get_events_per_aoi_caps_total_rows():
+    event_query = schemas.EventQuery(
+        aoi_id=list(range(500)),
+        start_datetime=date(2020, 1, 1),
+        end_datetime=date(2021, 1, 1),
+        limit_per_aoi=100,
+    )
+
+    with pytest.raises(HTTPException) as exc:
+        geom.get_events(event_query, None, None)
+    assert exc.value.status_code == 400
+
+
+def test_filter_keyed_values_compiles_to_indexable_operators():
+    Q = geom.filter_keyed_values(
+        select(database.Event),
+        database.Event.properties,
+        {"crop": "maize", "tile": None, "value": {"gt": 5, "lte": 9}},
+    )
+    compiled = Q.compile(dialect=postgresql.dialect())
+
+    assert "events.properties @> " in str(compiled)
+    assert "events.properties ? " in str(compiled)
+    assert '$."value" ? (@ > 5 && @ <= 9)' in compiled.params.values()
+
+
+@pytest.mark.parametrize(
+    "keyed_value",
+    [
+        {"in": "a"},
+        # an empty or_() would drop the criterion and match every row
+        {"in": []},
+        # not jsonpath literals; Postgres would reject the path
+        {"gt": [1]},
+        {"lte": {"a": 1}},
+        {"lt": None},
+    ],
+)
+def test_filter_keyed_values_rejects_bad_operands(keyed_value):
+    with pytest.raises(HTTPException) as e:
+        geom.filter_keyed_values(
+            select(database.Event), database.Event.properties, {"crop": keyed_value}
+        )
+    assert e.value.status_code == 400
+
+
+def test_delete_with_tombstones_is_one_statement():
+    statements = []
+
+    class RecordingSession:
+        def execute(self, stmt):
+            statements.append(compile_pg(stmt))
+            return []
+
+    ids = geom.delete_with_tombstones(
+        RecordingSession(), database.Event, database.Event.aoi_id == 3
+    )
+
+    assert ids == [] and len(statements) == 1
+    assert statements[0].startswith("WITH deleted_events AS")
+    assert "INSERT INTO tombstones (table_name, object_id)" in statements[0]
+
+
+def test_delete_objects_rejects_unknown_table():
+    with pytest.raises(HTTPException) as exc:
+        geom.delete_objects(schemas.DeleteObj(table="events", id=[1]), None, None)
+    assert exc.value.status_code == 400
+
+
+def test_pg2gj_accepts_geojson_text():
+    geojson = '{"type":"Point","coordinates":[32.7,-17.4]}'
+    assert geom.pg2gj(geojson) == {"type": "Point", "coordinates": [32.7, -17.4]}
+
+
+@pytest.mark.parametrize("precision", [-1, 16])
+def test_check_precision_bounds(precision):
+    with pytest.raises(HTTPException) as exc:
+        geom.check_precision(precision)
+    assert exc.value.status_code == 400
+
+
+def test_geobuf_output_honours_precision(monkeypatch):
+    precisions = []
+
+    def encode(fc, precision):
+        precisions.append(precision)
+        return b""
+
+    monkeypatch.setattr(geom.geobuf, "encode", encode)
+    aoi = database.AOI(
+        id=1,
+        geometry='{"type":"Point","coordinates":[32.123456789,-17.123456789]}',
+        labels=["waterbody"],
+        properties={},
+    )
+
+    geom.postprocess_aois([aoi], None, "geobuf")
+    geom.postprocess_aois([aoi], None, "geobuf", precision=3)
+
+    assert precisions == [geom.GEOBUF_PRECISION, 3]
+
+
+def test_ewkb_hash_ignores_ring_start_and_orientation():
+    square = geom.shp2ewkb(geometry.MultiPolygon([geometry.box(0, 0, 1, 1)]))
+    rotated = geom.shp2ewkb(
+        geometry.MultiPolygon(
+            [geometry.Polygon([(1, 1), (1, 0), (0, 0), (0, 1), (1, 1)])]
+        )
+    )
+    bigger = geom.shp2ewkb(geometry.MultiPolygon([geometry.box(0, 0, 2, 1)]))
+
+    assert geom.ewkb_hash(square) == geom.ewkb_hash(rotated)
+    assert geom.ewkb_hash(square) != geom.ewkb_hash(bigger)
+
+
+@pytest.mark.parametrize("changed", [False, True])
+def test_update_aoi_compares_geometry_hashes(monkeypatch, changed):
+    synced = []
+    monkeypatch.setattr(
+        geom, "sync_aoi_subdivisions", lambda db, ids: synced.extend(ids)
+    )
+
+    stored = geom.shp2ewkb(geometry.MultiPolygon([geometry.box(0, 0, 1, 1)]))
+    db_aoi = database.AOI(id=7, labels=["waterbody"], properties={})
+
+    class FakeSession:
+        def query(self, *entities):
+            # the stored geometry is never selected, only its hash
+            sql = compile_pg(select(*entities))
+            assert "md5(ST_AsBinary(ST_Normalize(aois.geometry)" in sql
+            return self
+
+        def options(self, *options):
+            return self
+
+        def filter(self, *criteria):
+            return self
+
+        def first(self):
+            return db_aoi, geom.ewkb_hash(stored)
+
+        def flush(self):
+            pass
+
+        def commit(self):
+            pass
+
+    coords = [[[0, 0], [2 if changed else 1, 0], [1, 1], [0, 1], [0, 0]]]
+    aoi = schemas.Feature(
+        id="7",
+        geometry=schemas.Geometry(type="Polygon", coordinates=coords),
+        labels=["waterbody"],
+        properties={},
+    )
+
+    geom.update_aoi(FakeSession(), aoi, None)
+
+    assert synced == ([7] if changed else [])
+    assert (db_aoi.geometry is not None) == changed
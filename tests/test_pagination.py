@@ -0,0 +1,90 @@
+from datetime import date
+
+from sqlalchemy import text
+
+from oxeo.api.controllers import geom
+from oxeo.api.models import database, schemas
+
+N_EVENTS = 100_000
+
+
+def seed_aoi(db):
+    db_aoi = database.AOI(
+        geometry="MULTIPOLYGON(((0 0, 0 1, 1 1, 1 0, 0 0)))",
+        labels=["waterbody"],
+        properties={"test": "pagination"},
+    )
+    db.add(db_aoi)
+    db.flush()
+    return db_aoi
+
+
+def test_events_pages_have_no_gaps_or_duplicates(db):
+    db_aoi = seed_aoi(db)
+
+    # only 30 distinct dates, so ordering has to fall back on id
+    db.execute(
+        text(
+            """
+            INSERT INTO events (labels, aoi_id, datetime, properties)
+            SELECT ARRAY['ndvi']::"EventLabel"[], :aoi_id,
+                DATE '2020-01-01' + i % 30, '{}'::jsonb
+            FROM generate_series(1, :n) AS i
+            """
+        ),
+        {"aoi_id": db_aoi.id, "n": N_EVENTS},
+    )
+
+    seen = []
+    page = 0
+    while page is not None:
+        result = geom.get_events(
+            schemas.EventQuery(
+                aoi_id=db_aoi.id,
+                start_datetime=date(2020, 1, 1),
+                end_datetime=date(2020, 12, 31),
+                limit=10000,
+                page=page,
+                count="exact" if page == 0 else None,
+            ),
+            db,
+            None,
+        ).materialise()
+        if page == 0:
+            assert result.total == N_EVENTS
+        seen.extend((event.datetime, event.id) for event in result.events)
+        page = result.next_page
+
+    assert len(seen) == N_EVENTS
+    assert len(set(seen)) == N_EVENTS
+    assert seen == sorted(seen)
+
+
+def test_aoi_pages_have_no_gaps_or_duplicates(db):
+    db.execute(
+        text(
+            """
+            INSERT INTO aois (geometry, labels, properties)
+            SELECT ST_Multi(ST_MakeEnvelope(i, 0, i + 1, 1, 4326)),
+                ARRAY['waterbody']::"AOILabel"[], '{"test": "pagination"}'::jsonb
+            FROM generate_series(1, 12000) AS i
+            """
+        )
+    )
+
+    seen = []
+    page = 0
+    while page is not None:
+        result = geom.get_aoi(
+            schemas.AOIQuery(
+                keyed_values={"test": "pagination"},
+                limit=geom.STREAM_MIN_LIMIT,
+                page=page,
+            ),
+            db,
+            None,
+        ).materialise()
+        seen.extend(feature.id for feature in result.features)
+        page = result.properties["next_page"]
+
+    assert len(seen) == len(set(seen)) == 12000
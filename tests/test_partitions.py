@@ -0,0 +1,62 @@
+from datetime import date
+
+from oxeo.api.models import partitions
+
+
+def test_partition_bounds_year():
+    bounds = partitions.partition_bounds(date(2019, 6, 1), date(2021, 1, 1))
+
+    assert bounds == [
+        ("events_y2019", date(2019, 1, 1), date(2020, 1, 1)),
+        ("events_y2020", date(2020, 1, 1), date(2021, 1, 1)),
+        ("events_y2021", date(2021, 1, 1), date(2022, 1, 1)),
+    ]
+
+
+def test_partition_bounds_month_rolls_over_year():
+    bounds = partitions.partition_bounds(date(2020, 12, 15), date(2021, 1, 31), "month")
+
+    assert [name for name, _, _ in bounds] == ["events_m2020_12", "events_m2021_01"]
+    assert bounds[0][2] == bounds[1][1] == date(2021, 1, 1)
+
+
+def test_parse_partition_bound():
+    assert partitions.parse_partition_bound(
+        "FOR VALUES FROM ('2020-01-01') TO ('2021-01-01')"
+    ) == (date(2020, 1, 1), date(2021, 1, 1))
+    assert partitions.parse_partition_bound(
+        "FOR VALUES FROM (MINVALUE) TO ('2000-01-01')"
+    ) == (date.min, date(2000, 1, 1))
+    assert partitions.parse_partition_bound("DEFAULT") is None
+
+
+class RecordingConnection:
+    def __init__(self, attached):
+        self.attached = attached
+        self.statements = []
+
+    def execute(self, stmt, params=None):
+        self.statements.append(str(stmt))
+        return self
+
+    def all(self):
+        return self.attached
+
+    def scalar(self):
+        return False
+
+
+def test_ensure_event_partitions_skips_ranges_inside_existing_partitions():
+    db = RecordingConnection(
+        [
+            ("events_default", "DEFAULT"),
+            ("events_y2021", "FOR VALUES FROM ('2021-01-01') TO ('2022-01-01')"),
+        ]
+    )
+
+    created = partitions.ensure_event_partitions(
+        db, date(2021, 11, 1), date(2022, 2, 1), "month"
+    )
+
+    assert created == ["events_m2022_01", "events_m2022_02"]
+    assert not any("events_m2021" in stmt for stmt in db.statements)
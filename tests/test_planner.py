@@ -0,0 +1,64 @@
+import pytest
+from fastapi import HTTPException
+from shapely import geometry
+from sqlalchemy import select
+
+from oxeo.api.controllers import planner
+from oxeo.api.models import database
+
+
+def test_count_vertices_counts_every_ring_and_part():
+    square = geometry.box(0, 0, 10, 10)
+    holed = geometry.Polygon(
+        square.exterior.coords, [geometry.box(1, 1, 2, 2).exterior.coords]
+    )
+
+    assert planner.count_vertices(square) == 5
+    assert planner.count_vertices(geometry.MultiPolygon([holed, square])) == 15
+
+
+def test_check_query_geometry_refuses_large_unnarrowed_areas(monkeypatch):
+    monkeypatch.setattr(planner, "QUERY_MAX_AREA", 100)
+    continent = geometry.box(0, 0, 40, 40)
+
+    with pytest.raises(HTTPException) as exc:
+        planner.check_query_geometry(continent, narrowed=False)
+    assert exc.value.status_code == 400
+    assert "1600 square degrees" in exc.value.detail
+
+    planner.check_query_geometry(continent, narrowed=True)
+    planner.check_query_geometry(geometry.box(0, 0, 1, 1), narrowed=False)
+
+
+def test_check_query_geometry_refuses_detailed_geometries(monkeypatch):
+    monkeypatch.setattr(planner, "QUERY_MAX_VERTICES", 4)
+
+    with pytest.raises(HTTPException) as exc:
+        planner.check_query_geometry(geometry.box(0, 0, 1, 1), narrowed=True)
+    assert "5 vertices" in exc.value.detail
+
+
+def test_check_query_cost_uses_the_planner_estimate(monkeypatch):
+    monkeypatch.setattr(planner, "QUERY_COST_BUDGET", 1000)
+    plans = iter(
+        [
+            {"Node Type": "Seq Scan", "Total Cost": 999.0},
+            # cheap once limited, over the budget to produce every match
+            {
+                "Node Type": "Limit",
+                "Total Cost": 10.0,
+                "Plans": [{"Node Type": "Sort", "Total Cost": 1001.0}],
+            },
+        ]
+    )
+    monkeypatch.setattr(planner, "explain", lambda db, statement: next(plans))
+    statement = select(database.Event.id)
+
+    planner.check_query_cost(None, statement, "narrow it")
+    with pytest.raises(HTTPException) as exc:
+        planner.check_query_cost(None, statement, "use a lower 'limit'")
+
+    assert exc.value.status_code == 400
+    assert "cost 1001," in exc.value.detail
+    assert "Please narrow it (use a lower 'limit')" in exc.value.detail
+    assert exc.value.detail.endswith("/exports/.")
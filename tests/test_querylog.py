@@ -0,0 +1,105 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from oxeo.api import querylog
+
+
+def test_query_shape_collapses_parameters_and_in_lists():
+    statement = (
+        "SELECT events.id FROM events WHERE events.aoi_id IN "
+        "(%(aoi_id_1_1)s, %(aoi_id_1_2)s) AND events.labels @> %(labels_1)s "
+        'AND events.properties @> \'{"tile": "T42"}\' LIMIT 1001'
+    )
+
+    assert querylog.query_shape(statement) == (
+        "SELECT events.id FROM events WHERE events.aoi_id IN (...) "
+        "AND events.labels @> ? AND events.properties @> ? LIMIT ?"
+    )
+
+
+@pytest.fixture
+def engine_and_records():
+    engine = create_engine("sqlite://")
+    records = []
+    slow_query_log = querylog.SlowQueryLog(threshold_ms=0, sinks=[records.append])
+    slow_query_log.install(engine)
+    yield engine, records
+    slow_query_log.remove(engine)
+
+
+def test_slow_queries_are_recorded_with_route_and_parameters(engine_and_records):
+    engine, records = engine_and_records
+
+    token = querylog.current_route.set("GET /events/")
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT :x + 1"), {"x": "a" * 500})
+    finally:
+        querylog.current_route.reset(token)
+
+    (record,) = [r for r in records if r["shape"] == "SELECT ? + ?"]
+    assert record["route"] == "GET /events/"
+    assert len(record["parameters"][0]) == querylog.MAX_PARAM_CHARS + 3
+    assert "plan" not in record
+
+
+def test_failed_statements_keep_timings_balanced(engine_and_records):
+    engine, records = engine_and_records
+
+    with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM missing"))
+        conn.execute(text("SELECT 1"))
+        assert conn.info["query_start"] == []
+
+
+@pytest.mark.parametrize(
+    "statement, expected",
+    [
+        ("SELECT aois.id FROM aois WHERE aois.id = %(id_1)s", True),
+        ("  select 1", True),
+        (
+            "WITH deleted_events AS (DELETE FROM events RETURNING id) "
+            "INSERT INTO tombstones SELECT * FROM deleted_events",
+            False,
+        ),
+        ("SELECT * FROM export_jobs LIMIT 1 FOR UPDATE SKIP LOCKED", False),
+        ("SELECT setval(pg_get_serial_sequence('aois', 'id'), 10)", False),
+        ("UPDATE aois SET labels = %(labels)s", False),
+    ],
+)
+def test_only_plain_selects_are_explained(statement, expected):
+    assert querylog.explainable(statement) is expected
+
+
+def test_failed_explain_leaves_the_transaction_usable():
+    engine = create_engine("sqlite://")
+    records = []
+    # sqlite has no EXPLAIN (FORMAT JSON), so every sampled EXPLAIN fails
+    slow_query_log = querylog.SlowQueryLog(
+        threshold_ms=0, explain_sample=1.0, sinks=[records.append]
+    )
+    slow_query_log.install(engine)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE t (x integer)"))
+            conn.execute(text("INSERT INTO t VALUES (1)"))
+            conn.execute(text("SELECT x FROM t"))
+            assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 1
+    finally:
+        slow_query_log.remove(engine)
+
+    (record,) = [r for r in records if r["shape"] == "SELECT x FROM t"]
+    assert "error" in record["plan"]
+    assert not [r for r in records if "plan" in r and r["shape"].startswith("INSERT")]
+
+
+def test_file_sink_writes_json_lines(tmp_path):
+    sink = querylog.FileSink(str(tmp_path / "slow.jsonl"))
+    sink({"shape": "SELECT ?", "duration_ms": 12.5})
+
+    lines = (tmp_path / "slow.jsonl").read_text().splitlines()
+    assert json.loads(lines[0]) == {"shape": "SELECT ?", "duration_ms": 12.5}
@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from oxeo.api import ratelimit
+from oxeo.api.controllers.authentication import get_current_active_user
+from oxeo.api.models import schemas
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_token_bucket_refills_at_rate():
+    clock = Clock()
+    backend = ratelimit.MemoryBackend(clock=clock)
+
+    assert run(backend.take("k", 8, rate=1, burst=10)) == 0
+    assert run(backend.take("k", 4, rate=1, burst=10)) == pytest.approx(2)
+
+    clock.now = 2
+    assert run(backend.take("k", 4, rate=1, burst=10)) == 0
+
+    # refills stop at the burst size
+    clock.now = 1000
+    assert run(backend.take("k", 10, rate=1, burst=10)) == 0
+    assert run(backend.take("k", 1, rate=1, burst=10)) == pytest.approx(1)
+
+
+def test_query_cost_weights_expensive_features():
+    def aoi(**kwargs):
+        return schemas.AOIQuery(**kwargs).dict()
+
+    cheap = ratelimit.query_cost("aoi", aoi(id=1, limit=10))
+    centroids = ratelimit.query_cost("aoi", aoi(centroids=True, limit=50000))
+    simplified = ratelimit.query_cost("aoi", aoi(simplify=0.01, limit=1000))
+
+    assert cheap == pytest.approx(1.01)
+    assert centroids == pytest.approx(51)
+    assert simplified == pytest.approx(7)
+
+    batch = schemas.BatchRequest(
+        queries={
+            "a": {"resource": "aoi", "query": {"id": 1, "limit": 10}},
+            "b": {"resource": "aoi", "query": {"centroids": True, "limit": 50000}},
+        }
+    )
+    assert ratelimit.query_cost("batch", batch.dict()) == pytest.approx(
+        cheap + centroids
+    )
+
+
+def test_query_cost_charges_limit_per_aoi_rows():
+    def events(**kwargs):
+        return schemas.EventQuery(
+            start_datetime="2020-01-01", end_datetime="2021-01-01", **kwargs
+        ).dict()
+
+    # 500 rows for each of 4 aois, duplicates counted once
+    grouped = ratelimit.query_cost(
+        "events", events(aoi_id=[1, 2, 3, 4, 4], limit_per_aoi=500)
+    )
+    assert grouped == pytest.approx(1 + 2000 / 1000 + 5 / 100)
+
+    # a limit above limit_per_aoi * n_aois still counts
+    single = ratelimit.query_cost("events", events(aoi_id=1, limit_per_aoi=10))
+    assert single == pytest.approx(1 + 20 / 1000)
+
+
+def test_rate_limiting_is_off_unless_configured(monkeypatch):
+    monkeypatch.delenv("RATE_LIMIT_PER_MINUTE", raising=False)
+    assert ratelimit.from_env() is None
+
+    monkeypatch.setenv("RATE_LIMIT_PER_MINUTE", "0")
+    assert ratelimit.from_env() is None
+
+    monkeypatch.setenv("RATE_LIMIT_PER_MINUTE", "60")
+    limiter = ratelimit.from_env()
+    assert isinstance(limiter.backend, ratelimit.MemoryBackend)
+    assert limiter.rate == 1 and limiter.burst == 60
+
+
+def test_concurrent_requests_are_capped_per_user():
+    limiter = ratelimit.RateLimiter(
+        ratelimit.MemoryBackend(), per_minute=600, burst=100, concurrency=1
+    )
+
+    async def scenario():
+        async with limiter.admit(1, cost=1):
+            with pytest.raises(HTTPException) as exc:
+                async with limiter.admit(1, cost=1):
+                    pass
+            # other users are unaffected
+            async with limiter.admit(2, cost=1):
+                pass
+        # the slot is released afterwards
+        async with limiter.admit(1, cost=1):
+            pass
+        return exc.value
+
+    exc = run(scenario())
+    assert exc.status_code == 429
+    assert exc.headers == {"Retry-After": "1"}
+    assert limiter.backend.slots == {}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(
+        ratelimit,
+        "limiter",
+        ratelimit.RateLimiter(
+            ratelimit.MemoryBackend(clock=clock), per_minute=60, burst=10, concurrency=4
+        ),
+    )
+
+    def to_query(limit: int = 20):
+        return schemas.EventQuery(
+            aoi_id=1,
+            start_datetime="2020-01-01",
+            end_datetime="2020-01-02",
+            limit=limit,
+        )
+
+    app = FastAPI()
+
+    @app.get(
+        "/events/", dependencies=[Depends(ratelimit.rate_limit("events", to_query))]
+    )
+    def events():
+        return {"ok": True}
+
+    app.dependency_overrides[get_current_active_user] = lambda: schemas.User(
+        id=1, email="user@oxfordeo.com", role="user", is_active=True
+    )
+    return TestClient(app), clock
+
+
+def test_rejected_requests_get_429_with_retry_after(client):
+    client, clock = client
+
+    # 1 + 10000 / 1000 tokens, more than the bucket holds: charged as a full bucket
+    assert client.get("/events/?limit=10000").status_code == 200
+
+    response = client.get("/events/")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+
+    clock.now = 2
+    assert client.get("/events/").status_code == 200
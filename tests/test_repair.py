@@ -0,0 +1,64 @@
+import shapely
+
+from oxeo.api.controllers import geom, repair
+from oxeo.api.models import schemas
+
+SQUARE = "MULTIPOLYGON(((0 0, 1 0, 1 1, 0 1, 0 0)))"
+
+
+def test_repair_geometries_steps_and_stats(monkeypatch):
+    monkeypatch.setattr(repair, "repair_stats", repair.Counter())
+
+    geoms = shapely.from_wkt(
+        [
+            SQUARE,
+            # clockwise exterior
+            "MULTIPOLYGON(((0 0, 0 1, 1 1, 1 0, 0 0)))",
+            # repeated vertex
+            "MULTIPOLYGON(((0 0, 1 0, 1 0, 1 1, 0 1, 0 0)))",
+            # self-intersecting
+            "MULTIPOLYGON(((0 0, 1 1, 1 0, 0 1, 0 0)))",
+            # no area
+            "MULTIPOLYGON(((0 0, 1 0, 2 0, 0 0)))",
+            # counter-clockwise hole
+            "MULTIPOLYGON(((0 0, 4 0, 4 4, 0 4, 0 0), (1 1, 2 1, 2 2, 1 2, 1 1)))",
+        ]
+    )
+
+    repaired = repair.repair_geometries(geoms, grid_size=None)
+
+    square = shapely.from_wkt(SQUARE)
+    assert shapely.equals_exact(repaired[0], square, tolerance=0)
+    assert shapely.equals_exact(repaired[1], square, tolerance=0)
+    assert shapely.equals_exact(repaired[2], square, tolerance=0)
+    assert repaired[3].is_valid and len(repaired[3].geoms) == 2
+    assert repaired[4] is None
+    hole = repaired[5].geoms[0].interiors[0]
+    assert not hole.is_ccw and repaired[5].geoms[0].exterior.is_ccw
+
+    assert repair.repair_stats == dict(
+        checked=6,
+        deduplicated=1,
+        made_valid=2,
+        reoriented=3,
+        rejected=1,
+        repaired=4,
+    )
+
+
+def test_repair_geometries_snaps_to_grid():
+    geoms = shapely.from_wkt(["MULTIPOLYGON(((0 0, 1.0001 0, 1 1, 0 1, 0 0)))"])
+
+    (snapped,) = repair.repair_geometries(geoms, grid_size=0.01)
+
+    assert shapely.equals(snapped, shapely.from_wkt(SQUARE))
+
+
+def test_schema2shp_repairs_query_geometries():
+    bowtie = schemas.Geometry(
+        type="Polygon", coordinates=[[[0, 0], [1, 1], [1, 0], [0, 1], [0, 0]]]
+    )
+
+    shp = geom.schema2shp(bowtie, allowed_types=["Polygon", "MultiPolygon"])
+
+    assert shp.is_valid and shp.geom_type == "MultiPolygon"
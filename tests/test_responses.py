@@ -0,0 +1,46 @@
+import json
+from datetime import date
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from oxeo.api.controllers import geom
+from oxeo.api.models import database, schemas
+from oxeo.api.responses import dumps, render
+
+
+def test_dumps_matches_jsonable_encoder():
+    aoi = database.AOI(
+        id=7,
+        geometry='{"type":"Polygon","coordinates":[[[0,0],[0,1],[1,1],[0,0]]]}',
+        labels=["waterbody"],
+        properties={"name": "lake"},
+    )
+    events = geom.postprocess_events(
+        [
+            database.Event(
+                id=1,
+                labels=["ndvi"],
+                aoi_id=7,
+                datetime=date(2020, 1, 2),
+                properties={"value": 0.5},
+            )
+        ],
+        next_page=None,
+    )
+
+    for content in [geom.postprocess_aois([aoi], 1, "GeoJSON"), events]:
+        assert json.loads(dumps(content)) == jsonable_encoder(content)
+
+
+def test_dumps_handles_integer_keys():
+    grouped = schemas.EventQueryGroupedReturn(events={3: []}, next_page=None)
+
+    assert json.loads(dumps(grouped))["events"] == {"3": []}
+
+
+def test_render_passes_responses_through():
+    response = Response(b"pbf", media_type="application/octet-stream")
+
+    assert render(response) is response
+    assert render({"a": 1}).body == b'{"a":1}'
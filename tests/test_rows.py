@@ -0,0 +1,39 @@
+from datetime import date
+
+import pytest
+
+from oxeo.api.controllers import geom
+from oxeo.api.models import database, schemas
+from oxeo.api.models.rows import EventRow
+
+
+def test_event_row_matches_schema():
+    fields = dict(
+        id=1, labels=["ndvi"], aoi_id=2, datetime=date(2020, 1, 1), keyed_values={}
+    )
+    row = EventRow(**fields)
+
+    assert dict(row) == row.to_dict() == schemas.Event(**fields).dict()
+    assert list(row.keys()) == list(schemas.Event.__fields__)
+
+
+def test_rows_are_read_only_and_slotted():
+    row = EventRow(id=1)
+
+    with pytest.raises(AttributeError):
+        row.id = 2
+    assert not hasattr(row, "__dict__")
+
+
+def test_postprocess_aoi_does_not_dirty_entities():
+    aoi = database.AOI(
+        id=7,
+        geometry='{"type":"Point","coordinates":[0,0]}',
+        labels=["waterbody"],
+        properties={"name": "lake"},
+    )
+
+    feature = geom.postprocess_aois([aoi], None, "GeoJSON").features[0]
+
+    assert aoi.properties == {"name": "lake"}
+    assert feature.properties == {"name": "lake", "labels": ["waterbody"], "aoi_id": 7}
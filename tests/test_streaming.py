@@ -0,0 +1,103 @@
+import json
+import tracemalloc
+from datetime import date
+from types import SimpleNamespace
+
+from oxeo.api.controllers import geom
+from oxeo.api.responses import StreamedPage, dumps, render
+
+GEOMETRY = json.dumps(
+    {
+        "type": "Polygon",
+        "coordinates": [[[i / 10, 0] for i in range(50)] + [[0, 0]]],
+    }
+)
+
+
+def aoi_rows(n):
+    for i in range(n):
+        yield SimpleNamespace(
+            id=i, labels=["waterbody"], properties={"i": i}, geometry=GEOMETRY
+        )
+
+
+def aoi_page(rows, limit, page=0):
+    return StreamedPage(
+        rows,
+        limit,
+        page,
+        lambda rows, next_page: geom.postprocess_aois(
+            rows, next_page, "GeoJSON", total=None
+        ),
+        "features",
+    )
+
+
+def test_streamed_pages_match_the_materialised_page():
+    for n_rows, limit in [(0, 5), (3, 5), (5, 5), (6, 5), (2500, 2000)]:
+        streamed = b"".join(aoi_page(aoi_rows(n_rows), limit, page=2).chunks())
+        materialised = aoi_page(aoi_rows(n_rows), limit, page=2).materialise()
+
+        assert json.loads(streamed) == json.loads(dumps(materialised))
+
+    result = json.loads(b"".join(aoi_page(aoi_rows(6), 5, page=2).chunks()))
+    assert result["properties"]["next_page"] == 3
+    assert len(result["features"]) == 5
+
+
+def test_streamed_events_page():
+    rows = (
+        SimpleNamespace(
+            id=i,
+            labels=["ndvi"],
+            aoi_id=1,
+            datetime=date(2020, 1, 1),
+            properties={"value": i},
+        )
+        for i in range(3)
+    )
+    page = StreamedPage(
+        rows,
+        10,
+        0,
+        lambda rows, next_page: geom.postprocess_events(rows, next_page),
+        "events",
+    )
+
+    result = json.loads(b"".join(page.chunks()))
+    assert [event["keyed_values"]["value"] for event in result["events"]] == [0, 1, 2]
+    assert result["next_page"] is None
+
+
+def test_render_streams_pages():
+    response = render(aoi_page(aoi_rows(3), 5))
+
+    assert response.media_type == "application/json"
+    assert not hasattr(response, "body")
+
+
+def peak_memory(f):
+    tracemalloc.start()
+    try:
+        f()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_streaming_memory_is_bounded_by_batch_not_page_size():
+    def stream(n_rows):
+        def consume():
+            for _ in aoi_page(aoi_rows(n_rows), n_rows).chunks():
+                pass
+
+        return consume
+
+    def materialise():
+        dumps(aoi_page(aoi_rows(10000), 10000).materialise())
+
+    small, large = peak_memory(stream(2000)), peak_memory(stream(10000))
+
+    # 5x the rows, about the same peak: one batch of rows and bytes at a time
+    assert large < 1.5 * small
+    assert large < peak_memory(materialise) / 4
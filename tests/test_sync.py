@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+
+from sqlalchemy.dialects import postgresql
+
+from oxeo.api.controllers import sync
+from oxeo.api.models import schemas
+
+SINCE = datetime(2026, 1, 1, tzinfo=timezone.utc)
+UNTIL = datetime(2026, 1, 2, tzinfo=timezone.utc)
+
+
+class RecordingSession:
+    def __init__(self):
+        self.criteria = []
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(str(statement))
+        return self
+
+    def scalar(self):
+        return UNTIL
+
+    def query(self, *entities):
+        return self
+
+    def filter(self, criterion):
+        self.criteria.append(str(criterion.compile(dialect=postgresql.dialect())))
+        return self
+
+    def order_by(self, *clauses):
+        return self
+
+    def yield_per(self, n):
+        return iter([])
+
+
+def test_changes_stop_short_of_open_transactions():
+    db = RecordingSession()
+
+    response = sync.get_changes(schemas.ChangesQuery(since=SINCE), db, None)
+
+    assert "min(xact_start)" in db.statements[0]
+    assert response.headers["X-Changes-Until"] == UNTIL.isoformat()
+
+
+def test_changes_window_is_half_open():
+    db = RecordingSession()
+
+    list(
+        sync.iter_changes(db, schemas.ChangesQuery(since=SINCE, tables=["aois"]), UNTIL)
+    )
+
+    assert db.criteria == [
+        "aois.updated_at >= %(updated_at_1)s",
+        "aois.updated_at < %(updated_at_1)s",
+        "tombstones.table_name = %(table_name_1)s",
+        "tombstones.deleted_at >= %(deleted_at_1)s",
+        "tombstones.deleted_at < %(deleted_at_1)s",
+    ]
@@ -0,0 +1,43 @@
+from datetime import date
+
+from shapely import wkt
+
+from oxeo.api.models import database, synthetic
+
+
+def test_rows_are_deterministic_by_seed():
+    def rows(seed):
+        return list(synthetic.aoi_rows([1, 2, 3], seed, (8, 32), 3))
+
+    assert rows(0) == rows(0)
+    assert rows(0) != rows(1)
+
+
+def test_aoi_geometries_are_valid_multipolygons():
+    for _, ewkt, labels, _ in synthetic.aoi_rows(range(50), 0, (4, 64), 3):
+        geom = wkt.loads(ewkt.split(";", 1)[1])
+        assert geom.geom_type == "MultiPolygon" and geom.is_valid
+        assert labels.strip("{}") in database.VALID_AOI_LABELS
+
+
+def test_events_cover_every_day_and_label():
+    rows = list(
+        synthetic.event_rows(
+            [7], 0, date(2020, 1, 1), date(2020, 12, 31), database.VALID_EVENT_LABELS, 1
+        )
+    )
+
+    assert len(rows) == 366 * len(database.VALID_EVENT_LABELS)
+    assert {row[0] for row in rows} == {
+        f"{{{label}}}" for label in database.VALID_EVENT_LABELS
+    }
+
+
+def test_equity_weights_sum_to_100():
+    rows = list(synthetic.link_rows(range(200), list(range(10)), 0, 3))
+
+    weights = {}
+    for _, asset_id, equity in rows:
+        assert equity > 0
+        weights[asset_id] = weights.get(asset_id, 0) + equity
+    assert set(weights.values()) == {100}